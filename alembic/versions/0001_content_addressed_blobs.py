@@ -0,0 +1,44 @@
+"""content addressed blobs
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "blobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("stored_filename", sa.String(), nullable=False),
+        sa.Column("size_bytes", sa.Numeric(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("fcs_version", sa.String(), nullable=True),
+        sa.Column("fcs_metadata", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_blobs_id", "blobs", ["id"])
+    op.create_index("ix_blobs_sha256", "blobs", ["sha256"], unique=True)
+
+    op.add_column("files", sa.Column("blob_id", sa.Integer(), sa.ForeignKey("blobs.id"), nullable=True))
+    op.create_index("ix_files_blob_id", "files", ["blob_id"])
+    # 多筆檔案記錄可以指向同一個 blob
+    op.drop_constraint("files_stored_filename_key", "files", type_="unique")
+
+
+def downgrade():
+    op.create_unique_constraint("files_stored_filename_key", "files", ["stored_filename"])
+    op.drop_index("ix_files_blob_id", table_name="files")
+    op.drop_column("files", "blob_id")
+    op.drop_index("ix_blobs_sha256", table_name="blobs")
+    op.drop_index("ix_blobs_id", table_name="blobs")
+    op.drop_table("blobs")
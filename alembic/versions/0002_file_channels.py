@@ -0,0 +1,46 @@
+"""file channel metadata
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("files", sa.Column("event_count", sa.BigInteger(), nullable=True))
+    op.add_column("files", sa.Column("param_count", sa.Integer(), nullable=True))
+    # 既有資料為 NULL，由 worker 的 backfill_file_metadata 任務補齊
+    op.add_column("files", sa.Column("metadata_parsed_at", sa.DateTime(), nullable=True))
+
+    op.create_table(
+        "file_channels",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("file_id", sa.Integer(), sa.ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("channel_index", sa.Integer(), nullable=False),
+        sa.Column("pnn", sa.String(), nullable=True),
+        sa.Column("pns", sa.String(), nullable=True),
+        sa.Column("pnb", sa.Integer(), nullable=True),
+        sa.Column("pnr", sa.String(), nullable=True),
+        sa.Column("pne", sa.String(), nullable=True),
+    )
+    op.create_index(
+        "ix_file_channels_file_id_channel_index", "file_channels", ["file_id", "channel_index"], unique=True
+    )
+    op.create_index("ix_file_channels_pnn", "file_channels", ["pnn"])
+
+
+def downgrade():
+    op.drop_index("ix_file_channels_pnn", table_name="file_channels")
+    op.drop_index("ix_file_channels_file_id_channel_index", table_name="file_channels")
+    op.drop_table("file_channels")
+    op.drop_column("files", "metadata_parsed_at")
+    op.drop_column("files", "param_count")
+    op.drop_column("files", "event_count")
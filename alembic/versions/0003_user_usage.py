@@ -0,0 +1,38 @@
+"""per-user usage counters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_usage",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("file_count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("total_size_bytes", sa.Numeric(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    # 由既有檔案計算初始值
+    op.execute(
+        """
+        INSERT INTO user_usage (user_id, file_count, total_size_bytes, updated_at)
+        SELECT owner_id, COUNT(*), COALESCE(SUM(size_bytes), 0), now()
+        FROM files
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("user_usage")
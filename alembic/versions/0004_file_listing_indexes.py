@@ -0,0 +1,36 @@
+"""file listing indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY 不能在 transaction 中執行，大表建索引時不鎖寫入
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_files_is_public_uploaded_at_id",
+            "files",
+            ["is_public", "uploaded_at", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_files_owner_id_uploaded_at_id",
+            "files",
+            ["owner_id", "uploaded_at", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_files_owner_id_uploaded_at_id", table_name="files", postgresql_concurrently=True)
+        op.drop_index("ix_files_is_public_uploaded_at_id", table_name="files", postgresql_concurrently=True)
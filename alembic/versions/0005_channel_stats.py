@@ -0,0 +1,38 @@
+"""per-channel summary statistics
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("files", sa.Column("channel_stats_at", sa.DateTime(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_count", sa.BigInteger(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_min", sa.Float(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_max", sa.Float(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_mean", sa.Float(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_std", sa.Float(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_median", sa.Float(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_percentiles", sa.Text(), nullable=True))
+    op.add_column("file_channels", sa.Column("stat_histogram", sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("file_channels", "stat_histogram")
+    op.drop_column("file_channels", "stat_percentiles")
+    op.drop_column("file_channels", "stat_median")
+    op.drop_column("file_channels", "stat_std")
+    op.drop_column("file_channels", "stat_mean")
+    op.drop_column("file_channels", "stat_max")
+    op.drop_column("file_channels", "stat_min")
+    op.drop_column("file_channels", "stat_count")
+    op.drop_column("files", "channel_stats_at")
@@ -0,0 +1,28 @@
+"""seekable zstd compression of stored blobs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("blobs", sa.Column("compression", sa.String(), nullable=True))
+    op.add_column("blobs", sa.Column("stored_size_bytes", sa.BigInteger(), nullable=True))
+    op.add_column("blobs", sa.Column("decompress_mb_per_s", sa.Float(), nullable=True))
+    op.add_column("blobs", sa.Column("compressed_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("blobs", "compressed_at")
+    op.drop_column("blobs", "decompress_mb_per_s")
+    op.drop_column("blobs", "stored_size_bytes")
+    op.drop_column("blobs", "compression")
@@ -0,0 +1,45 @@
+"""file search indexes
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY 不能在 transaction 中執行，大表建索引時不鎖寫入
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_file_channels_pnn_trgm",
+            "file_channels",
+            ["pnn"],
+            postgresql_using="gin",
+            postgresql_ops={"pnn": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_file_channels_pns_trgm",
+            "file_channels",
+            ["pns"],
+            postgresql_using="gin",
+            postgresql_ops={"pns": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index("ix_files_event_count", "files", ["event_count"], postgresql_concurrently=True)
+        op.create_index("ix_files_size_bytes", "files", ["size_bytes"], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_files_size_bytes", table_name="files", postgresql_concurrently=True)
+        op.drop_index("ix_files_event_count", table_name="files", postgresql_concurrently=True)
+        op.drop_index("ix_file_channels_pns_trgm", table_name="file_channels", postgresql_concurrently=True)
+        op.drop_index("ix_file_channels_pnn_trgm", table_name="file_channels", postgresql_concurrently=True)
@@ -0,0 +1,149 @@
+"""上傳的 admission control：在讀取 request body 之前檢查大小、配額與同時上傳數"""
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from app.core.cache import get_async_redis
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.db.crud import get_user_usage
+from app.db.models import User
+from app.deps import get_current_user_optional
+from fastapi import Depends, HTTPException, Request
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# multipart boundary、part header 與一般表單欄位的額外空間
+MULTIPART_OVERHEAD = 256 * 1024
+
+
+class UploadSlots:
+    """同時進行中的上傳數上限（Redis sorted set，逾時的 slot 自動失效），同時檢查全域與每位上傳者的上限"""
+
+    def __init__(self, client=None, ttl: Optional[int] = None):
+        self._client = client
+        self.ttl = ttl or settings.UPLOAD_SLOT_TTL_SECONDS
+
+    @property
+    def client(self):
+        return self._client or get_async_redis()
+
+    def _keys(self, owner: str):
+        return [
+            ("upload:slots:global", settings.UPLOAD_MAX_CONCURRENT),
+            (f"upload:slots:{owner}", settings.UPLOAD_MAX_CONCURRENT_PER_USER),
+        ]
+
+    async def acquire(self, owner: str) -> Optional[str]:
+        """取得 slot 並回傳 token；已達上限時回傳 None"""
+        token = uuid.uuid4().hex
+        now = time.time()
+        acquired = []
+        for key, limit in self._keys(owner):
+            pipe = self.client.pipeline()
+            # 清除 process 當機後遺留的 slot
+            pipe.zremrangebyscore(key, 0, now - self.ttl)
+            pipe.zadd(key, {token: now})
+            pipe.zrank(key, token)
+            pipe.expire(key, self.ttl)
+            _, _, rank, _ = await pipe.execute()
+            acquired.append(key)
+            if rank is None or rank >= limit:
+                for k in acquired:
+                    await self.client.zrem(k, token)
+                return None
+        return token
+
+    async def release(self, owner: str, token: str) -> None:
+        for key, _ in self._keys(owner):
+            await self.client.zrem(key, token)
+
+
+upload_slots = UploadSlots()
+
+
+async def remaining_quota(db: AsyncSession, user: Optional[User]) -> Optional[int]:
+    """使用者剩餘的儲存配額（bytes）；匿名上傳或未設定配額時回傳 None"""
+    if user is None or not settings.USER_QUOTA_MB:
+        return None
+    usage = await get_user_usage(db, user.id)
+    return max(settings.USER_QUOTA_MB * 1024 * 1024 - int(usage["total_size_bytes"]), 0)
+
+
+def quota_exceeded() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Storage quota exceeded. Quota is {settings.USER_QUOTA_MB}MB.")
+
+
+def too_large(limit_mb: Optional[int] = None) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. Maximum size is {limit_mb or settings.MAX_FILE_MB}MB.")
+
+
+@dataclass
+class UploadPermit:
+    max_bytes: int
+    # HEADER offset 合理範圍的上限（Content-Length 或檔案大小上限）
+    size_hint: int
+    quota_limited: bool = False
+
+
+def make_upload_admission(limit_mb: Callable[[], int]):
+    """建立上傳的 admission dependency；limit_mb 回傳單一 request 可接受的大小上限（MB）"""
+
+    async def upload_admission(
+        request: Request,
+        current_user: Optional[User] = Depends(get_current_user_optional),
+    ):
+        """讀取 body 前依 Content-Length、配額與同時上傳數決定是否接受；超過上限回傳 413 / 429"""
+        max_request_bytes = limit_mb() * 1024 * 1024
+        content_length = request.headers.get("content-length")
+        try:
+            content_length = int(content_length) if content_length is not None else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        # multipart 的額外內容只會讓 Content-Length 大於檔案本身，扣掉上限後仍超過才拒絕
+        file_bytes = max(content_length - MULTIPART_OVERHEAD, 0) if content_length is not None else None
+        if file_bytes is not None and file_bytes > max_request_bytes:
+            raise too_large(limit_mb())
+
+        # 使用獨立的短 session：request 的 session 保留到 body 讀完為止，查詢開啟的 transaction 會一直佔住連線
+        async with AsyncSessionLocal() as db:
+            quota = await remaining_quota(db, current_user)
+        if quota is not None and (quota == 0 or (file_bytes is not None and file_bytes > quota)):
+            raise quota_exceeded()
+
+        owner = f"user:{current_user.id}" if current_user else f"anon:{request.client.host if request.client else 'unknown'}"
+        try:
+            token = await upload_slots.acquire(owner)
+        except RedisError as e:
+            # Redis 無法連線時不阻擋上傳
+            logger.warning(f"Upload slots unavailable, admitting without concurrency limit: {e}")
+            token = ""
+        if token is None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many concurrent uploads, please retry later.",
+                headers={"Retry-After": "5"},
+            )
+
+        try:
+            yield UploadPermit(
+                max_bytes=min(max_request_bytes, quota) if quota is not None else max_request_bytes,
+                size_hint=min(content_length, max_request_bytes) if content_length is not None else max_request_bytes,
+                quota_limited=quota is not None and quota < max_request_bytes,
+            )
+        finally:
+            if token:
+                try:
+                    await upload_slots.release(owner, token)
+                except RedisError as e:
+                    logger.warning(f"Failed to release upload slot for {owner}: {e}")
+
+    return upload_admission
+
+
+upload_admission = make_upload_admission(lambda: settings.MAX_FILE_MB)
+batch_upload_admission = make_upload_admission(lambda: settings.BATCH_UPLOAD_MAX_MB)
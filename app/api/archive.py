@@ -0,0 +1,302 @@
+"""串流解壓 ZIP / TAR：從 request body 依序讀出每個檔案，不先把壓縮檔寫入磁碟"""
+import queue
+import struct
+import tarfile
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+READ_SIZE = 1024 * 1024
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_DATA_DESCRIPTOR = b"PK\x07\x08"
+# 遇到 central directory（或其後的結尾紀錄）表示所有 entry 都已讀完
+ZIP_END_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07")
+ZIP_FLAG_ENCRYPTED = 0x1
+ZIP_FLAG_DATA_DESCRIPTOR = 0x8
+ZIP_FLAG_UTF8 = 0x800
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_MARKER = 0xFFFFFFFF
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class ArchiveTooLarge(ArchiveError):
+    """解壓縮後的內容（包含略過時實際解壓的部分）超過上限"""
+
+
+def archive_kind(filename: str) -> Optional[str]:
+    """依副檔名判斷壓縮檔格式；tar 的壓縮（gz/bz2/xz）由 tarfile 自動辨識"""
+    name = filename.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")):
+        return "tar"
+    return None
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    # 解壓縮後的大小；ZIP 使用 data descriptor 時事先無法得知
+    size: Optional[int]
+    chunks: Iterator[bytes]
+
+
+class BodyPipe:
+    """event loop 寫入、worker thread 讀取的 bytes pipe，queue 有上限以提供 backpressure
+
+    讀取端結束（或出錯）後呼叫 close_reader，之後寫入的資料直接丟棄，寫入端不會卡住
+    """
+
+    def __init__(self, max_chunks: int = 16):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self._reader_closed = False
+
+    def _put(self, item) -> None:
+        while not self._reader_closed:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    async def feed(self, data: bytes) -> None:
+        if self._reader_closed:
+            return
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            await run_in_threadpool(self._put, data)
+
+    async def close(self) -> None:
+        """寫入端結束（EOF）"""
+        await self.feed(None)
+
+    def abort(self) -> None:
+        """寫入端中止：清空 queue，讓讀取端在下一次 read 時收到 ArchiveError"""
+        self._reader_closed = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put_nowait(None)
+
+    def close_reader(self) -> None:
+        self._reader_closed = True
+
+    def read(self, n: int = -1) -> bytes:
+        while not self._eof and (n < 0 or len(self._buffer) < n):
+            item = self._queue.get()
+            if item is None:
+                if self._reader_closed:
+                    raise ArchiveError("Upload aborted")
+                self._eof = True
+            else:
+                self._buffer += item
+        size = len(self._buffer) if n < 0 else min(n, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _PushbackReader:
+    """可以把多讀的資料放回去的 reader（deflate 結束位置要解壓後才知道）"""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._pushed = b""
+
+    def unread(self, data: bytes) -> None:
+        self._pushed = data + self._pushed
+
+    def read(self, n: int) -> bytes:
+        if self._pushed:
+            data, self._pushed = self._pushed[:n], self._pushed[n:]
+            return data
+        return self._fileobj.read(n)
+
+    def read_exact(self, n: int) -> bytes:
+        data = b""
+        while len(data) < n:
+            chunk = self.read(n - len(data))
+            if not chunk:
+                raise ArchiveError("Truncated ZIP archive")
+            data += chunk
+        return data
+
+
+def _zip64_sizes(extra: bytes, usize: int, csize: int):
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, offset)
+        if header_id == ZIP64_EXTRA_ID:
+            values = extra[offset + 4 : offset + 4 + length]
+            fields = [struct.unpack_from("<Q", values, i)[0] for i in range(0, len(values) - 7, 8)]
+            # 只有 header 中為 0xFFFFFFFF 的欄位會出現在 extra，依序為原始大小、壓縮後大小
+            if usize == ZIP64_MARKER and fields:
+                usize = fields.pop(0)
+            if csize == ZIP64_MARKER and fields:
+                csize = fields.pop(0)
+            return usize, csize, True
+        offset += 4 + length
+    return usize, csize, False
+
+
+def _skip(reader: _PushbackReader, size: int) -> None:
+    while size > 0:
+        data = reader.read(min(READ_SIZE, size))
+        if not data:
+            raise ArchiveError("Truncated ZIP archive")
+        size -= len(data)
+
+
+def _stored_chunks(reader: _PushbackReader, state: dict) -> Iterator[bytes]:
+    while state["remaining"] > 0:
+        data = reader.read(min(READ_SIZE, state["remaining"]))
+        if not data:
+            raise ArchiveError("Truncated ZIP archive")
+        state["remaining"] -= len(data)
+        state["crc"] = zlib.crc32(data, state["crc"])
+        yield data
+    state["done"] = True
+
+
+class _Budget:
+    """整個壓縮檔解壓縮後的總大小上限，高壓縮比的內容不論是否被讀取都要計入"""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.used = 0
+
+    def add(self, size: int) -> None:
+        self.used += size
+        if self.limit is not None and self.used > self.limit:
+            raise ArchiveTooLarge("Archive content is too large")
+
+
+def _deflate_chunks(reader: _PushbackReader, state: dict, budget: _Budget) -> Iterator[bytes]:
+    """解壓 raw deflate；壓縮後大小未知（data descriptor）時以 deflate stream 的結尾判斷 entry 結束"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not decompressor.eof:
+        remaining = state["remaining"]
+        n = READ_SIZE if remaining is None else min(READ_SIZE, remaining)
+        data = reader.read(n) if n else b""
+        if not data:
+            raise ArchiveError("Truncated ZIP archive")
+        if remaining is not None:
+            state["remaining"] -= len(data)
+        # 限制每次輸出的大小，壓縮比極高的內容也不會一次展開到記憶體
+        while data and not decompressor.eof:
+            try:
+                out = decompressor.decompress(data, READ_SIZE)
+            except zlib.error as e:
+                raise ArchiveError(f"Corrupt ZIP entry: {e}")
+            data = decompressor.unconsumed_tail
+            if out:
+                budget.add(len(out))
+                state["crc"] = zlib.crc32(out, state["crc"])
+                yield out
+    # deflate stream 之後的資料（data descriptor 或下一個 entry）放回 reader
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+    state["done"] = True
+
+
+def _read_data_descriptor(reader: _PushbackReader, zip64: bool) -> int:
+    """讀取 entry 之後的 data descriptor（signature 可省略），回傳 CRC"""
+    data = reader.read_exact(4)
+    if data == ZIP_DATA_DESCRIPTOR:
+        data = reader.read_exact(4)
+    reader.read_exact(16 if zip64 else 8)
+    return struct.unpack("<I", data)[0]
+
+
+def iter_zip(fileobj, max_total_bytes: Optional[int] = None) -> Iterator[ArchiveEntry]:
+    """依 local file header 依序讀取 ZIP entry（不需要 central directory，可以串流）
+
+    支援 stored / deflate、data descriptor 與 ZIP64；每個 entry 的 chunks 須在取下一個 entry 前讀完，
+    未讀完的部分會自動略過：壓縮後大小已知時直接跳過剩餘的壓縮資料，否則解壓到 deflate stream 結尾，
+    解壓的量計入 max_total_bytes
+    """
+    reader = _PushbackReader(fileobj)
+    budget = _Budget(max_total_bytes)
+    while True:
+        signature = reader.read_exact(4)
+        if signature in ZIP_END_SIGNATURES:
+            return
+        if signature != ZIP_LOCAL_HEADER:
+            raise ArchiveError("Not a ZIP archive")
+        _, flags, method, _, _, crc, csize, usize, name_len, extra_len = struct.unpack(
+            "<HHHHHIIIHH", reader.read_exact(26)
+        )
+        raw_name = reader.read_exact(name_len)
+        name = raw_name.decode("utf-8" if flags & ZIP_FLAG_UTF8 else "cp437", errors="replace")
+        usize, csize, zip64 = _zip64_sizes(reader.read_exact(extra_len), usize, csize)
+        if flags & ZIP_FLAG_ENCRYPTED:
+            raise ArchiveError(f"Encrypted ZIP entry {name!r} is not supported")
+        has_descriptor = bool(flags & ZIP_FLAG_DATA_DESCRIPTOR)
+
+        if method == ZIP_STORED:
+            if has_descriptor and csize == 0 and usize == 0:
+                # stored 且大小寫在 entry 之後時無法得知資料結尾
+                raise ArchiveError(f"ZIP entry {name!r} has no size, cannot be streamed")
+            state = {"crc": 0, "remaining": csize, "done": False}
+            chunks = _stored_chunks(reader, state)
+        elif method == ZIP_DEFLATED:
+            state = {"crc": 0, "remaining": None if has_descriptor else csize, "done": False}
+            chunks = _deflate_chunks(reader, state, budget)
+        else:
+            raise ArchiveError(f"Unsupported ZIP compression method {method} in {name!r}")
+
+        yield ArchiveEntry(name, None if has_descriptor else usize, chunks)
+        if not state["done"]:
+            if state["remaining"] is not None:
+                # 未讀完的 entry 直接略過剩餘的壓縮資料，不需要解壓；沒有完整讀取，不驗證 CRC
+                chunks.close()
+                _skip(reader, state["remaining"])
+                if has_descriptor:
+                    _read_data_descriptor(reader, zip64)
+                continue
+            # 壓縮後大小未知，只能解壓到 deflate stream 結尾（解壓的量計入上限）
+            for _ in chunks:
+                pass
+
+        if has_descriptor:
+            crc = _read_data_descriptor(reader, zip64)
+        if state["crc"] != crc:
+            raise ArchiveError(f"CRC mismatch in ZIP entry {name!r}")
+
+
+def iter_tar(fileobj, max_total_bytes: Optional[int] = None) -> Iterator[ArchiveEntry]:
+    """以 tarfile 的串流模式（r|*）依序讀取一般檔案，支援 gzip / bzip2 / xz
+
+    略過的 member 仍需解壓讀過，因此每個 member 的大小都計入 max_total_bytes
+    """
+    budget = _Budget(max_total_bytes)
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                budget.add(member.size)
+                if not member.isfile():
+                    continue
+                fh = tar.extractfile(member)
+                yield ArchiveEntry(member.name, member.size, iter(lambda: fh.read(READ_SIZE), b""))
+    except (tarfile.TarError, EOFError, zlib.error) as e:
+        raise ArchiveError(f"Invalid TAR archive: {e}")
+
+
+def iter_archive(kind: str, fileobj, max_total_bytes: Optional[int] = None) -> Iterator[ArchiveEntry]:
+    """max_total_bytes 為解壓縮後的總大小上限，超過時拋出 ArchiveTooLarge"""
+    if kind == "zip":
+        return iter_zip(fileobj, max_total_bytes)
+    return iter_tar(fileobj, max_total_bytes)
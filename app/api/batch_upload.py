@@ -0,0 +1,148 @@
+"""批次上傳：同一個 request 中的多個 FCS 檔案（multipart 多個檔案欄位或 ZIP/TAR 壓縮檔）"""
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.api.archive import ArchiveTooLarge, BodyPipe, iter_archive
+from app.api.fcs import FCSMetadata, FCSParseError
+from app.api.upload import UploadSink, UploadTooLarge
+from app.core.metrics import PhaseTimer
+from starlette.concurrency import run_in_threadpool
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+@dataclass
+class BatchItem:
+    filename: str
+    sink: Optional[UploadSink] = None
+    metadata: Optional[FCSMetadata] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.metadata is not None
+
+
+def is_archive_junk(path: str) -> bool:
+    """壓縮工具附帶的中繼檔案（macOS resource fork 等），不列入結果"""
+    name = os.path.basename(path)
+    return "__MACOSX/" in path or name.startswith("._") or name in (".DS_Store", "Thumbs.db")
+
+
+class BatchCollector:
+    """逐一串流接收檔案，每個檔案結束後在背景完成 FCS 解析（最多 concurrency 個同時進行）
+
+    單一檔案的錯誤（格式、大小、FCS 解析）只記錄在該檔案的結果；
+    總大小超過 max_total_bytes 時拋出 BatchTooLarge，整個 request 失敗
+    """
+
+    def __init__(
+        self,
+        dest_dir: str,
+        allowed_extensions: List[str],
+        max_file_bytes: int,
+        max_total_bytes: int,
+        max_files: int,
+        concurrency: int,
+        timer: Optional[PhaseTimer] = None,
+    ):
+        self.dest_dir = dest_dir
+        self.allowed_extensions = allowed_extensions
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.timer = timer or PhaseTimer()
+        self.items: List[BatchItem] = []
+        self.total_bytes = 0
+        self.accepted = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, filename: str, size: Optional[int] = None, size_hint: Optional[int] = None) -> BatchItem:
+        """開始一個檔案；size 為已知的檔案大小（壓縮檔 entry），size_hint 為大小的上限（例如 Content-Length）"""
+        item = BatchItem(filename=os.path.basename(filename))
+        self.items.append(item)
+        if os.path.splitext(item.filename)[1].lower() not in self.allowed_extensions:
+            item.error = "Invalid file format. Only FCS files are allowed."
+        elif self.accepted >= self.max_files:
+            item.error = f"Too many files. Maximum is {self.max_files} per batch."
+        elif size is not None and size > self.max_file_bytes:
+            item.error = self._too_large()
+        else:
+            self.accepted += 1
+            item.sink = UploadSink(self.dest_dir, self.max_file_bytes, self.timer, size_hint=size or size_hint)
+        return item
+
+    def _too_large(self) -> str:
+        return f"File too large. Maximum size is {self.max_file_bytes // (1024 * 1024)}MB."
+
+    async def _fail(self, item: BatchItem, error: str) -> None:
+        item.error = error
+        sink, item.sink = item.sink, None
+        await sink.abort()
+
+    async def write(self, item: BatchItem, data: bytes) -> None:
+        if item.sink is None:
+            return
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_total_bytes:
+            raise BatchTooLarge()
+        try:
+            await item.sink.write(data)
+        except UploadTooLarge:
+            await self._fail(item, self._too_large())
+        except FCSParseError as e:
+            await self._fail(item, f"Invalid FCS file: {e}")
+
+    async def _finish(self, item: BatchItem) -> None:
+        async with self._semaphore:
+            try:
+                item.metadata = await item.sink.finish()
+            except FCSParseError as e:
+                await self._fail(item, f"Invalid FCS file: {e}")
+
+    def end(self, item: BatchItem) -> None:
+        """檔案資料結束，在背景寫完暫存檔並解析 metadata"""
+        if item.sink is not None:
+            self._tasks.append(asyncio.create_task(self._finish(item)))
+
+    async def add_archive(self, kind: str, pipe: BodyPipe) -> None:
+        """在 worker thread 中解壓 pipe 的內容，每個 entry 依序寫入各自的 sink"""
+        # 略過的 entry 也可能需要解壓（ZIP data descriptor、tar.gz），解壓的量同樣受總大小上限限制
+        entries = iter_archive(kind, pipe, self.max_total_bytes)
+        try:
+            while True:
+                entry = await run_in_threadpool(next, entries, None)
+                if entry is None:
+                    break
+                if entry.name.endswith("/") or is_archive_junk(entry.name):
+                    continue
+                item = self.start(entry.name, size=entry.size)
+                # 不接受的 entry 不讀取內容，由 iter_archive 直接略過
+                while item.sink is not None:
+                    data = await run_in_threadpool(next, entry.chunks, None)
+                    if data is None:
+                        break
+                    await self.write(item, data)
+                self.end(item)
+        except ArchiveTooLarge:
+            raise BatchTooLarge()
+        finally:
+            pipe.close_reader()
+
+    async def wait(self) -> List[BatchItem]:
+        await asyncio.gather(*self._tasks)
+        return self.items
+
+    async def abort(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for item in self.items:
+            if item.sink is not None:
+                await item.sink.abort()
+
@@ -0,0 +1,197 @@
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from secrets import token_hex
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+_RANGE_SPEC = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+# 同一個 Range header 最多接受的區段數，避免大量小區段拖垮伺服器
+MAX_RANGES = 32
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """解析 Range header，回傳 [start, end) 區段；格式不合法時回傳 None（依 RFC 9110 忽略 Range）"""
+    units, _, spec = value.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        m = _RANGE_SPEC.match(part)
+        if not m or (not m.group(1) and not m.group(2)):
+            return None
+        first, last = m.group(1), m.group(2)
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+            if last and int(last) < start:
+                return None
+        else:
+            # suffix range：最後 N bytes
+            start = max(size - int(last), 0)
+            end = size
+        if start < size and start < end:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # 合併重疊或相鄰的區段
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_list(value: str) -> List[str]:
+    return [tag.strip().removeprefix("W/") for tag in value.split(",") if tag.strip()]
+
+
+def is_not_modified(request_headers, etag: str, last_modified: float) -> bool:
+    """If-None-Match 優先於 If-Modified-Since（RFC 9110 13.2.2）"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etag_list(if_none_match)
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= int(since)
+    return False
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class RangeResponse(Response):
+    """支援 HEAD、單一/多段 Range、If-Range 的檔案回應
+
+    opener 回傳具有 read_at(offset, size) 與 close() 的 reader；reader 若提供底層檔案（file，本機檔案）
+    且 ASGI server 支援 zerocopysend extension，則以 sendfile 傳送（壓縮檔與物件儲存的 Range GET 不適用）
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(
+        self,
+        opener: Callable,
+        size: int,
+        headers: dict,
+        media_type: str = "application/octet-stream",
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        self.opener = opener
+        self.size = size
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.etag = etag
+        self.last_modified = last_modified
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+
+    def _use_range(self, if_range: Optional[str]) -> bool:
+        if if_range is None:
+            return True
+        return if_range == self.etag or (self.last_modified is not None and if_range == self.last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        header_only = scope["method"].upper() == "HEAD"
+        request_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+
+        ranges = None
+        http_range = request_headers.get("range")
+        if http_range and self._use_range(request_headers.get("if-range")):
+            try:
+                ranges = parse_range_header(http_range, self.size)
+            except RangeNotSatisfiable:
+                response = Response(status_code=416, headers={"content-range": f"bytes */{self.size}"})
+                return await response(scope, receive, send)
+
+        if not ranges:
+            self.headers["content-length"] = str(self.size)
+            segments = [(None, 0, self.size)]
+        elif len(ranges) == 1:
+            self.status_code = 206
+            start, end = ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{self.size}"
+            self.headers["content-length"] = str(end - start)
+            segments = [(None, start, end)]
+        else:
+            self.status_code = 206
+            boundary = token_hex(13)
+            segments = []
+            for start, end in ranges:
+                part_header = (
+                    f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end - 1}/{self.size}\r\n\r\n"
+                ).encode("latin-1")
+                segments.append((part_header, start, end))
+            trailer = f"--{boundary}--\r\n".encode("latin-1")
+            length = sum(len(h) + (e - s) + 2 for h, s, e in segments) + len(trailer)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            self.headers["content-length"] = str(length)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        reader = await run_in_threadpool(self.opener)
+        try:
+            for part_header, start, end in segments:
+                if part_header:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                if zerocopy and getattr(reader, "file", None) is not None:
+                    await send({
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": reader.file,
+                        "offset": start,
+                        "count": end - start,
+                        "more_body": True,
+                    })
+                else:
+                    offset = start
+                    while offset < end:
+                        chunk = await run_in_threadpool(reader.read_at, offset, min(self.chunk_size, end - offset))
+                        if not chunk:
+                            raise RuntimeError("Stored file is shorter than expected")
+                        offset += len(chunk)
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if part_header:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            if len(segments) > 1:
+                await send({"type": "http.response.body", "body": trailer, "more_body": False})
+            else:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await run_in_threadpool(reader.close)
@@ -0,0 +1,268 @@
+"""FCS 檔案 HEADER / TEXT 解析（不讀取 DATA 區段）"""
+from dataclasses import asdict, dataclass, field
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from app.core.storage import open_stored
+
+HEADER_SIZE = 58
+SUPPORTED_VERSIONS = ("FCS2.0", "FCS3.0", "FCS3.1")
+# TEXT 區段通常只有數十 KB，超過此大小視為損毀檔案，避免異常檔案吃光記憶體
+MAX_TEXT_BYTES = 16 * 1024 * 1024
+# 串流上傳時主要 TEXT 區段的起點上限（一般緊接在 HEADER 之後），避免以巨大 offset 讓 sniffer 持續讀取
+MAX_TEXT_OFFSET = 4 * 1024 * 1024
+
+
+class FCSParseError(ValueError):
+    pass
+
+
+@dataclass
+class FCSChannel:
+    index: int
+    pnn: Optional[str] = None
+    pns: Optional[str] = None
+    pnb: Optional[int] = None
+    pnr: Optional[str] = None
+    pne: Optional[str] = None
+
+
+@dataclass
+class FCSMetadata:
+    version: str
+    text_start: int
+    text_end: int
+    data_start: int
+    data_end: int
+    analysis_start: int = 0
+    analysis_end: int = 0
+    tot: Optional[int] = None
+    par: int = 0
+    datatype: Optional[str] = None
+    byteord: Optional[str] = None
+    mode: Optional[str] = None
+    channels: List[FCSChannel] = field(default_factory=list)
+    keywords: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def pnn(self) -> List[Optional[str]]:
+        return [c.pnn for c in self.channels]
+
+    @property
+    def pns(self) -> List[Optional[str]]:
+        return [c.pns for c in self.channels]
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FCSMetadata":
+        """由 to_dict() 的結果（例如資料庫中的 blob.fcs_metadata）還原"""
+        d = dict(d)
+        d["channels"] = [FCSChannel(**c) for c in d.get("channels", [])]
+        return cls(**d)
+
+    def to_dict(self, include_keywords: bool = False) -> dict:
+        d = asdict(self)
+        if not include_keywords:
+            d.pop("keywords")
+        return d
+
+
+def _offset(raw: bytes) -> int:
+    s = raw.decode("ascii", errors="replace").strip()
+    if not s:
+        return 0
+    try:
+        return int(s)
+    except ValueError:
+        raise FCSParseError(f"Invalid HEADER offset: {s!r}")
+
+
+def parse_header(buf: bytes) -> dict:
+    """解析 58 bytes 的 HEADER 區段，回傳版本與各區段 byte offset"""
+    if len(buf) < HEADER_SIZE:
+        raise FCSParseError("File too short for an FCS HEADER")
+    version = buf[0:6].decode("ascii", errors="replace")
+    if version not in SUPPORTED_VERSIONS:
+        raise FCSParseError(f"Unsupported FCS version: {version!r}")
+    header = {
+        "version": version,
+        "text_start": _offset(buf[10:18]),
+        "text_end": _offset(buf[18:26]),
+        "data_start": _offset(buf[26:34]),
+        "data_end": _offset(buf[34:42]),
+        "analysis_start": _offset(buf[42:50]),
+        "analysis_end": _offset(buf[50:58]),
+    }
+    if header["text_start"] < HEADER_SIZE or header["text_end"] < header["text_start"]:
+        raise FCSParseError("Invalid TEXT segment offsets")
+    if header["text_end"] - header["text_start"] + 1 > MAX_TEXT_BYTES:
+        raise FCSParseError("TEXT segment too large")
+    return header
+
+
+def check_header_bounds(header: dict, size: int) -> None:
+    """HEADER 中的 offset 不能超出檔案大小（size 為已知的大小上限，例如 Content-Length）"""
+    for name in ("text_end", "data_end", "analysis_end"):
+        if header[name] >= size:
+            raise FCSParseError(f"HEADER {name} offset {header[name]} is beyond the file size")
+
+
+def parse_text_segment(raw: bytes) -> Dict[str, str]:
+    """解析 TEXT 區段，keyword 一律轉為大寫；連續兩個分隔字元代表字面上的分隔字元"""
+    if not raw:
+        return {}
+    text = raw.decode("utf-8", errors="replace")
+    delim = text[0]
+    tokens: List[str] = []
+    buf: List[str] = []
+    i, n = 1, len(text)
+    while i < n:
+        c = text[i]
+        if c == delim:
+            if i + 1 < n and text[i + 1] == delim:
+                buf.append(delim)
+                i += 2
+                continue
+            tokens.append("".join(buf))
+            buf = []
+        else:
+            buf.append(c)
+        i += 1
+    if buf:
+        tokens.append("".join(buf))
+
+    keywords: Dict[str, str] = {}
+    for k, v in zip(tokens[0::2], tokens[1::2]):
+        keywords[k.strip().upper()] = v.strip()
+    return keywords
+
+
+def _int_keyword(keywords: Dict[str, str], key: str) -> Optional[int]:
+    value = keywords.get(key)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def build_metadata(header: dict, keywords: Dict[str, str]) -> FCSMetadata:
+    """合併 HEADER 與 TEXT keyword；3.x 的 DATA offset 可能只寫在 TEXT 中"""
+    data_start, data_end = header["data_start"], header["data_end"]
+    if header["version"] != "FCS2.0" and (data_start == 0 and data_end == 0):
+        data_start = _int_keyword(keywords, "$BEGINDATA") or 0
+        data_end = _int_keyword(keywords, "$ENDDATA") or 0
+    analysis_start, analysis_end = header["analysis_start"], header["analysis_end"]
+    if header["version"] != "FCS2.0" and (analysis_start == 0 and analysis_end == 0):
+        analysis_start = _int_keyword(keywords, "$BEGINANALYSIS") or 0
+        analysis_end = _int_keyword(keywords, "$ENDANALYSIS") or 0
+
+    par = _int_keyword(keywords, "$PAR") or 0
+    channels = [
+        FCSChannel(
+            index=n,
+            pnn=keywords.get(f"$P{n}N"),
+            pns=keywords.get(f"$P{n}S"),
+            pnb=_int_keyword(keywords, f"$P{n}B"),
+            pnr=keywords.get(f"$P{n}R"),
+            pne=keywords.get(f"$P{n}E"),
+        )
+        for n in range(1, par + 1)
+    ]
+
+    return FCSMetadata(
+        version=header["version"],
+        text_start=header["text_start"],
+        text_end=header["text_end"],
+        data_start=data_start,
+        data_end=data_end,
+        analysis_start=analysis_start,
+        analysis_end=analysis_end,
+        tot=_int_keyword(keywords, "$TOT"),
+        par=par,
+        datatype=keywords.get("$DATATYPE"),
+        byteord=keywords.get("$BYTEORD"),
+        mode=keywords.get("$MODE"),
+        channels=channels,
+        keywords=keywords,
+    )
+
+
+def _read_at(fh: BinaryIO, start: int, end: int) -> bytes:
+    fh.seek(start)
+    raw = fh.read(end - start + 1)
+    if len(raw) != end - start + 1:
+        raise FCSParseError("Unexpected end of file while reading TEXT segment")
+    return raw
+
+
+def read_fcs_metadata(source: Union[str, BinaryIO]) -> FCSMetadata:
+    """只讀取 HEADER 與 TEXT 區段，成本與檔案大小無關"""
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        with open(source, "rb") as fh:
+            return read_fcs_metadata(fh)
+
+    fh = source
+    fh.seek(0)
+    header = parse_header(fh.read(HEADER_SIZE))
+    keywords = parse_text_segment(_read_at(fh, header["text_start"], header["text_end"]))
+
+    # 3.x 的補充 TEXT 區段（$BEGINSTEXT/$ENDSTEXT），主 TEXT 的 keyword 優先
+    stext_start = _int_keyword(keywords, "$BEGINSTEXT") or 0
+    stext_end = _int_keyword(keywords, "$ENDSTEXT") or 0
+    if stext_start and stext_end > stext_start and stext_end - stext_start + 1 <= MAX_TEXT_BYTES:
+        supplemental = parse_text_segment(_read_at(fh, stext_start, stext_end))
+        keywords = {**supplemental, **keywords}
+
+    return build_metadata(header, keywords)
+
+
+def read_stored_metadata(key: str) -> FCSMetadata:
+    """讀取儲存的檔案的 HEADER/TEXT；壓縮檔只解壓前面的 frame"""
+    with open_stored(key) as fh:
+        return read_fcs_metadata(fh)
+
+
+class FCSHeaderSniffer:
+    """串流上傳時逐塊餵入資料，收到 HEADER 與 TEXT 後立即完成解析"""
+
+    def __init__(self):
+        self._buf = bytearray()
+        # self._buf[0] 在檔案中的 offset；TEXT 之前的位元組不保留
+        self._buf_start = 0
+        self.header: Optional[dict] = None
+        self.metadata: Optional[FCSMetadata] = None
+
+    @property
+    def done(self) -> bool:
+        return self.metadata is not None
+
+    @property
+    def needs_supplemental_text(self) -> bool:
+        """補充 TEXT 區段位於檔案後段，需在檔案寫入完成後再讀取"""
+        if self.metadata is None:
+            return False
+        return bool(_int_keyword(self.metadata.keywords, "$BEGINSTEXT"))
+
+    def feed(self, chunk: bytes) -> None:
+        if self.metadata is not None:
+            return
+        self._buf += chunk
+        if self.header is None:
+            if len(self._buf) < HEADER_SIZE:
+                return
+            self.header = parse_header(bytes(self._buf[:HEADER_SIZE]))
+            if self.header["text_start"] > MAX_TEXT_OFFSET:
+                raise FCSParseError("TEXT segment starts too far into the file")
+
+        # 只保留 TEXT 區段，記憶體用量不超過 MAX_TEXT_BYTES 加上一個 chunk
+        text_start = self.header["text_start"]
+        if self._buf_start < text_start:
+            drop = min(text_start - self._buf_start, len(self._buf))
+            del self._buf[:drop]
+            self._buf_start += drop
+
+        text_end = self.header["text_end"] + 1
+        if self._buf_start + len(self._buf) >= text_end:
+            raw = bytes(self._buf[:text_end - text_start])
+            self.metadata = build_metadata(self.header, parse_text_segment(raw))
+            self._buf = bytearray()
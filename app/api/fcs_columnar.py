@@ -0,0 +1,162 @@
+"""FCS event 的 columnar sidecar（Parquet）：轉檔、讀取與 LRU 容量控制"""
+import os
+import tempfile
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.api.fcs_events import CHUNK_ROWS, FCSEventData
+from app.core.config import settings
+from app.core.storage import SIDECAR_DIR, get_backend, place_file, remove_stored, sidecar_key, stored_path
+
+# Parquet 壓縮方式；zstd 在 cytometry 整數資料上壓縮率與解壓速度都不錯
+COMPRESSION = "zstd"
+
+
+def file_sidecar_key(f) -> str:
+    """FileInfo 對應的 sidecar 位置（需已載入 blob）"""
+    return sidecar_key(f.blob.sha256 if f.blob is not None else None, f.stored_filename)
+
+
+def build_sidecar(data: FCSEventData, key: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """把 DATA 區段轉為 Parquet（欄位名稱為 PnN），每 chunk_rows 筆一個 row group，回傳檔案大小
+
+    先寫入 UPLOAD_DIR 的暫存檔再放到儲存後端，讀取端不會看到寫到一半的檔案
+    """
+    names = data.channel_names
+    dtypes = [data.dtype.fields[name][0].newbyteorder("=") for name in names]
+    schema = pa.schema([pa.field(name, pa.from_numpy_dtype(dtype)) for name, dtype in zip(names, dtypes)])
+    fd, temp_path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, prefix=".sidecar-", suffix=".part")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(temp_path, schema, compression=COMPRESSION) as writer:
+            for i in range(0, len(data), chunk_rows):
+                chunk = data.events[i:i + chunk_rows]
+                arrays = [pa.array(chunk[name].astype(dtype)) for name, dtype in zip(names, dtypes)]
+                writer.write_batch(pa.record_batch(arrays, schema=schema), row_group_size=chunk_rows)
+        size = os.path.getsize(temp_path)
+        place_file(temp_path, key)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size
+
+
+class ColumnarSelection:
+    """Parquet sidecar 上的選取結果；只讀取選到的 column 與涵蓋 row 範圍的 row group"""
+
+    def __init__(self, parquet: pq.ParquetFile, names: List[str], rows: range):
+        self.parquet = parquet
+        self.names = names
+        self.rows = rows
+        schema = parquet.schema_arrow
+        # 由空陣列取得對應的 NumPy dtype（DataType.to_pandas_dtype 需要 pandas）
+        self.dtypes = [pa.array([], type=schema.field(name).type).to_numpy().dtype for name in names]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def iter_columns(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[np.ndarray]]:
+        # row group 即為輸出的 chunk（轉檔時以 CHUNK_ROWS 切分）
+        rows = self.rows
+        offset = 0
+        for group in range(self.parquet.num_row_groups):
+            group_start = offset
+            offset += self.parquet.metadata.row_group(group).num_rows
+            if group_start >= rows.stop:
+                break
+            lo, hi = max(rows.start, group_start), min(rows.stop, offset)
+            # 對齊到 start + k * step
+            first = rows.start + -(-(lo - rows.start) // rows.step) * rows.step
+            if first >= hi:
+                continue
+            table = self.parquet.read_row_group(group, columns=self.names)
+            yield [
+                table.column(name).to_numpy()[first - group_start:hi - group_start:rows.step]
+                for name in self.names
+            ]
+
+
+class ColumnarEventData:
+    """以 memory map 開啟 Parquet sidecar"""
+
+    def __init__(self, path: str):
+        self.parquet = pq.ParquetFile(path, memory_map=True)
+
+    @property
+    def channel_names(self) -> List[str]:
+        return self.parquet.schema_arrow.names
+
+    def __len__(self) -> int:
+        return self.parquet.metadata.num_rows
+
+    def select(
+        self,
+        channels: Optional[List[str]] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+    ) -> ColumnarSelection:
+        """與 FCSEventData.select 相同的語意（PnN、row 範圍與間隔）"""
+        names = self.channel_names
+        if channels:
+            missing = [c for c in channels if c not in names]
+            if missing:
+                raise KeyError(", ".join(missing))
+            names = channels
+        return ColumnarSelection(self.parquet, names, range(len(self))[start:stop:step])
+
+
+def open_sidecar(key: str) -> Optional[ColumnarEventData]:
+    """sidecar 不存在時回傳 None；開啟時更新 mtime 作為 LRU 的最近使用時間（不依賴 atime）
+
+    物件儲存時讀取的是本機 cache 中的副本
+    """
+    try:
+        path = get_backend().local_path(key)
+        data = ColumnarEventData(path)
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except pa.ArrowInvalid:
+        # 損毀的 sidecar 直接刪除，之後會重新轉檔
+        remove_stored(key)
+        return None
+    return data
+
+
+def evict_sidecars(max_bytes: int) -> int:
+    """本機儲存的 sidecar 總大小超過上限時，依最近使用時間由舊到新刪除，回傳刪除的檔案數
+
+    物件儲存的 sidecar 保留到 blob 被刪除，本機副本由 read-through cache 的容量上限控制
+    """
+    entries = []
+    total = 0
+    for root, _, files in os.walk(stored_path(SIDECAR_DIR)):
+        for name in files:
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    entries.sort()
+    # 剛寫完的檔案 mtime 最新，會最後才被淘汰
+    for mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
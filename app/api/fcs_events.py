@@ -0,0 +1,290 @@
+"""FCS DATA 區段的 memory-mapped 存取（僅支援 list mode）；壓縮儲存的檔案以 frame 為單位隨機讀取"""
+import io
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+
+from app.api.fcs import FCSMetadata, FCSParseError
+from app.core.seekable_zstd import SeekableZstdReader
+from app.core.storage import get_backend, resolve_stored
+
+# 串流輸出時每次處理的 event 數，控制轉換時的記憶體用量
+CHUNK_ROWS = 256 * 1024
+
+_BYTEORD = {
+    "1": "<",
+    "1,2": "<",
+    "1,2,3,4": "<",
+    "1,2,3,4,5,6,7,8": "<",
+    "2,1": ">",
+    "4,3,2,1": ">",
+    "8,7,6,5,4,3,2,1": ">",
+}
+
+
+def _byte_order(byteord: Optional[str]) -> str:
+    key = (byteord or "1,2,3,4").replace(" ", "")
+    if key not in _BYTEORD:
+        # 例如 3,4,1,2（PDP-11）無法以 NumPy dtype 表示
+        raise FCSParseError(f"Unsupported $BYTEORD: {byteord!r}")
+    return _BYTEORD[key]
+
+
+def _channel_format(datatype: str, bits: Optional[int], order: str) -> str:
+    if datatype == "F":
+        if bits not in (None, 32):
+            raise FCSParseError(f"$DATATYPE F requires $PnB 32, got {bits}")
+        return f"{order}f4"
+    if datatype == "D":
+        if bits not in (None, 64):
+            raise FCSParseError(f"$DATATYPE D requires $PnB 64, got {bits}")
+        return f"{order}f8"
+    if datatype == "I":
+        if bits not in (8, 16, 32, 64):
+            raise FCSParseError(f"Unsupported integer width $PnB={bits}")
+        return f"{order}u{bits // 8}" if bits > 8 else "u1"
+    raise FCSParseError(f"Unsupported $DATATYPE: {datatype!r}")
+
+
+def _field_names(metadata: FCSMetadata) -> List[str]:
+    """以 PnN 作為欄位名稱；重複或空白的名稱加上 channel 編號"""
+    names, seen = [], set()
+    for c in metadata.channels:
+        name = c.pnn or f"P{c.index}"
+        if name in seen:
+            name = f"{name}_{c.index}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def event_dtype(metadata: FCSMetadata) -> np.dtype:
+    """依 $DATATYPE、$BYTEORD 與每個 channel 的 $PnB 建立一筆 event 的 structured dtype"""
+    if metadata.mode not in (None, "L"):
+        raise FCSParseError(f"Only list mode data is supported, got $MODE={metadata.mode!r}")
+    if not metadata.channels:
+        raise FCSParseError("File has no parameters")
+    order = _byte_order(metadata.byteord)
+    datatype = (metadata.datatype or "").upper()
+    formats = [_channel_format(datatype, c.pnb, order) for c in metadata.channels]
+    return np.dtype({"names": _field_names(metadata), "formats": formats})
+
+
+class FCSEventData:
+    """以 np.memmap 對應 DATA 區段，不把 event 讀進記憶體
+
+    events 為 structured array（每個 channel 一個欄位），選取 channel 與 row 都是 view，不會複製資料；
+    實際讀取時只有被存取到的 page 會由作業系統載入
+    """
+
+    def __init__(self, path: str, metadata: FCSMetadata):
+        self.metadata = metadata
+        self.dtype = event_dtype(metadata)
+        if metadata.data_start <= 0 or metadata.data_end < metadata.data_start:
+            raise FCSParseError("Invalid DATA segment offsets")
+        available = (metadata.data_end - metadata.data_start + 1) // self.dtype.itemsize
+        count = min(metadata.tot, available) if metadata.tot is not None else available
+        if count > 0:
+            self.events = self._map_events(path, count)
+        else:
+            self.events = np.empty(0, dtype=self.dtype)
+
+    def _map_events(self, path: str, count: int):
+        return np.memmap(path, dtype=self.dtype, mode="r", offset=self.metadata.data_start, shape=(count,))
+
+    @property
+    def channel_names(self) -> List[str]:
+        return list(self.dtype.names)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def matrix(self) -> Optional[np.ndarray]:
+        """所有 channel 寬度相同時，回傳 (events, channels) 的 2-D view"""
+        formats = {self.dtype.fields[name][0] for name in self.dtype.names}
+        if len(formats) != 1:
+            return None
+        return self.events.view(formats.pop()).reshape(len(self.events), len(self.dtype.names))
+
+    def select(
+        self,
+        channels: Optional[List[str]] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+    ) -> np.ndarray:
+        """依 PnN 選取 channel、依 row 範圍與間隔取樣，回傳 structured view"""
+        view = self.events
+        if channels:
+            missing = [c for c in channels if c not in self.dtype.names]
+            if missing:
+                raise KeyError(", ".join(missing))
+            view = view[channels]
+        return view[start:stop:step]
+
+
+class SeekableRecords:
+    """壓縮檔 DATA 區段的 structured array 介面（唯讀），只解壓讀取到的 frame
+
+    支援 len()、dtype、以 PnN（或 PnN list）選取欄位、連續 slice 與排序後的 index array；
+    slice 與 index 會實際讀取並回傳 np.ndarray
+    """
+
+    def __init__(
+        self,
+        reader: SeekableZstdReader,
+        dtype: np.dtype,
+        offset: int,
+        count: int,
+        fields: Union[None, str, List[str]] = None,
+    ):
+        self.reader = reader
+        self.base_dtype = dtype
+        self.offset = offset
+        self.count = count
+        # 與 NumPy 相同：單一欄位名稱回傳該欄位的一般陣列，欄位 list 回傳 structured array
+        self.fields = fields
+        self.dtype = dtype if fields is None else dtype[fields]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _project(self, rows: np.ndarray) -> np.ndarray:
+        return rows if self.fields is None else rows[self.fields]
+
+    def _read(self, start: int, stop: int) -> np.ndarray:
+        itemsize = self.base_dtype.itemsize
+        raw = self.reader.read_at(self.offset + start * itemsize, (stop - start) * itemsize)
+        return np.frombuffer(raw, dtype=self.base_dtype)
+
+    def take(self, indices: np.ndarray) -> np.ndarray:
+        """讀取排序後的 row index；每次讀取的範圍不超過一個 frame，稀疏的 index 只解壓用到的 frame"""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty(len(indices), dtype=self.base_dtype)
+        window = max(1, self.reader.frame_size // self.base_dtype.itemsize)
+        pos = 0
+        while pos < len(indices):
+            first = int(indices[pos])
+            end = int(np.searchsorted(indices, first + window, side="left"))
+            block = self._read(first, int(indices[end - 1]) + 1)
+            out[pos:end] = block[indices[pos:end] - first]
+            pos = end
+        return self._project(out)
+
+    def __getitem__(self, key: Union[str, List[str], slice, np.ndarray]):
+        if isinstance(key, str):
+            return SeekableRecords(self.reader, self.base_dtype, self.offset, self.count, key)
+        if isinstance(key, list) and all(isinstance(k, str) for k in key):
+            return SeekableRecords(self.reader, self.base_dtype, self.offset, self.count, key)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count)
+            if step == 1:
+                return self._project(self._read(start, stop) if stop > start else np.empty(0, self.base_dtype))
+            return self.take(np.arange(start, stop, step))
+        return self.take(key)
+
+
+class SeekableEventData(FCSEventData):
+    """壓縮儲存（seekable zstd）的檔案：events 為 SeekableRecords，以 frame 為單位解壓需要的範圍"""
+
+    def _map_events(self, reader: SeekableZstdReader, count: int):
+        return SeekableRecords(reader, self.dtype, self.metadata.data_start, count)
+
+    def matrix(self) -> Optional[np.ndarray]:
+        return None
+
+    def select(
+        self,
+        channels: Optional[List[str]] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+    ) -> "SeekableSelection":
+        if channels:
+            missing = [c for c in channels if c not in self.dtype.names]
+            if missing:
+                raise KeyError(", ".join(missing))
+        return SeekableSelection(self.events, channels or list(self.dtype.names), range(len(self.events))[start:stop:step])
+
+
+class SeekableSelection:
+    """SeekableEventData.select() 的結果；逐塊讀取選取的 row，不會一次解壓整個範圍"""
+
+    def __init__(self, events, names: List[str], rows: range):
+        self.events = events
+        self.names = names
+        self.rows = rows
+        self.dtypes = [events.dtype.fields[name][0].newbyteorder("=") for name in names]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def iter_columns(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[np.ndarray]]:
+        for i in range(0, len(self.rows), chunk_rows):
+            rows = self.rows[i:i + chunk_rows]
+            chunk = self.events[rows.start:rows.stop:rows.step]
+            yield [chunk[name].astype(dtype) for name, dtype in zip(self.names, self.dtypes)]
+
+
+def open_stored_events(key: str, metadata: FCSMetadata) -> FCSEventData:
+    """開啟儲存的檔案的 DATA 區段：原始檔以 memory map（物件儲存先複製到本機 cache），壓縮檔以 seek table 隨機讀取"""
+    stored = resolve_stored(key)
+    backend = get_backend()
+    if stored.compressed:
+        return SeekableEventData(SeekableZstdReader(backend.open(stored.key, stored.size)), metadata)
+    return FCSEventData(backend.local_path(stored.key), metadata)
+
+
+class ArraySelection:
+    """FCSEventData.select() 的結果；iter_columns() 逐塊回傳每個 channel 的 native byte order 陣列"""
+
+    def __init__(self, view: np.ndarray):
+        self.view = view
+        self.names = list(view.dtype.names)
+        self.dtypes = [view.dtype.fields[name][0].newbyteorder("=") for name in self.names]
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def iter_columns(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[np.ndarray]]:
+        for i in range(0, len(self.view), chunk_rows):
+            chunk = self.view[i:i + chunk_rows]
+            yield [chunk[name].astype(dtype) for name, dtype in zip(self.names, self.dtypes)]
+
+
+def iter_npy(selection, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """輸出 .npy；channel 型別相同時為 2-D 陣列，否則為 packed structured array（一律 native byte order）"""
+    uniform = selection.dtypes[0] if len(set(selection.dtypes)) == 1 else None
+    if uniform is not None:
+        header = {"descr": np.lib.format.dtype_to_descr(uniform), "fortran_order": False,
+                  "shape": (len(selection), len(selection.names))}
+    else:
+        packed = np.dtype({"names": selection.names, "formats": selection.dtypes})
+        header = {"descr": np.lib.format.dtype_to_descr(packed), "fortran_order": False, "shape": (len(selection),)}
+
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_2_0(buf, header)
+    yield buf.getvalue()
+
+    for columns in selection.iter_columns(chunk_rows):
+        if uniform is not None:
+            chunk = np.column_stack(columns)
+        else:
+            chunk = np.empty(len(columns[0]), dtype=packed)
+            for name, column in zip(selection.names, columns):
+                chunk[name] = column
+        yield chunk.tobytes()
+
+
+# IPC stream 結尾（continuation token + 長度 0）
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def iter_arrow(selection, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """輸出 Arrow IPC stream，每個 chunk 一個 record batch"""
+    schema = pa.schema([pa.field(name, pa.from_numpy_dtype(dtype)) for name, dtype in zip(selection.names, selection.dtypes)])
+    yield schema.serialize().to_pybytes()
+    for columns in selection.iter_columns(chunk_rows):
+        yield pa.record_batch([pa.array(c) for c in columns], schema=schema).serialize().to_pybytes()
+    yield _ARROW_EOS
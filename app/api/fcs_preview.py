@@ -0,0 +1,130 @@
+"""檔案預覽：固定 seed 的隨機 subsample 與 channel pair 的 2-D density grid，結果以 JSON 快取在磁碟上"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.api.fcs_events import CHUNK_ROWS, FCSEventData
+from app.core.storage import preview_dir_key, stored_path
+
+# 輸出格式變更時遞增，讓舊的快取檔自然失效
+PREVIEW_VERSION = 1
+
+
+def preview_key(f, params: dict) -> str:
+    """快取檔位置：內容（blob sha256 或 stored_filename）+ 參數的 hash"""
+    canonical = json.dumps({"v": PREVIEW_VERSION, **params}, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode()).hexdigest()[:32]
+    sha256 = f.blob.sha256 if f.blob is not None else None
+    return os.path.join(preview_dir_key(sha256, f.stored_filename), f"{digest}.json")
+
+
+def sample_indices(count: int, size: int, seed: int) -> np.ndarray:
+    """不重複抽樣並排序（依檔案順序讀取 memory map）；相同 seed 永遠得到相同結果"""
+    if size >= count:
+        return np.arange(count)
+    return np.sort(np.random.default_rng(seed).choice(count, size, replace=False))
+
+
+def subsample(data: FCSEventData, channels: List[str], size: int, seed: int) -> dict:
+    idx = sample_indices(len(data), size, seed)
+    events = data.events[channels][idx]
+    return {
+        "size": len(idx),
+        "seed": seed,
+        "columns": {name: events[name].tolist() for name in channels},
+    }
+
+
+def density_grids(
+    data: FCSEventData,
+    pairs: List[Tuple[str, str]],
+    bins: int,
+    chunk_rows: int = CHUNK_ROWS,
+) -> List[dict]:
+    """兩次掃描全部 event：第一次取得每個 channel 的範圍，第二次以 bincount 同時累加所有 pair 的 grid"""
+    names = sorted({name for pair in pairs for name in pair})
+    events = data.events[names]
+
+    lo = {name: np.inf for name in names}
+    hi = {name: -np.inf for name in names}
+    for i in range(0, len(events), chunk_rows):
+        chunk = events[i:i + chunk_rows]
+        for name in names:
+            values = chunk[name].astype(np.float64)
+            values = values[np.isfinite(values)]
+            if len(values):
+                lo[name] = min(lo[name], values.min())
+                hi[name] = max(hi[name], values.max())
+
+    grids = [np.zeros(bins * bins, dtype=np.int64) for _ in pairs]
+    for i in range(0, len(events), chunk_rows):
+        chunk = events[i:i + chunk_rows]
+        binned = {}
+        for name in names:
+            values = chunk[name].astype(np.float64)
+            span = hi[name] - lo[name]
+            scale = bins / span if span > 0 else 0.0
+            with np.errstate(invalid="ignore"):
+                b = ((values - lo[name]) * scale).astype(np.int64)
+            # 最大值落在最後一個 bin（與 np.histogram 相同）
+            binned[name] = (np.clip(b, 0, bins - 1), np.isfinite(values))
+        for grid, (x, y) in zip(grids, pairs):
+            bx, fx = binned[x]
+            by, fy = binned[y]
+            valid = fx & fy
+            grid += np.bincount(bx[valid] * bins + by[valid], minlength=bins * bins)
+
+    result = []
+    for grid, (x, y) in zip(grids, pairs):
+        result.append({
+            "x": x,
+            "y": y,
+            "bins": bins,
+            "x_range": [float(lo[x]), float(hi[x])] if np.isfinite(lo[x]) else None,
+            "y_range": [float(lo[y]), float(hi[y])] if np.isfinite(lo[y]) else None,
+            # counts[i][j]：x 落在第 i 個 bin、y 落在第 j 個 bin 的 event 數（同 np.histogram2d）
+            "counts": grid.reshape(bins, bins).tolist(),
+        })
+    return result
+
+
+def build_preview(
+    data: FCSEventData,
+    channels: Optional[List[str]],
+    pairs: List[Tuple[str, str]],
+    sample_size: int,
+    seed: int,
+    bins: int,
+) -> dict:
+    """channel 名稱不存在時拋出 KeyError"""
+    names = data.channel_names
+    channels = channels or names
+    missing = sorted({c for c in channels + [name for pair in pairs for name in pair] if c not in names})
+    if missing:
+        raise KeyError(", ".join(missing))
+    return {
+        "event_count": len(data),
+        "channels": channels,
+        "sample": subsample(data, channels, sample_size, seed),
+        "density": density_grids(data, pairs, bins) if pairs else [],
+    }
+
+
+def write_preview(key: str, preview: dict) -> str:
+    """以暫存檔 + rename 寫入，同時計算相同預覽的 request 不會讀到寫到一半的檔案"""
+    path = stored_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".preview-", suffix=".part")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(preview, fh, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
@@ -0,0 +1,25 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(uploaded_at: datetime, file_id: int) -> str:
+    """cursor 為最後一筆的 (uploaded_at, id)，以 base64url 編碼避免客戶端依賴其格式"""
+    raw = json.dumps([uploaded_at.isoformat(), file_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        uploaded_at, file_id = json.loads(raw)
+        return datetime.fromisoformat(uploaded_at), int(file_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
@@ -1,21 +1,25 @@
 import logging
 from datetime import datetime, timedelta
 
+from app.core.activity_log import log_activity
 from app.core.config import settings
 from app.core.database import get_db
-from app.db.crud import create_activity_log, create_user, get_user_by_email
+from app.core.security import (
+    hash_password,
+    password_needs_rehash,
+    principal_cache,
+    verify_password,
+)
+from app.db.crud import create_user, get_user_by_email, update_user_password
 from app.db.models import User
 from app.deps import get_current_user
-from app.schemas import Token, UserCreate, UserLogin
+from app.schemas import PasswordChange, Token, UserCreate, UserLogin
 from fastapi import APIRouter, Depends, HTTPException, status
 from jose import jwt
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # 設置 logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,15 +40,14 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # 創建新用戶
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     new_user = await create_user(db, email=user_data.email, hashed_password=hashed_password)
     
     # 生成訪問令牌
     access_token = create_access_token({"sub": new_user.email})
     
     # 記錄註冊活動
-    await create_activity_log(
-        db,
+    await log_activity(
         user_id=new_user.id,
         username=new_user.email,
         activity_type="user_register",
@@ -60,15 +63,16 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """用戶登入"""
     # 驗證用戶憑證
     user = await get_user_by_email(db, user_data.email)
-    if not user or not pwd_context.verify(user_data.password, user.hashed_password):
+    if not user or not await verify_password(user_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="帳號密碼錯誤")
+    if password_needs_rehash(user.hashed_password):
+        await update_user_password(db, user, await hash_password(user_data.password))
     
     # 生成訪問令牌
     access_token = create_access_token({"sub": user.email}, timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
     
     # 記錄登入活動
-    await create_activity_log(
-        db,
+    await log_activity(
         user_id=user.id,
         username=user.email,
         activity_type="user_login",
@@ -87,9 +91,9 @@ async def logout(
     """用戶登出"""
     if not current_user:
         raise HTTPException(status_code=403, detail="Please login")
+    principal_cache.invalidate(current_user.email)
     # 記錄登出活動
-    await create_activity_log(
-        db,
+    await log_activity(
         user_id=current_user.id,
         username=current_user.email,
         activity_type="user_logout",
@@ -98,4 +102,30 @@ async def logout(
     
     logger.info(f"User logged out: {current_user.email}")
     
-    return {"message": "Logged out successfully"}
\ No newline at end of file
+    return {"message": "Logged out successfully"}
+
+@router.post("/password")
+async def change_password(
+    data: PasswordChange,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """變更密碼"""
+    # current_user 可能來自快取，重新由資料庫讀取
+    user = await get_user_by_email(db, current_user.email)
+    if not user or not await verify_password(data.old_password, user.hashed_password):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="帳號密碼錯誤")
+
+    await update_user_password(db, user, await hash_password(data.new_password))
+    principal_cache.invalidate(user.email)
+
+    await log_activity(
+        user_id=user.id,
+        username=user.email,
+        activity_type="password_change",
+        description="User changed password"
+    )
+
+    logger.info(f"User changed password: {user.email}")
+
+    return {"message": "Password changed successfully"}
@@ -1,26 +1,82 @@
+import asyncio
+import json
 import logging
 import os
-import shutil
 import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import quote
 
+import numpy as np
 import shortuuid
-from app.api.utils import get_fcs_version
+from app.api import upload_session
+from app.api.admission import (
+    UploadPermit,
+    batch_upload_admission,
+    quota_exceeded,
+    remaining_quota,
+    too_large,
+    upload_admission,
+)
+from app.api.archive import ArchiveError, BodyPipe, archive_kind
+from app.api.batch_upload import BatchCollector, BatchItem, BatchTooLarge
+from app.api.download import (
+    RangeResponse,
+    content_disposition,
+    http_date,
+    is_not_modified,
+)
+from app.api.fcs import FCSMetadata, FCSParseError, read_stored_metadata
+from app.api.fcs_columnar import file_sidecar_key, open_sidecar
+from app.api.fcs_events import ArraySelection, FCSEventData, iter_arrow, iter_npy, open_stored_events
+from app.api.fcs_preview import build_preview, preview_key, write_preview
+from app.api.pagination import InvalidCursor, decode_cursor, encode_cursor
+from app.api.upload import (
+    MultipartError,
+    UploadSink,
+    UploadTooLarge,
+    iter_multipart,
+    parse_form_bool,
+)
+from app.core.activity_log import log_activity
+from app.core.cache import get_async_redis
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.metrics import UPLOAD_BYTES, PhaseTimer
+from app.core.storage import (
+    blob_exists,
+    blob_key,
+    open_stored,
+    resolve_stored,
+    sidecar_key,
+    stored_path,
+)
 from app.db.crud import (
-    create_activity_log,
-    create_file,
+    create_file_with_blob,
+    create_files_with_blobs,
+    delete_file,
+    file_listing_query,
+    file_search_filters,
+    get_blob_by_sha256,
+    get_blobs_by_sha256,
     get_file_by_slug,
-    get_public_files,
-    get_user_files,
 )
-from app.db.models import User
-from app.deps import get_current_user, get_current_user_optional
-from app.schemas import FileUploadResponse
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from app.db.models import Blob, FileInfo, User
+from app.deps import get_current_user, get_current_user_optional, get_readable_file
+from app.schemas import (
+    BatchUploadItem,
+    BatchUploadResponse,
+    FileUploadResponse,
+    UploadSessionCreate,
+    UploadSessionStatus,
+)
+from app.workers.stats_cache import invalidate_user_stats
+from app.workers.worker import build_columnar_sidecar, compress_blob, compute_file_stats
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
@@ -29,129 +85,761 @@ UPLOAD_DIR = Path(settings.UPLOAD_DIR)
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_EXTENSIONS = [".fcs"]
-chunk_size = 1024 * 1024
+# 除最後一塊外每個 chunk 的最小大小，第一塊必須能容納 FCS HEADER
+MIN_CHUNK_SIZE = 256 * 1024
+FCS_MEDIA_TYPE = "application/vnd.isac.fcs"
+MAX_PAGE_SIZE = 1000
+# 同一個 sidecar 在轉檔期間（或轉檔失敗後）不重複排入的秒數
+SIDECAR_PENDING_TTL = 600
+# 同一個 blob 在壓縮期間不重複排入的秒數（重複上傳相同內容時）
+COMPRESSION_PENDING_TTL = 3600
+MAX_PREVIEW_SAMPLE = 100000
+MAX_PREVIEW_PAIRS = 16
 
 # 設置 logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-@router.post("/upload", response_model=FileUploadResponse)
+async def enqueue_channel_stats(file_id: int) -> None:
+    """排入 channel 統計任務；broker 無法連線時不影響上傳，之後讀取統計時會再排入"""
+    try:
+        await run_in_threadpool(compute_file_stats.delay, file_id)
+    except Exception as e:
+        logger.warning(f"Failed to enqueue channel stats for file {file_id}: {e}")
+
+
+async def enqueue_columnar_sidecar(file_id: int, key: str) -> None:
+    """排入 Parquet sidecar 轉檔；以 Redis key 避免同一個 sidecar 被重複排入"""
+    try:
+        if await get_async_redis().set(f"columnar:pending:{key}", file_id, nx=True, ex=SIDECAR_PENDING_TTL):
+            await run_in_threadpool(build_columnar_sidecar.delay, file_id)
+    except Exception as e:
+        logger.warning(f"Failed to enqueue columnar sidecar for file {file_id}: {e}")
+
+
+async def enqueue_blob_compression(blob_id: int) -> None:
+    """排入 blob 的背景壓縮；排入失敗的 blob 由定期的 compress_stored_blobs 補上"""
+    try:
+        if await get_async_redis().set(f"compress:pending:{blob_id}", 1, nx=True, ex=COMPRESSION_PENDING_TTL):
+            await run_in_threadpool(compress_blob.delay, blob_id)
+    except Exception as e:
+        logger.warning(f"Failed to enqueue compression for blob {blob_id}: {e}")
+
+
+async def store_upload(
+    db: AsyncSession,
+    sink: UploadSink,
+    metadata: Optional[FCSMetadata],
+    filename: str,
+    is_public: bool,
+    current_user: Optional[User],
+    blob: Optional[Blob] = None,
+) -> FileUploadResponse:
+    """把暫存檔存為以內容 hash 定址的 blob，並建立檔案記錄與活動紀錄"""
+    sha256 = sink.sha256
+    if blob is None:
+        blob = await get_blob_by_sha256(db, sha256)
+    key = blob.stored_filename if blob else blob_key(sha256)
+
+    if blob is not None and blob.fcs_metadata:
+        # 內容重複：沿用已解析的 metadata，不寫入第二份檔案
+        fcs_version = blob.fcs_version
+        fcs_metadata = blob.fcs_metadata
+    else:
+        fcs_version = metadata.version
+        fcs_metadata = json.dumps(metadata.to_dict())
+
+    if not sink.discarding and not await run_in_threadpool(blob_exists, key):
+        await sink.commit(key)
+
+    # 生成短連結
+    slug = shortuuid.uuid()[:8]
+
+    # 創建檔案記錄
+    file_data = {
+        "original_filename": filename,
+        "size_bytes": sink.size,
+        "fcs_version": fcs_version,
+        "is_public": is_public,
+        "slug": slug
+    }
+
+    # 匿名上傳不綁定擁有者（owner_id 為 users.id 的 FK，不能寫入 0）
+    file_data["owner_id"] = current_user.id if current_user else None
+
+    blob_values = {
+        "sha256": sha256,
+        "stored_filename": key,
+        "size_bytes": sink.size,
+        "fcs_version": fcs_version,
+        "fcs_metadata": fcs_metadata,
+    }
+    # $TOT、$PAR 與每個 channel 的 PnN/PnS/PnB/PnR/PnE 一併寫入資料庫
+    with sink.timer.phase("db_commit"):
+        new_file = await create_file_with_blob(db, blob_values, metadata=json.loads(fcs_metadata), **file_data)
+
+    # blob 可能在上面的檢查之後才被刪除（最後一個參照剛好消失），參照數已 +1 後再確認一次
+    if not await run_in_threadpool(blob_exists, key):
+        if sink.discarding:
+            await delete_file(db, new_file)
+            raise HTTPException(status_code=409, detail="Stored content is no longer available, please upload again.")
+        await sink.commit(key)
+    # 內容重複時丟棄暫存檔
+    await sink.abort()
+    await invalidate_user_stats(file_data["owner_id"])
+    if settings.CHANNEL_STATS_ON_UPLOAD:
+        await enqueue_channel_stats(new_file.id)
+    if settings.COLUMNAR_SIDECAR_ON_UPLOAD:
+        await enqueue_columnar_sidecar(new_file.id, sidecar_key(sha256, key))
+    if settings.STORAGE_COMPRESSION:
+        await enqueue_blob_compression(new_file.blob_id)
+
+    # 記錄活動
+    if current_user:
+        with sink.timer.phase("activity_log"):
+            await log_activity(
+                user_id=current_user.id,
+                username=current_user.email,
+                activity_type="file_upload",
+                description=f"Uploaded file: {filename} ({'public' if is_public else 'private'})"
+            )
+    sink.timer.observe()
+    UPLOAD_BYTES.inc(sink.size)
+
+    return FileUploadResponse(
+        short_link=f"/files/{slug}",
+        filename=filename,
+        size=sink.size,
+        fcs_version=fcs_version,
+        is_public=is_public,
+        owner_id = file_data["owner_id"],
+        sha256=sha256,
+    )
+
+
+async def store_batch(
+    db: AsyncSession,
+    items: List[BatchItem],
+    is_public: bool,
+    current_user: Optional[User],
+    timer: PhaseTimer,
+) -> Dict[int, FileUploadResponse]:
+    """把批次中解析成功的檔案存為 blob，並在單一 transaction 中建立所有檔案記錄與活動紀錄
+
+    回傳 {items 的索引: FileUploadResponse}
+    """
+    stored = [(index, item) for index, item in enumerate(items) if item.ok]
+    if not stored:
+        return {}
+    existing = {b.sha256: b for b in await get_blobs_by_sha256(db, list({item.sink.sha256 for _, item in stored}))}
+    owner_id = current_user.id if current_user else None
+
+    entries = []
+    activities = []
+    for _, item in stored:
+        sha256 = item.sink.sha256
+        blob = existing.get(sha256)
+        key = blob.stored_filename if blob else blob_key(sha256)
+        # 同一批中相同內容的檔案只放置一次，其餘的暫存檔最後丟棄
+        if not await run_in_threadpool(blob_exists, key):
+            await item.sink.commit(key)
+        fcs_metadata = item.metadata.to_dict()
+        blob_values = {
+            "sha256": sha256,
+            "stored_filename": key,
+            "size_bytes": item.sink.size,
+            "fcs_version": item.metadata.version,
+            "fcs_metadata": json.dumps(fcs_metadata),
+        }
+        file_data = {
+            "original_filename": item.filename,
+            "size_bytes": item.sink.size,
+            "fcs_version": item.metadata.version,
+            "is_public": is_public,
+            "slug": shortuuid.uuid()[:8],
+            "owner_id": owner_id,
+        }
+        entries.append((blob_values, fcs_metadata, file_data))
+        if current_user:
+            activities.append({
+                "user_id": current_user.id,
+                "username": current_user.email,
+                "activity_type": "file_upload",
+                "description": f"Uploaded file: {item.filename} ({'public' if is_public else 'private'})",
+                "timestamp": datetime.utcnow(),
+            })
+
+    with timer.phase("db_commit"):
+        files = await create_files_with_blobs(db, entries, activities)
+
+    responses = {}
+    for (index, item), f in zip(stored, files):
+        # 與 store_upload 相同：blob 可能在檢查之後才被刪除，參照數已 +1 後再確認一次
+        if not await run_in_threadpool(blob_exists, f.stored_filename) and item.sink.temp_path:
+            await item.sink.commit(f.stored_filename)
+        await item.sink.abort()
+        responses[index] = FileUploadResponse(
+            short_link=f"/files/{f.slug}",
+            filename=f.original_filename,
+            size=f.size_bytes,
+            fcs_version=f.fcs_version,
+            is_public=f.is_public,
+            owner_id=f.owner_id,
+            sha256=item.sink.sha256,
+        )
+
+    await invalidate_user_stats(owner_id)
+    for (blob_values, _, _), f in zip(entries, files):
+        if settings.CHANNEL_STATS_ON_UPLOAD:
+            await enqueue_channel_stats(f.id)
+        if settings.COLUMNAR_SIDECAR_ON_UPLOAD:
+            await enqueue_columnar_sidecar(f.id, sidecar_key(blob_values["sha256"], f.stored_filename))
+    if settings.STORAGE_COMPRESSION:
+        for blob_id in sorted({f.blob_id for f in files}):
+            await enqueue_blob_compression(blob_id)
+    timer.observe()
+    UPLOAD_BYTES.inc(sum(f.size_bytes for f in files))
+    return responses
+
+
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "is_public": {"type": "boolean", "default": True},
+                        "sha256": {
+                            "type": "string",
+                            "description": "檔案內容的 sha256，需放在 file 欄位之前；內容已存在時伺服器只計算 hash 不寫入磁碟",
+                        },
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/upload", response_model=FileUploadResponse, openapi_extra=UPLOAD_OPENAPI)
 async def upload_file(
-    file: UploadFile = File(...),
-    is_public: bool = Form(True),
+    request: Request,
+    permit: UploadPermit = Depends(upload_admission),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """上傳檔案 - 支援公開和私人上傳"""
+    """上傳檔案 - 支援公開和私人上傳；大小、配額與同時上傳數在讀取 body 前檢查"""
     start_time = time.time()
+    max_bytes = permit.max_bytes
+    timer = PhaseTimer()
+
+    fields = {}
+    filename = None
+    sink = None
+    metadata = None
+    blob = None
 
-    # 驗證檔案格式
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail="Invalid file format. Only FCS files are allowed.")
-    
-    # 驗證檔案大小
-    file_size = 0
-    temp_file_path = f"/tmp/{file.filename}"
-    
     try:
-        with open(temp_file_path, "wb") as buffer:
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                file_size += len(chunk)
-                if file_size > settings.MAX_FILE_MB * 1024 * 1024:
-                    raise HTTPException(status_code=400, detail=f"File too large. Maximum size is {MAX_FILE_SIZE_MB}MB.")
-                buffer.write(chunk)
-        
-        fcs_version = get_fcs_version(temp_file_path)
-        
-        # 生成唯一檔名和短連結
-        stored_filename = f"{shortuuid.uuid()}_{file.filename}"
-        slug = shortuuid.uuid()[:8]
-        
-        # 創建檔案記錄
-        file_data = {
-            "original_filename": file.filename,
-            "stored_filename": stored_filename,
-            "size_bytes": file_size,
-            "fcs_version": fcs_version,
-            "is_public": is_public,
-            "slug": slug
-        }
-        
-        if current_user:
-            file_data["owner_id"] = current_user.id
-        else:
-            file_data["owner_id"] = 0
-
-        # 移動檔案到永久儲存位置
-        final_path = os.path.join(settings.UPLOAD_DIR, stored_filename)
-        shutil.move(temp_file_path, final_path)
-        
-        # 記錄活動
-        if current_user:
-            await create_activity_log(
-                db,
-                user_id=current_user.id,
-                username=current_user.email,
-                activity_type="file_upload",
-                description=f"Uploaded file: {file.filename} ({'public' if is_public else 'private'})"
-            )
-        
+        # 單次串流：request body 直接寫入 UPLOAD_DIR 內的唯一暫存檔，同時計算 sha256 與解析 HEADER
+        async for event in iter_multipart(request, timer):
+            kind = event[0]
+            if kind == "field":
+                fields[event[1]] = event[2]
+            elif kind == "file":
+                if event[1] != "file" or sink is not None:
+                    raise HTTPException(status_code=400, detail="Only one file field named 'file' is allowed.")
+                filename = event[2]
+                # 驗證檔案格式
+                ext = os.path.splitext(filename)[1].lower()
+                if ext not in ALLOWED_EXTENSIONS:
+                    raise HTTPException(status_code=400, detail="Invalid file format. Only FCS files are allowed.")
+                claimed = (fields.get("sha256") or "").lower()
+                if claimed:
+                    # 查詢在 body 串流途中執行，使用短 session，避免 transaction 佔住連線直到上傳結束
+                    async with AsyncSessionLocal() as lookup:
+                        blob = await get_blob_by_sha256(lookup, claimed)
+                if blob is not None and await run_in_threadpool(blob_exists, blob.stored_filename):
+                    # 內容已存在：只計算 hash 驗證，不寫入磁碟
+                    sink = UploadSink(None, max_bytes, timer, size_hint=permit.size_hint)
+                else:
+                    blob = None
+                    sink = UploadSink(settings.UPLOAD_DIR, max_bytes, timer, size_hint=permit.size_hint)
+            elif kind == "data":
+                await sink.write(event[1])
+            elif kind == "end":
+                metadata = await sink.finish()
+
+        if sink is None or (metadata is None and not sink.discarding):
+            raise HTTPException(status_code=400, detail="Missing file field.")
+        if blob is not None and sink.sha256 != blob.sha256:
+            raise HTTPException(status_code=400, detail="sha256 does not match the uploaded content.")
+
+        is_public = parse_form_bool(fields.get("is_public"), default=True)
+        response = await store_upload(db, sink, metadata, filename, is_public, current_user, blob=blob)
+
         # 計算總上傳時間
         total_time = time.time() - start_time
-        logger.info(f"File uploaded in {total_time:.2f} seconds - Size: {file_size} bytes, User: {current_user.email if current_user else 'anonymous'}")
-        print(file_data)
-        new_file = await create_file(db,**file_data)
-
-        return FileUploadResponse(
-            short_link=f"/files/{slug}",
-            filename=file.filename,
-            size=file_size,
-            fcs_version=fcs_version,
-            is_public=is_public,
-            owner_id = file_data["owner_id"]
-        )
-        
+        logger.info(f"File uploaded in {total_time:.2f} seconds - Size: {sink.size} bytes, SHA256: {sink.sha256}, User: {current_user.email if current_user else 'anonymous'}, Phases: {timer}")
+
+        return response
+
+    except UploadTooLarge:
+        await sink.abort()
+        raise quota_exceeded() if permit.quota_limited else too_large()
+    except (FCSParseError, MultipartError) as e:
+        if sink:
+            await sink.abort()
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    except HTTPException:
+        if sink:
+            await sink.abort()
+        raise
     except Exception as e:
         # 清理臨時檔案
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        if sink:
+            await sink.abort()
         logger.error(f"File upload error: {e}")
         raise HTTPException(status_code=500, detail="File upload failed")
 
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "description": ".fcs 檔案，或 .zip / .tar / .tar.gz 壓縮檔（串流解壓）",
+                        },
+                        "is_public": {"type": "boolean", "default": True},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def upload_batch(
+    request: Request,
+    permit: UploadPermit = Depends(batch_upload_admission),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """批次上傳：多個檔案欄位或 ZIP/TAR 壓縮檔，回傳每個檔案的結果
+
+    檔案依序串流寫入暫存檔，FCS 解析以 BATCH_UPLOAD_CONCURRENCY 為上限並行；
+    所有檔案記錄與活動紀錄在同一個 transaction 中寫入
+    """
+    start_time = time.time()
+    timer = PhaseTimer()
+    collector = BatchCollector(
+        settings.UPLOAD_DIR,
+        ALLOWED_EXTENSIONS,
+        max_file_bytes=min(settings.MAX_FILE_MB * 1024 * 1024, permit.max_bytes),
+        max_total_bytes=permit.max_bytes,
+        max_files=settings.BATCH_UPLOAD_MAX_FILES,
+        concurrency=settings.BATCH_UPLOAD_CONCURRENCY,
+        timer=timer,
+    )
+    fields = {}
+    item = None
+    pipe = None
+    extract = None
+
+    try:
+        async for event in iter_multipart(request, timer):
+            kind = event[0]
+            if kind == "field":
+                fields[event[1]] = event[2]
+            elif kind == "file":
+                archive = archive_kind(event[2])
+                if archive is not None:
+                    # 壓縮檔在 worker thread 中邊收邊解壓
+                    pipe = BodyPipe()
+                    extract = asyncio.create_task(collector.add_archive(archive, pipe))
+                else:
+                    item = collector.start(event[2], size_hint=permit.size_hint)
+            elif kind == "data":
+                if pipe is not None:
+                    if extract.done():
+                        # 解壓已失敗時立即回報，之後的資料也不需要再讀取
+                        await extract
+                    await pipe.feed(event[1])
+                else:
+                    await collector.write(item, event[1])
+            elif kind == "end":
+                if pipe is not None:
+                    await pipe.close()
+                    await extract
+                    pipe, extract = None, None
+                else:
+                    collector.end(item)
+                    item = None
+
+        items = await collector.wait()
+        if not items:
+            raise HTTPException(status_code=400, detail="Missing file field.")
+        is_public = parse_form_bool(fields.get("is_public"), default=True)
+        responses = await store_batch(db, items, is_public, current_user, timer)
+
+    except BatchTooLarge:
+        await _abort_batch(collector, pipe, extract)
+        raise quota_exceeded() if permit.quota_limited else too_large(settings.BATCH_UPLOAD_MAX_MB)
+    except (ArchiveError, MultipartError) as e:
+        await _abort_batch(collector, pipe, extract)
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    except HTTPException:
+        await _abort_batch(collector, pipe, extract)
+        raise
+    except Exception as e:
+        await _abort_batch(collector, pipe, extract)
+        logger.error(f"Batch upload error: {e}")
+        raise HTTPException(status_code=500, detail="File upload failed")
+
+    total_time = time.time() - start_time
+    logger.info(f"Batch uploaded in {total_time:.2f} seconds - Files: {len(responses)}/{len(items)}, Size: {collector.total_bytes} bytes, User: {current_user.email if current_user else 'anonymous'}, Phases: {timer}")
+    return BatchUploadResponse(
+        created=len(responses),
+        failed=len(items) - len(responses),
+        items=[
+            BatchUploadItem(
+                filename=item.filename,
+                ok=index in responses,
+                error=item.error if index not in responses else None,
+                file=responses.get(index),
+            )
+            for index, item in enumerate(items)
+        ],
+    )
+
+
+async def _abort_batch(collector: BatchCollector, pipe: Optional[BodyPipe], extract: Optional[asyncio.Task]) -> None:
+    if pipe is not None:
+        pipe.abort()
+    if extract is not None:
+        extract.cancel()
+        await asyncio.gather(extract, return_exceptions=True)
+    await collector.abort()
+
+
+def _session_status(meta: dict) -> UploadSessionStatus:
+    received = upload_session.received_chunks(meta["session_id"])
+    received_set = set(received)
+    return UploadSessionStatus(
+        session_id=meta["session_id"],
+        filename=meta["filename"],
+        size_bytes=meta["size_bytes"],
+        chunk_size=meta["chunk_size"],
+        total_chunks=meta["total_chunks"],
+        expires_at=datetime.utcfromtimestamp(meta["expires_at"]),
+        received=received,
+        missing=[i for i in range(meta["total_chunks"]) if i not in received_set],
+    )
+
+
+def _load_owned_session(session_id: str, current_user: Optional[User]) -> dict:
+    try:
+        meta = upload_session.load_session(session_id)
+    except upload_session.SessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if meta["owner_id"] != (current_user.id if current_user else None):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return meta
+
+
+@router.post("/sessions", response_model=UploadSessionStatus)
+async def create_upload_session(
+    body: UploadSessionCreate,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """建立分段上傳 session"""
+    ext = os.path.splitext(body.filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file format. Only FCS files are allowed.")
+    if body.size_bytes <= 0 or body.size_bytes > settings.MAX_FILE_MB * 1024 * 1024:
+        raise too_large()
+    quota = await remaining_quota(db, current_user)
+    if quota is not None and body.size_bytes > quota:
+        raise quota_exceeded()
+
+    chunk_size = body.chunk_size or settings.UPLOAD_CHUNK_MB * 1024 * 1024
+    if chunk_size < MIN_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be at least {MIN_CHUNK_SIZE} bytes")
+
+    meta = upload_session.create_session(
+        filename=os.path.basename(body.filename),
+        size_bytes=body.size_bytes,
+        is_public=body.is_public,
+        owner_id=current_user.id if current_user else None,
+        chunk_size=chunk_size,
+    )
+    return _session_status(meta)
+
+
+@router.get("/sessions/{session_id}", response_model=UploadSessionStatus)
+async def get_upload_session(
+    session_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """查詢 session 已收到與尚缺的 chunk"""
+    meta = _load_owned_session(session_id, current_user)
+    return _session_status(meta)
+
+
+@router.put("/sessions/{session_id}/chunks/{index}")
+async def upload_session_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    permit: UploadPermit = Depends(upload_admission),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """上傳單一 chunk（可亂序、可並行、可重送）；同時上傳數與一般上傳共用上限"""
+    meta = _load_owned_session(session_id, current_user)
+    if index < 0 or index >= meta["total_chunks"]:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+    expected = upload_session.expected_chunk_size(meta, index)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes, got {content_length}")
+
+    try:
+        size = await upload_session.write_chunk(meta, index, request.stream())
+    except upload_session.ChunkSizeMismatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FCSParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    return {"index": index, "size": size}
+
+
+@router.post("/sessions/{session_id}/commit", response_model=FileUploadResponse)
+async def commit_upload_session(
+    session_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """所有 chunk 到齊後組裝成最終檔案"""
+    start_time = time.time()
+    meta = _load_owned_session(session_id, current_user)
+    status = _session_status(meta)
+    if status.missing:
+        raise HTTPException(status_code=409, detail={"message": "Missing chunks", "missing": status.missing})
+    # 建立 session 之後可能已上傳其他檔案，組裝前再檢查一次配額
+    quota = await remaining_quota(db, current_user)
+    if quota is not None and meta["size_bytes"] > quota:
+        raise quota_exceeded()
+    if not upload_session.acquire_commit_lock(session_id):
+        raise HTTPException(status_code=409, detail="Upload session is already being committed")
+
+    sink = UploadSink(settings.UPLOAD_DIR, settings.MAX_FILE_MB * 1024 * 1024)
+    try:
+        await sink.copy_from(
+            upload_session.chunk_path(session_id, i) for i in range(meta["total_chunks"])
+        )
+        metadata = await sink.finish()
+        response = await store_upload(db, sink, metadata, meta["filename"], meta["is_public"], current_user)
+    except FCSParseError as e:
+        await sink.abort()
+        upload_session.release_commit_lock(session_id)
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    except HTTPException:
+        # store_upload 的 409（重複）/ 413（配額）原樣回傳
+        await sink.abort()
+        upload_session.release_commit_lock(session_id)
+        raise
+    except Exception as e:
+        await sink.abort()
+        upload_session.release_commit_lock(session_id)
+        logger.error(f"Upload session commit error: {e}")
+        raise HTTPException(status_code=500, detail="File upload failed")
+
+    await run_in_threadpool(upload_session.delete_session, session_id)
+
+    total_time = time.time() - start_time
+    logger.info(f"Upload session {session_id} committed in {total_time:.2f} seconds - Size: {sink.size} bytes, Chunks: {meta['total_chunks']}, User: {current_user.email if current_user else 'anonymous'}")
+    return response
+
+
+@router.delete("/sessions/{session_id}")
+async def abort_upload_session(
+    session_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """放棄分段上傳並刪除已上傳的 chunk"""
+    _load_owned_session(session_id, current_user)
+    await run_in_threadpool(upload_session.delete_session, session_id)
+    return {"message": "Upload session aborted"}
+
+
+def _listing_item(row) -> dict:
+    return {
+        "short_link": f"/files/{row.slug}",
+        "filename": row.original_filename,
+        "size": float(row.size_bytes),
+        "uploaded_at": row.uploaded_at.isoformat() if row.uploaded_at else None,
+        "fcs_version": row.fcs_version,
+        "event_count": row.event_count,
+        "is_public": row.is_public,
+        "owner_id": row.owner_id,
+    }
+
+
+async def _stream_listing(stmt, limit: int, ndjson: bool) -> AsyncIterator[bytes]:
+    """以 server-side cursor 逐筆輸出，不一次載入整頁；多查一筆用來判斷是否還有下一頁"""
+    next_cursor = None
+    last = None
+    count = 0
+    if not ndjson:
+        yield b'{"items":['
+    # StreamingResponse 在 dependency 結束後才開始輸出，因此自行開啟 session
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt)
+        async for row in result:
+            if count == limit:
+                next_cursor = encode_cursor(last.uploaded_at, last.id)
+                break
+            item = json.dumps(_listing_item(row), ensure_ascii=False).encode()
+            if ndjson:
+                yield item + b"\n"
+            else:
+                yield (b"," if count else b"") + item
+            last = row
+            count += 1
+        await result.close()
+    if ndjson:
+        yield json.dumps({"next_cursor": next_cursor}).encode() + b"\n"
+    else:
+        yield b'],"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+
+
 @router.get("/files")
 async def get_file(
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    owner_id: Optional[int] = None,
+    is_public: Optional[bool] = None,
+    fcs_version: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: AsyncSession = Depends(get_db)
 ):
-    """獲取公開+私人檔案"""
+    """獲取公開+私人檔案，依上傳時間由新到舊分頁"""
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    pulic_file = await get_public_files(db)
+    viewer_id = current_user.id if current_user else None
+    stmt = file_listing_query(
+        viewer_id,
+        limit + 1,
+        after=after,
+        owner_id=owner_id,
+        is_public=is_public,
+        fcs_version=fcs_version,
+    )
 
-    if current_user:
-        owner_file = await get_user_files(db, current_user.id)
-        await create_activity_log(
-            db,
+    # 匿名使用者沒有 user_id 可以記錄
+    if current_user and after is None:
+        await log_activity(
             user_id=current_user.id,
             username=current_user.email,
             activity_type="file_access",
             description=f"{current_user.id}get all file"
         )
-        return pulic_file+owner_file
-    
-    await create_activity_log(
-            db,
+
+    ndjson = format == "ndjson"
+    return StreamingResponse(
+        _stream_listing(stmt, limit, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """uploaded_at 以不含時區的 UTC 儲存"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("/search")
+async def search_files(
+    pnn: List[str] = Query([], description="channel 名稱（$PnN），多個值時每個都必須符合"),
+    pns: List[str] = Query([], description="channel 標記（$PnS），多個值時每個都必須符合"),
+    match: str = Query("exact", pattern="^(exact|prefix|contains)$"),
+    ignore_case: bool = False,
+    min_events: Optional[int] = Query(None, ge=0, description="$TOT 下限"),
+    max_events: Optional[int] = Query(None, ge=0, description="$TOT 上限"),
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    fcs_version: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    is_public: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """依 channel 名稱、event 數、版本、大小與上傳時間搜尋可見的檔案；可見範圍與分頁方式同 GET /files/files
+
+    只搜尋已寫入 channel 資訊的檔案（舊檔案需先執行 backfill_file_metadata）
+    """
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    viewer_id = current_user.id if current_user else None
+    stmt = file_listing_query(
+        viewer_id,
+        limit + 1,
+        after=after,
+        owner_id=owner_id,
+        is_public=is_public,
+        fcs_version=fcs_version,
+        extra_filters=file_search_filters(
+            pnn=pnn,
+            pns=pns,
+            match=match,
+            ignore_case=ignore_case,
+            min_events=min_events,
+            max_events=max_events,
+            min_size=min_size,
+            max_size=max_size,
+            uploaded_after=_naive_utc(uploaded_after),
+            uploaded_before=_naive_utc(uploaded_before),
+        ),
+    )
+
+    if current_user and after is None:
+        await log_activity(
             user_id=current_user.id,
             username=current_user.email,
-            activity_type="file_access",
-            description=f"get all public file"
+            activity_type="file_search",
+            description=f"{current_user.id} searched files: pnn={pnn} pns={pns} match={match}"
         )
-    return pulic_file
-    
+
+    ndjson = format == "ndjson"
+    return StreamingResponse(
+        _stream_listing(stmt, limit, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
+
+
 
 @router.put("/{slug}/visibility")
 async def update_file_visibility(
@@ -174,14 +862,212 @@ async def update_file_visibility(
     file_record.is_public = is_public
     db.add(file_record)
     await db.commit()
+    await invalidate_user_stats(current_user.id)
     
     # 記錄活動
-    await create_activity_log(
-        db,
+    await log_activity(
         user_id=current_user.id,
         username=current_user.email,
         activity_type="file_visibility_change",
         description=f"Changed file visibility to {'public' if is_public else 'private'}: {file_record.original_filename}"
     )
     
-    return {"message": "File visibility updated successfully"}
\ No newline at end of file
+    return {"message": "File visibility updated successfully"}
+
+@router.delete("/{slug}")
+async def remove_file(
+    slug: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """刪除檔案（僅檔案擁有者），blob 沒有其他參照時一併回收"""
+    if not current_user:
+        raise HTTPException(status_code=403, detail="Please login")
+
+    file_record = await get_file_by_slug(db, slug)
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if current_user.id != file_record.owner_id:
+        raise HTTPException(status_code=403, detail="Only file owner can delete the file")
+
+    filename = file_record.original_filename
+    await delete_file(db, file_record)
+    await invalidate_user_stats(current_user.id)
+
+    # 記錄活動
+    await log_activity(
+        user_id=current_user.id,
+        username=current_user.email,
+        activity_type="file_delete",
+        description=f"Deleted file: {filename}"
+    )
+
+    return {"message": "File deleted successfully"}
+
+
+async def load_file_metadata(file_record: FileInfo) -> FCSMetadata:
+    """優先使用上傳時保存的 metadata，舊檔案才重新解析 HEADER/TEXT"""
+    if file_record.blob is not None and file_record.blob.fcs_metadata:
+        return FCSMetadata.from_dict(json.loads(file_record.blob.fcs_metadata))
+    return await run_in_threadpool(read_stored_metadata, file_record.stored_filename)
+
+
+async def open_event_data(file_record: FileInfo) -> FCSEventData:
+    """開啟 DATA 區段（memory map 或壓縮檔的隨機讀取）；檔案遺失回傳 404，無法解讀的格式回傳 422"""
+    try:
+        metadata = await load_file_metadata(file_record)
+        return await run_in_threadpool(open_stored_events, file_record.stored_filename, metadata)
+    except FileNotFoundError:
+        logger.error(f"Stored file missing for slug {file_record.slug}: {file_record.stored_filename}")
+        raise HTTPException(status_code=404, detail="File not found")
+    except FCSParseError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _split_list(value: Optional[str]) -> Optional[list]:
+    return [c.strip() for c in value.split(",") if c.strip()] if value else None
+
+
+EVENT_MEDIA_TYPES = {
+    "npy": "application/x-npy",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+@router.get("/{slug}/events")
+async def get_file_events(
+    slug: str,
+    channels: Optional[str] = Query(None, description="以逗號分隔的 PnN，未指定時回傳全部 channel"),
+    start: int = Query(0, ge=0),
+    stop: Optional[int] = Query(None, ge=0),
+    step: int = Query(1, ge=1),
+    format: str = Query("npy", pattern="^(npy|arrow)$"),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """回傳選取的 channel 與 event（.npy 或 Arrow IPC stream）
+
+    已轉檔的檔案從 Parquet sidecar 只讀取需要的 column；尚未轉檔時以 memory map 讀取 DATA 區段並排入轉檔
+    """
+    file_record = await get_readable_file(db, slug, current_user)
+    selected = _split_list(channels)
+
+    key = file_sidecar_key(file_record)
+    data = await run_in_threadpool(open_sidecar, key)
+    if data is None:
+        data = await open_event_data(file_record)
+        await enqueue_columnar_sidecar(file_record.id, key)
+
+    try:
+        view = data.select(selected, start, stop, step)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown channels: {e.args[0]}")
+    if isinstance(view, np.ndarray):
+        view = ArraySelection(view)
+
+    chunks = iter_npy(view) if format == "npy" else iter_arrow(view)
+    stem = os.path.splitext(file_record.original_filename)[0]
+    return StreamingResponse(
+        iterate_in_threadpool(chunks),
+        media_type=EVENT_MEDIA_TYPES[format],
+        headers={
+            "content-disposition": content_disposition(f"{stem}.{format}"),
+            "x-event-count": str(len(view)),
+            # PnN 可能含非 ASCII 字元，以 percent-encoding 放進 header
+            "x-channels": quote(",".join(view.names), safe=","),
+        },
+    )
+
+
+@router.get("/{slug}/preview")
+async def get_file_preview(
+    slug: str,
+    request: Request,
+    sample: int = Query(10000, ge=0, le=MAX_PREVIEW_SAMPLE, description="隨機抽樣的 event 數"),
+    seed: int = Query(0, ge=0),
+    channels: Optional[str] = Query(None, description="subsample 包含的 PnN，以逗號分隔，預設全部"),
+    pairs: Optional[str] = Query(None, description="2-D density 的 channel pair，例如 FSC-A:SSC-A,CD4:CD8"),
+    bins: int = Query(256, ge=8, le=1024),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """固定 seed 的 subsample 與 2-D density grid；第一次請求時計算並快取在磁碟，之後直接回傳快取檔"""
+    file_record = await get_readable_file(db, slug, current_user)
+
+    pair_list = []
+    for item in _split_list(pairs) or []:
+        x, sep, y = item.partition(":")
+        if not sep or not x.strip() or not y.strip():
+            raise HTTPException(status_code=400, detail=f"Invalid channel pair: {item!r}")
+        pair_list.append((x.strip(), y.strip()))
+    if len(pair_list) > MAX_PREVIEW_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PREVIEW_PAIRS} channel pairs are allowed")
+
+    selected = _split_list(channels)
+    params = {"channels": selected, "pairs": pair_list, "sample": sample, "seed": seed, "bins": bins}
+    key = preview_key(file_record, params)
+    path = stored_path(key)
+    if not await run_in_threadpool(os.path.exists, path):
+        data = await open_event_data(file_record)
+        try:
+            preview = await run_in_threadpool(build_preview, data, selected, pair_list, sample, seed, bins)
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=f"Unknown channels: {e.args[0]}")
+        await run_in_threadpool(write_preview, key, preview)
+
+    # 快取檔內容由檔案內容與參數決定，檔名即為強 ETag
+    stat_result = await run_in_threadpool(os.stat, path)
+    etag = f'"{os.path.splitext(os.path.basename(path))[0]}"'
+    headers = {
+        "etag": etag,
+        "cache-control": f"{'public' if file_record.is_public else 'private'}, no-cache",
+    }
+    if is_not_modified(request.headers, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/json", headers=headers, stat_result=stat_result)
+
+
+@router.api_route("/{slug}", methods=["GET", "HEAD"])
+async def download_file(
+    slug: str,
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    """下載檔案 - 支援 Range、ETag/Last-Modified 條件式請求"""
+    file_record = await get_readable_file(db, slug, current_user)
+
+    try:
+        stored = await run_in_threadpool(resolve_stored, file_record.stored_filename)
+    except FileNotFoundError:
+        logger.error(f"Stored file missing for slug {slug}: {file_record.stored_filename}")
+        raise HTTPException(status_code=404, detail="File not found")
+    # 壓縮檔的大小為原始內容大小（blob 才會被壓縮）
+    size = int(file_record.blob.size_bytes) if stored.compressed else stored.size
+
+    # blob 內容不可變，sha256 即為強 ETag；舊格式檔案以 mtime/size 產生
+    if file_record.blob is not None:
+        etag = f'"{file_record.blob.sha256}"'
+    else:
+        etag = f'"{int(stored.mtime)}-{stored.size}"'
+    last_modified = http_date(stored.mtime)
+    headers = {
+        "etag": etag,
+        "last-modified": last_modified,
+        "cache-control": f"{'public' if file_record.is_public else 'private'}, no-cache",
+    }
+
+    if is_not_modified(request.headers, etag, stored.mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["content-disposition"] = content_disposition(file_record.original_filename)
+    return RangeResponse(
+        # 開啟時重新判斷儲存位置：背景壓縮可能剛好在回應之前把原始檔換成壓縮檔
+        lambda: open_stored(file_record.stored_filename),
+        size=size,
+        headers=headers,
+        media_type=FCS_MEDIA_TYPE,
+        etag=etag,
+        last_modified=last_modified,
+    )
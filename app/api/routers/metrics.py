@@ -0,0 +1,31 @@
+import threading
+
+from app.core.config import settings
+from app.core.metrics import render_metrics
+from app.core.profiler import sample_stacks
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指標"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@router.get("/debug/profile", include_in_schema=False)
+async def profile(
+    seconds: float = Query(5, gt=0, le=60),
+    all_threads: bool = Query(False, description="預設只取樣 event loop 所在的 thread"),
+):
+    """取樣 call stack 並以 collapsed stack 格式回傳（需設定 PROFILER_ENABLED）"""
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # async handler 在 event loop 的 thread 上執行
+    thread_id = None if all_threads else threading.get_ident()
+    stacks = await run_in_threadpool(sample_stacks, seconds, thread_id=thread_id)
+    return PlainTextResponse(stacks)
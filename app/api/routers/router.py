@@ -1,8 +1,12 @@
 from app.api.routers.auth import router as auth_router
 from app.api.routers.file import router as file_router
+from app.api.routers.metrics import router as metrics_router
 from app.api.routers.stats import router as stats_router
 from fastapi import APIRouter
 
 router = APIRouter()
 
-router.include_router(auth_router)
\ No newline at end of file
+router.include_router(auth_router)
+router.include_router(file_router)
+router.include_router(stats_router)
+router.include_router(metrics_router)
\ No newline at end of file
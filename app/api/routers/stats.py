@@ -1,60 +1,130 @@
+import uuid
+from typing import Optional
+
+from app.api.routers.file import enqueue_channel_stats
+from app.api.task_events import stream_task_events
 from app.core.database import get_db
-from app.db.crud import get_user_files
+from app.db.crud import (
+    channel_stats_dict,
+    create_task_record,
+    get_file_channels,
+    get_task_record,
+    get_user_files_info,
+    get_user_usage,
+)
 from app.db.models import User
-from app.deps import get_current_user
+from app.deps import get_current_user, get_current_user_optional, get_readable_file
 from app.schemas import TaskCreateResp, TaskStatus
+from app.workers.progress import get_progress
+from app.workers.stats_cache import (
+    abandon_stats_task,
+    claim_stats_task,
+    get_cached_stats,
+    stats_generation,
+)
 from app.workers.worker import celery_app, compute_stats
 from celery.result import AsyncResult
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/stats", tags=["Statistics"])
 
 @router.post("/tasks", response_model=TaskCreateResp)
-def create_stats_task(current_user: User = Depends(get_current_user)):
-    """創建背景計算任務"""
-    task = compute_stats.delay(user_id=current_user.id)
-    return {"task_id": task.id, "status": "PENDING"}
+async def create_stats_task(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """創建背景計算任務；檔案未變更時直接回傳快取結果，已有執行中的任務時回傳該任務"""
+    generation = await stats_generation(current_user.id)
+    cached = await get_cached_stats(current_user.id, generation)
+    if cached:
+        return {"task_id": cached["task_id"], "status": "SUCCESS", "result": cached["result"]}
+
+    task_id = str(uuid.uuid4())
+    existing = await claim_stats_task(current_user.id, generation, task_id)
+    if existing:
+        # Celery 的 result backend 與 broker 為同步呼叫，不在 event loop 上執行
+        status = await run_in_threadpool(lambda: celery_app.AsyncResult(existing).status)
+        return {"task_id": existing, "status": status}
+
+    try:
+        # 先建立任務紀錄，worker 才能更新狀態
+        await create_task_record(db, task_id)
+        await run_in_threadpool(
+            compute_stats.apply_async,
+            kwargs={"user_id": current_user.id, "generation": generation},
+            task_id=task_id,
+        )
+    except Exception:
+        await abandon_stats_task(current_user.id, generation)
+        raise
+    return {"task_id": task_id, "status": "PENDING"}
 
 @router.get("/tasks/{task_id}", response_model=TaskStatus)
 def get_task_status(task_id: str):
-    """獲取任務狀態和結果"""
+    """獲取任務狀態、進度和結果"""
     task = celery_app.AsyncResult(task_id)
     return {
         "task_id": task_id, 
         "status": task.status, 
-        "result": task.result if task.successful() else None
+        "result": task.result if task.successful() else None,
+        "progress": get_progress(task_id),
     }
 
-@router.get("/user/all_fcs_info")
-async def get_user_all_fcs_info(current_user: User = Depends(get_current_user)):
-    """獲取用戶所有FCS檔案資訊"""
-    
-    db = await get_db().__anext__()
-    user_files = await get_user_files(db, current_user.id)
-    
+@router.get("/tasks/{task_id}/events")
+async def stream_task_status(task_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """以 Server-Sent Events 推送任務狀態（pending/running/finished/failed）與進度"""
+    if await get_task_record(db, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        stream_task_events(task_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/files/{slug}/channels")
+async def get_file_channel_stats(
+    slug: str,
+    response: Response,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db),
+):
+    """獲取檔案每個 channel 的統計（min/max/mean/median/百分位數/histogram）；尚未計算時排入任務並回傳 202"""
+    file_record = await get_readable_file(db, slug, current_user)
+    if file_record.channel_stats_at is None:
+        await enqueue_channel_stats(file_record.id)
+        response.status_code = 202
+        return {"slug": slug, "status": "pending", "channels": []}
+
+    channels = await get_file_channels(db, file_record.id)
     return {
-        "files": [
-            {
-                "filename": f.original_filename,
-                "size_bytes": float(f.size_bytes),
-                "uploaded_at": f.uploaded_at,
-                "fcs_version": f.fcs_version,
-                "is_public": f.is_public
-            }
-            for f in user_files
-        ]
+        "slug": slug,
+        "status": "ready",
+        "computed_at": file_record.channel_stats_at,
+        "channels": [
+            {"index": c.channel_index, "pnn": c.pnn, "pns": c.pns, **channel_stats_dict(c)}
+            for c in channels
+        ],
     }
 
+@router.get("/user/all_fcs_info")
+async def get_user_all_fcs_info(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """獲取用戶所有FCS檔案資訊"""
+    return {"files": await get_user_files_info(db, current_user.id)}
+
 @router.get("/user/files_statistics")
-async def get_user_fcs_statistics(current_user: User = Depends(get_current_user)):
+async def get_user_fcs_statistics(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
     """獲取用戶檔案統計"""
-    
-    db = await get_db().__anext__()
-    user_files = await get_user_files(db, current_user.id)
-    
-    total_size = sum(float(f.size_bytes) for f in user_files)
-    
+    usage = await get_user_usage(db, current_user.id)
     return {
-        "total_files": len(user_files),
-        "total_size_bytes": total_size
-    }
\ No newline at end of file
+        "total_files": usage["total_files"],
+        "total_size_bytes": float(usage["total_size_bytes"])
+    }
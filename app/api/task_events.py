@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+
+from app.core.cache import get_async_redis
+from app.core.database import AsyncSessionLocal
+from app.db.crud import get_task_record
+from app.workers.progress import (
+    EVENT_CHANNEL_PREFIX,
+    TERMINAL_STATUSES,
+    last_event_key,
+)
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# 沒有事件時送出 SSE 註解，避免 proxy 因閒置關閉連線；同時重新確認任務狀態
+KEEPALIVE_SECONDS = 15
+# 每個連線最多暫存的事件數，客戶端讀太慢時丟棄最舊的進度事件
+SUBSCRIBER_QUEUE_SIZE = 100
+# 等待 pattern 訂閱生效的上限，Redis 無法連線時改由 keepalive 時的狀態確認補上
+SUBSCRIBE_TIMEOUT_SECONDS = 5
+# 重新訂閱後放入每個 queue，通知 SSE 連線重新讀取目前狀態（斷線期間的事件已遺失）
+RESYNC = None
+
+
+class TaskEventHub:
+    """每個 API process 只用一條 Redis pub/sub 連線訂閱所有任務事件，再分送給各個 SSE 連線"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{EVENT_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+                    elif message["type"] == "psubscribe":
+                        # 訂閱確認後才會收到事件
+                        self._ready.set()
+                        self._broadcast(RESYNC)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._ready.clear()
+                logger.warning(f"Task event subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, item) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+    def _broadcast(self, item) -> None:
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._put(queue, item)
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        task_id = channel[len(EVENT_CHANNEL_PREFIX):]
+        queues = self._subscribers.get(task_id)
+        if not queues:
+            return
+        event = json.loads(data)
+        for queue in queues:
+            self._put(queue, event)
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        """回傳時 pattern 訂閱已生效，之後發布的事件都會放入 queue"""
+        self.start()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[task_id].add(queue)
+        try:
+            try:
+                await asyncio.wait_for(self._ready.wait(), SUBSCRIBE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(f"Task event subscription not ready after {SUBSCRIBE_TIMEOUT_SECONDS}s")
+            yield queue
+        finally:
+            queues = self._subscribers.get(task_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[task_id]
+
+
+task_event_hub = TaskEventHub()
+
+
+def format_sse(event: dict) -> bytes:
+    return f"event: {event['status']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+async def current_task_event(task_id: str) -> Optional[dict]:
+    """任務目前的狀態：Redis 保存的最後事件，沒有時（尚未開始或已過期）以 tasks 表代替；任務不存在時回傳 None"""
+    snapshot = await get_async_redis().get(last_event_key(task_id))
+    if snapshot:
+        return json.loads(snapshot)
+    async with AsyncSessionLocal() as db:
+        record = await get_task_record(db, task_id)
+    if record is None:
+        return None
+    return {"task_id": task_id, "status": record.status}
+
+
+async def stream_task_events(task_id: str, request: Request) -> AsyncIterator[bytes]:
+    """先送出目前狀態，之後推送每次狀態變化，任務結束時關閉串流"""
+    async with task_event_hub.subscribe(task_id) as queue:
+        # 訂閱生效後才讀取目前狀態，避免兩者之間發生的事件遺失
+        event = await current_task_event(task_id)
+        if event is None:
+            yield format_sse({"task_id": task_id, "status": "failed", "error": "Task not found"})
+            return
+        yield format_sse(event)
+        if event["status"] in TERMINAL_STATUSES:
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # 訂閱中斷期間結束的任務不會再收到事件，以目前狀態確認
+                event = await current_task_event(task_id)
+                if event is not None and event["status"] in TERMINAL_STATUSES:
+                    yield format_sse(event)
+                    return
+                yield b": keepalive\n\n"
+                continue
+            if event is RESYNC:
+                event = await current_task_event(task_id)
+                if event is None or event["status"] not in TERMINAL_STATUSES:
+                    continue
+            yield format_sse(event)
+            if event["status"] in TERMINAL_STATUSES:
+                return
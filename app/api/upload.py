@@ -0,0 +1,235 @@
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Optional, Tuple
+
+from app.api.fcs import FCSHeaderSniffer, FCSMetadata, check_header_bounds, read_fcs_metadata
+from app.core.metrics import PhaseTimer, timed_stream
+from app.core.storage import place_file
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+# 寫入磁碟前累積的資料量，避免每個網路封包都切換一次 thread
+WRITE_BUFFER_SIZE = 1024 * 1024
+# 一般表單欄位（非檔案）的大小上限
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MultipartError(ValueError):
+    pass
+
+
+class UploadSink:
+    """串流寫入目的地目錄中的唯一暫存檔，同時計算 sha256 與解析 FCS HEADER/TEXT
+
+    dest_dir 為 None 時只計算 hash 不寫入磁碟（用於已知內容重複的上傳）；
+    size_hint 為檔案大小的上限（例如 Content-Length），HEADER offset 超出時在第一個 chunk 就中止；
+    timer 累計 hash、disk write、FCS 解析與 rename 各自的耗時
+    """
+
+    def __init__(
+        self,
+        dest_dir: Optional[str],
+        max_bytes: int,
+        timer: Optional[PhaseTimer] = None,
+        size_hint: Optional[int] = None,
+    ):
+        self.temp_path = None
+        self._fh = None
+        if dest_dir is not None:
+            fd, self.temp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+            self._fh = os.fdopen(fd, "wb")
+        self.max_bytes = max_bytes
+        self.size_hint = size_hint
+        self.timer = timer or PhaseTimer()
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.sniffer = FCSHeaderSniffer()
+        self._pending = []
+        self._pending_size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self.hasher.hexdigest()
+
+    def _write(self, data: bytes) -> None:
+        # hashlib 與 file.write 在大區塊時都會釋放 GIL
+        with self.timer.phase("hash"):
+            self.hasher.update(data)
+        if self._fh is not None:
+            with self.timer.phase("disk_write"):
+                self._fh.write(data)
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge()
+        # HEADER/TEXT 在最前面，解析完成後 feed 即為 no-op
+        if not self.sniffer.done:
+            with self.timer.phase("fcs_parse"):
+                header_seen = self.sniffer.header is not None
+                self.sniffer.feed(data)
+                if not header_seen and self.sniffer.header is not None and self.size_hint:
+                    check_header_bounds(self.sniffer.header, self.size_hint)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= WRITE_BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        self._pending, self._pending_size = [], 0
+        await run_in_threadpool(self._write, data)
+
+    def _copy_files(self, paths) -> None:
+        for path in paths:
+            with open(path, "rb") as src:
+                while True:
+                    data = src.read(WRITE_BUFFER_SIZE)
+                    if not data:
+                        break
+                    self.size += len(data)
+                    if self.size > self.max_bytes:
+                        raise UploadTooLarge()
+                    if not self.sniffer.done:
+                        with self.timer.phase("fcs_parse"):
+                            self.sniffer.feed(data)
+                    self._write(data)
+
+    async def copy_from(self, paths) -> None:
+        """依序把多個檔案（例如分段上傳的 chunk）串接寫入，整段在 threadpool 中執行"""
+        await self.flush()
+        await run_in_threadpool(self._copy_files, list(paths))
+
+    @property
+    def discarding(self) -> bool:
+        return self._fh is None
+
+    async def finish(self) -> Optional[FCSMetadata]:
+        """寫完所有資料並關閉暫存檔，回傳 FCS metadata"""
+        await self.flush()
+        if self.discarding:
+            # 只驗證 HEADER，完整 metadata 由既有 blob 提供
+            return self.sniffer.metadata
+        with self.timer.phase("disk_write"):
+            await run_in_threadpool(self._fh.close)
+        if self.sniffer.done and not self.sniffer.needs_supplemental_text:
+            return self.sniffer.metadata
+        # 檔案比 TEXT 區段短時會在此拋出 FCSParseError
+        with self.timer.phase("fcs_parse"):
+            return await run_in_threadpool(read_fcs_metadata, self.temp_path)
+
+    async def commit(self, key: str) -> None:
+        """把暫存檔放到 blob 位置（本機為 atomic rename，物件儲存為 multipart 上傳）"""
+        with self.timer.phase("rename"):
+            await run_in_threadpool(place_file, self.temp_path, key)
+        self.temp_path = None
+
+    async def abort(self) -> None:
+        def _cleanup():
+            if self._fh is not None and not self._fh.closed:
+                self._fh.close()
+            if self.temp_path and os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+        await run_in_threadpool(_cleanup)
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else value
+
+
+async def iter_multipart(request: Request, timer: Optional[PhaseTimer] = None) -> AsyncIterator[Tuple]:
+    """直接解析 request body 的 multipart 串流，不經過 Starlette 的 SpooledTemporaryFile
+
+    產生的事件：
+      ("field", name, value)
+      ("file", name, filename)   開始一個檔案欄位
+      ("data", bytes)            目前檔案欄位的資料
+      ("end",)                   目前檔案欄位結束
+
+    timer 指定時記錄等待 request body 的時間（receive）
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MultipartError("Expected multipart/form-data")
+
+    events = []
+    state = {"headers": {}, "field": b"", "value": b"", "name": None, "filename": None, "buf": []}
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["name"] = _decode(options.get(b"name", b""))
+        filename = options.get(b"filename")
+        state["filename"] = _decode(filename) if filename is not None else None
+        state["buf"] = []
+        if state["filename"] is not None:
+            events.append(("file", state["name"], os.path.basename(state["filename"])))
+
+    def on_part_data(data, start, end):
+        if state["filename"] is not None:
+            events.append(("data", bytes(data[start:end])))
+        else:
+            state["buf"].append(bytes(data[start:end]))
+            if sum(len(b) for b in state["buf"]) > MAX_FIELD_BYTES:
+                raise MultipartError(f"Form field {state['name']!r} too large")
+
+    def on_part_end():
+        if state["filename"] is not None:
+            events.append(("end",))
+        else:
+            events.append(("field", state["name"], _decode(b"".join(state["buf"]))))
+
+    parser = MultipartParser(
+        boundary,
+        callbacks={
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    stream = request.stream()
+    if timer is not None:
+        stream = timed_stream(stream, timer, "receive")
+    async for chunk in stream:
+        if not chunk:
+            continue
+        parser.write(chunk)
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
+    for event in events:
+        yield event
+
+
+def parse_form_bool(value: Optional[str], default: bool = True) -> bool:
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import shutil
+import time
+from typing import AsyncIterator, List, Optional
+
+import shortuuid
+from app.api.fcs import HEADER_SIZE, check_header_bounds, parse_header
+from app.core.config import settings
+from starlette.concurrency import run_in_threadpool
+
+SESSION_META = "session.json"
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class ChunkSizeMismatch(ValueError):
+    pass
+
+
+def sessions_dir() -> str:
+    # 與 UPLOAD_DIR 位於同一檔案系統，組裝完成後可直接 rename
+    path = os.path.join(settings.UPLOAD_DIR, ".sessions")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def session_dir(session_id: str) -> str:
+    if not session_id.isalnum():
+        raise SessionNotFound(session_id)
+    return os.path.join(sessions_dir(), session_id)
+
+
+def chunk_path(session_id: str, index: int) -> str:
+    return os.path.join(session_dir(session_id), f"{index:06d}.chunk")
+
+
+def create_session(filename: str, size_bytes: int, is_public: bool,
+                   owner_id: Optional[int], chunk_size: int) -> dict:
+    session_id = shortuuid.uuid()
+    now = time.time()
+    meta = {
+        "session_id": session_id,
+        "filename": filename,
+        "size_bytes": size_bytes,
+        "is_public": is_public,
+        "owner_id": owner_id,
+        "chunk_size": chunk_size,
+        "total_chunks": max(math.ceil(size_bytes / chunk_size), 1),
+        "created_at": now,
+        "expires_at": now + settings.UPLOAD_SESSION_TTL_HOURS * 3600,
+    }
+    os.makedirs(session_dir(session_id))
+    with open(os.path.join(session_dir(session_id), SESSION_META), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_session(session_id: str) -> dict:
+    try:
+        with open(os.path.join(session_dir(session_id), SESSION_META)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise SessionNotFound(session_id)
+    if meta["expires_at"] < time.time():
+        raise SessionNotFound(session_id)
+    return meta
+
+
+def expected_chunk_size(meta: dict, index: int) -> int:
+    if index == meta["total_chunks"] - 1:
+        return meta["size_bytes"] - index * meta["chunk_size"]
+    return meta["chunk_size"]
+
+
+def received_chunks(session_id: str) -> List[int]:
+    received = []
+    for name in os.listdir(session_dir(session_id)):
+        if name.endswith(".chunk"):
+            received.append(int(name.split(".")[0]))
+    return sorted(received)
+
+
+def delete_session(session_id: str) -> None:
+    shutil.rmtree(session_dir(session_id), ignore_errors=True)
+
+
+def gc_expired_sessions(now: Optional[float] = None) -> int:
+    """刪除過期的 session 目錄，回傳刪除數量"""
+    now = now or time.time()
+    removed = 0
+    for session_id in os.listdir(sessions_dir()):
+        path = os.path.join(sessions_dir(), session_id)
+        try:
+            with open(os.path.join(path, SESSION_META)) as f:
+                expires_at = json.load(f)["expires_at"]
+        except (OSError, ValueError, KeyError):
+            # 沒有 metadata 的殘留目錄以 mtime 判斷
+            try:
+                expires_at = os.path.getmtime(path) + settings.UPLOAD_SESSION_TTL_HOURS * 3600
+            except OSError:
+                continue
+        if expires_at < now:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+async def write_chunk(session: dict, index: int, body: AsyncIterator[bytes]) -> int:
+    """把單一 chunk 串流寫入暫存檔後 rename，重複 PUT 同一 chunk 會覆蓋舊資料"""
+    expected = expected_chunk_size(session, index)
+    final_path = chunk_path(session["session_id"], index)
+    temp_path = f"{final_path}.{shortuuid.uuid()}.part"
+    fh = await run_in_threadpool(open, temp_path, "wb")
+    size = 0
+    head = bytearray()
+    try:
+        async for data in body:
+            size += len(data)
+            if size > expected:
+                raise ChunkSizeMismatch(f"Chunk {index} exceeds {expected} bytes")
+            # 第一個 chunk 先檢查 FCS HEADER，不合法就立刻中止
+            if index == 0 and len(head) < HEADER_SIZE:
+                head += data[: HEADER_SIZE - len(head)]
+                if len(head) >= min(HEADER_SIZE, expected):
+                    check_header_bounds(parse_header(bytes(head)), session["size_bytes"])
+            await run_in_threadpool(fh.write, data)
+        if size != expected:
+            raise ChunkSizeMismatch(f"Chunk {index} must be {expected} bytes, got {size}")
+        await run_in_threadpool(fh.close)
+        await run_in_threadpool(os.replace, temp_path, final_path)
+        return size
+    except BaseException:
+        await run_in_threadpool(fh.close)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def acquire_commit_lock(session_id: str) -> bool:
+    try:
+        os.mkdir(os.path.join(session_dir(session_id), "commit.lock"))
+        return True
+    except FileExistsError:
+        return False
+
+
+def release_commit_lock(session_id: str) -> None:
+    try:
+        os.rmdir(os.path.join(session_dir(session_id), "commit.lock"))
+    except OSError:
+        pass
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import List
 
+from app.api.fcs import read_fcs_metadata
 from app.db.models import ActivityLog, FileInfo, TaskRecord, User
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -21,5 +22,4 @@ async def get_user_activities(db: AsyncSession, user_id: int) -> List[ActivityLo
     return q.scalars().all()
     
 def get_fcs_version(path: str) -> str:
-    fd = flowio.FlowData(path)
-    return fd.version
\ No newline at end of file
+    return read_fcs_metadata(path).version
\ No newline at end of file
@@ -0,0 +1,164 @@
+# core/activity_log.py
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from app.core import database
+from app.db.crud import create_activity_logs
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 關閉時用來喚醒背景 task 的哨兵
+_STOP = object()
+
+
+class ActivityLogWriter:
+    """在 process 內緩衝活動紀錄，依筆數或時間批次寫入資料庫
+
+    request handler 只需把事件放進 queue；queue 滿時最多等待 enqueue_timeout 秒（backpressure），
+    仍無空間則丟棄並計數
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        enqueue_timeout: float,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        # event loop 結束時已從 queue 取出、尚未寫入的事件
+        self._carry_over: List[dict] = []
+
+    @property
+    def counters(self) -> dict:
+        return {
+            "queued": len(self._carry_over) + (self._queue.qsize() if self._queue else 0),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._stopping = False
+        if self._loop is not loop:
+            # asyncio.Queue 綁定在建立它的 event loop 上，換 loop 時把尚未寫入的事件搬到新 queue
+            pending, self._carry_over = self._carry_over, []
+            while self._queue is not None and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            for values in pending:
+                self._queue.put_nowait(values)
+            self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    async def enqueue(self, **values) -> bool:
+        if self._stopping:
+            self.dropped += 1
+            return False
+        # 第一次寫入時才啟動背景 task，未經 lifespan 啟動的情境（例如測試）也能運作
+        self.start()
+        values.setdefault("timestamp", datetime.utcnow())
+        try:
+            self._queue.put_nowait(values)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(values), self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning(f"Activity log queue full, dropped event {values.get('activity_type')}")
+            return False
+
+    def _drain(self, batch: List[dict]) -> None:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _collect(self) -> List[dict]:
+        """等到第一筆事件後，累積到 batch_size 或 flush_interval 到期為止"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while len(batch) < self.batch_size:
+                self._drain(batch)
+                remaining = deadline - time.monotonic()
+                # 關閉中不再等待 flush_interval，直接寫入
+                if len(batch) >= self.batch_size or remaining <= 0 or self._stopping:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # event loop 結束時背景 task 被取消，事件留給下一個 loop 的 start()
+            self._carry_over = [v for v in batch if v is not _STOP]
+            raise
+        return batch
+
+    async def _flush(self, batch: List[dict]) -> None:
+        if not batch:
+            return
+        try:
+            async with database.AsyncSessionLocal() as db:
+                await create_activity_logs(db, batch)
+            self.flushed += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} activity logs: {e}")
+
+    async def _run(self) -> None:
+        while not (self._stopping and self._queue.empty()):
+            batch = [v for v in await self._collect() if v is not _STOP]
+            await self._flush(batch)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """不再接受新事件，寫完 queue 中剩餘的事件後結束背景 task"""
+        self._stopping = True
+        if self._task is None:
+            return
+        try:
+            # 喚醒等待中的 _collect；queue 已滿時背景 task 本來就不會阻塞
+            self._queue.put_nowait(_STOP)
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Activity log writer did not finish within {timeout}s")
+        self._task = None
+        logger.info(f"Activity log writer stopped: {self.counters}")
+
+
+activity_log_writer = ActivityLogWriter(
+    max_size=settings.ACTIVITY_LOG_QUEUE_SIZE,
+    batch_size=settings.ACTIVITY_LOG_BATCH_SIZE,
+    flush_interval=settings.ACTIVITY_LOG_FLUSH_SECONDS,
+    enqueue_timeout=settings.ACTIVITY_LOG_ENQUEUE_TIMEOUT,
+)
+
+
+async def log_activity(**values) -> bool:
+    """記錄活動（只放進 queue，不等待資料庫寫入）"""
+    return await activity_log_writer.enqueue(**values)
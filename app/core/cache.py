@@ -0,0 +1,27 @@
+# core/cache.py
+import redis
+import redis.asyncio
+
+from .config import settings
+
+REDIS_URL = f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0"
+
+_sync_client = None
+
+
+def get_sync_redis() -> redis.Redis:
+    """worker 使用的同步 client（connection pool 在同一個 process 內共用）"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _sync_client
+
+_async_client = None
+
+
+def get_async_redis() -> "redis.asyncio.Redis":
+    """API 使用的 asyncio client，避免在 event loop 中做阻塞的網路呼叫"""
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
@@ -20,6 +20,12 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 
+    # 密碼雜湊成本與專用 thread 數、已驗證使用者快取
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+
     # Redis
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
@@ -27,6 +33,77 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "uploads"
     MAX_FILE_MB: int = 1000
 
+    # 儲存後端："local"（檔案放在 UPLOAD_DIR）或 "s3"（S3 相容物件儲存，UPLOAD_DIR 只放暫存檔、預覽與 read-through cache）
+    STORAGE_BACKEND: str = "local"
+    # S3：bucket、key 前綴、endpoint（MinIO 等相容服務）、region 與金鑰（未設定時使用 boto3 預設的 credential chain）
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: str = ""
+    S3_REGION: str = ""
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
+    # MinIO 需使用 "path"；bucket 不存在時是否自動建立（本機開發用）
+    S3_ADDRESSING_STYLE: str = "auto"
+    S3_CREATE_BUCKET: bool = False
+    # multipart 上傳 / 並行下載的 part 大小、同一個物件同時傳送的 part 數、connection pool 大小、Range GET 的最小讀取單位
+    S3_PART_SIZE_MB: int = 16
+    S3_CONCURRENCY: int = 8
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_READ_BLOCK_MB: int = 8
+    # read-through cache：本機容量上限、同一個 process 讀取幾次後複製到本機（0 表示只在需要 memory map 時複製）
+    STORAGE_CACHE_MB: int = 20480
+    STORAGE_CACHE_HOT_READS: int = 2
+
+    # 上傳 admission control：每位使用者的儲存配額（0 表示不限制）、同時上傳數上限（全域 / 每位上傳者）
+    USER_QUOTA_MB: int = 10240
+    UPLOAD_MAX_CONCURRENT: int = 32
+    UPLOAD_MAX_CONCURRENT_PER_USER: int = 2
+    UPLOAD_SLOT_TTL_SECONDS: int = 3600
+
+    # 批次 / 壓縮檔上傳：單一 request 的總大小（解壓縮後）、檔案數與同時解析的檔案數上限
+    BATCH_UPLOAD_MAX_MB: int = 20480
+    BATCH_UPLOAD_MAX_FILES: int = 500
+    BATCH_UPLOAD_CONCURRENCY: int = 4
+
+    # 分段上傳（resumable upload session）
+    UPLOAD_CHUNK_MB: int = 8
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+
+    # 統計任務：每個子任務處理的檔案數、每位使用者同時執行的子任務上限
+    STATS_BATCH_SIZE: int = 200
+    STATS_USER_CONCURRENCY: int = 2
+    STATS_RETRY_SECONDS: int = 5
+
+    # 上傳後自動排入每個 channel 的統計計算
+    CHANNEL_STATS_ON_UPLOAD: bool = True
+    # columnar sidecar（Parquet）：上傳後是否立即轉檔（否則在第一次讀取 event 時才排入）、總容量上限
+    COLUMNAR_SIDECAR_ON_UPLOAD: bool = False
+    COLUMNAR_CACHE_MB: int = 10240
+    # 儲存壓縮：上傳後由 worker 把 blob 轉為 seekable zstd（frame 大小、壓縮等級），壓縮比低於門檻時保留原始檔
+    STORAGE_COMPRESSION: bool = False
+    STORAGE_COMPRESSION_LEVEL: int = 3
+    STORAGE_COMPRESSION_FRAME_KB: int = 1024
+    STORAGE_COMPRESSION_MIN_RATIO: float = 1.1
+    STORAGE_COMPRESSION_BATCH_SIZE: int = 50
+
+    # Celery worker：pool 類型、每個 process 的並行數、prefetch 與 ack 時機
+    CELERY_POOL: str = "threads"
+    CELERY_CONCURRENCY: int = 8
+    CELERY_PREFETCH_MULTIPLIER: int = 1
+    CELERY_ACKS_LATE: bool = True
+    # 任務狀態寫入 tasks 表的批次間隔（秒）
+    TASK_STATUS_FLUSH_SECONDS: float = 0.5
+
+    # 活動紀錄批次寫入：queue 上限、每批筆數、最長等待秒數、queue 滿時 request 最多等待秒數
+    ACTIVITY_LOG_QUEUE_SIZE: int = 10000
+    ACTIVITY_LOG_BATCH_SIZE: int = 500
+    ACTIVITY_LOG_FLUSH_SECONDS: float = 1.0
+    ACTIVITY_LOG_ENQUEUE_TIMEOUT: float = 0.1
+
+    # 監控：worker 的 /metrics HTTP port（0 表示不啟動）、是否開放 /debug/profile 取樣 profiler
+    WORKER_METRICS_PORT: int = 9100
+    PROFILER_ENABLED: bool = False
+
     class Config:
         env_file = str(Path(__file__).parent.parent / ".env")
 
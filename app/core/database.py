@@ -4,16 +4,21 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .metrics import TimedAsyncQueuePool, instrument_engine
 
 DATABASE_URL = (
     f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
     f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
 )
 
-engine = create_async_engine(DATABASE_URL, future=True)
+# create_tables 與 alembic 使用同步 driver
+SYNC_DATABASE_URL = DATABASE_URL.replace("+asyncpg", "+psycopg2")
+
+engine = create_async_engine(DATABASE_URL, future=True, poolclass=TimedAsyncQueuePool)
+instrument_engine(engine.sync_engine)
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
-sync_engine = create_engine(DATABASE_URL)
+sync_engine = create_engine(SYNC_DATABASE_URL)
 
 def create_tables():
     Base.metadata.create_all(bind=sync_engine)
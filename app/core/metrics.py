@@ -0,0 +1,226 @@
+# core/metrics.py
+"""Prometheus 指標：request latency、上傳各階段耗時、DB pool / query、Celery 任務、儲存壓縮"""
+import os
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# 上傳與一般 request 的 bucket（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# pool 等待與單一 query 通常在毫秒等級
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the last body chunk is sent",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_PHASE_SECONDS = Histogram(
+    "upload_phase_duration_seconds",
+    "Time spent in each upload phase per request",
+    ["phase"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received by completed uploads")
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time waiting for a pooled database connection (including opening a new one)",
+    buckets=FAST_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+CELERY_QUEUE_WAIT_SECONDS = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time between publishing a task and a worker starting it",
+    ["task"],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_SECONDS = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time",
+    ["task", "state"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_COMPRESSION_RATIO = Histogram(
+    "storage_compression_ratio",
+    "Original size divided by stored size for each compressed blob",
+    buckets=(1, 1.25, 1.5, 2, 2.5, 3, 4, 6, 8, 12, 16),
+)
+STORAGE_DECOMPRESS_BYTES = Counter("storage_decompressed_bytes_total", "Bytes decompressed when reading compressed blobs")
+STORAGE_DECOMPRESS_SECONDS = Counter("storage_decompress_seconds_total", "Time spent decompressing compressed blobs")
+
+_SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+class PhaseTimer:
+    """累計同一個 request 內各階段的耗時，結束時一次寫入 histogram"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = defaultdict(float)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] += seconds
+
+    def phase(self, name: str) -> "_Phase":
+        return _Phase(self, name)
+
+    def observe(self, histogram: Histogram = UPLOAD_PHASE_SECONDS) -> None:
+        for phase, seconds in self.phases.items():
+            histogram.labels(phase=phase).observe(seconds)
+
+    def __str__(self) -> str:
+        return " ".join(f"{phase}={seconds:.3f}s" for phase, seconds in self.phases.items())
+
+
+class _Phase:
+    def __init__(self, timer: PhaseTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+async def timed_stream(stream: AsyncIterator, timer: PhaseTimer, phase: str) -> AsyncIterator:
+    """計算等待每個項目（例如 request body chunk）的時間"""
+    iterator = stream.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            timer.add(phase, time.perf_counter() - start)
+            return
+        timer.add(phase, time.perf_counter() - start)
+        yield item
+
+
+class MetricsMiddleware:
+    """ASGI middleware：以 route template（而非實際 path）為 label 記錄 latency，避免 label 數量無限制成長"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            ).observe(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """記錄取得 connection 的等待時間（pool 已滿時的排隊或建立新連線）"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+def instrument_engine(sync_engine) -> None:
+    """以 SQLAlchemy cursor event 記錄每個 statement 的執行時間"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in _SQL_OPERATIONS:
+            operation = "OTHER"
+        DB_QUERY_SECONDS.labels(operation=operation).observe(time.perf_counter() - start)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # 失敗的 statement 不會觸發 after_cursor_execute
+        stack = context.connection.info.get("query_start") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+_collectors = []
+
+
+def register_collector(collector) -> None:
+    REGISTRY.register(collector)
+    _collectors.append(collector)
+
+
+class CountersCollector:
+    """把 dict 形式的計數（例如 activity_log_writer.counters）以 gauge 匯出"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Dict[str, float]]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def collect(self):
+        gauge = GaugeMetricFamily(self.name, self.documentation, labels=["counter"])
+        for key, value in self.read().items():
+            gauge.add_metric([key], value)
+        yield gauge
+
+
+def _registry() -> CollectorRegistry:
+    """多 process 部署（uvicorn --workers、Celery prefork）時設定 PROMETHEUS_MULTIPROC_DIR 合併各 process 的指標"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _collectors:
+        registry.register(collector)
+    return registry
+
+
+def render_metrics() -> tuple:
+    """回傳 (body, content_type)"""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> None:
+    """沒有 HTTP server 的 process（Celery worker）以背景 thread 提供 /metrics"""
+    start_http_server(port, registry=_registry())
@@ -0,0 +1,35 @@
+# core/profiler.py
+"""取樣式 profiler：定期讀取所有 thread 的 call stack，輸出 collapsed stack 格式（flamegraph.pl / speedscope 可直接讀取）"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, thread_id: Optional[int] = None) -> str:
+    """在呼叫的 thread 中取樣 seconds 秒；thread_id 指定時只取樣該 thread（例如 event loop 所在的 thread）
+
+    每一行為 `thread;frame;frame;... count`，由最外層到最內層
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (thread_id is not None and ident != thread_id):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
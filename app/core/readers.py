@@ -0,0 +1,82 @@
+# core/readers.py
+"""隨機讀取的 file object：子類別只需提供 size 與 read_at(offset, size)"""
+import io
+import os
+from abc import abstractmethod
+
+
+class RandomAccessReader(io.RawIOBase):
+    """以 read_at 實作 read/seek/tell，可直接交給 read_fcs_metadata 等需要 file object 的函式"""
+
+    size: int = 0
+
+    def __new__(cls, *args, **kwargs):
+        # io.RawIOBase 的 metaclass 是 ABCMeta，但 C 實作的 __new__ 不檢查 abstract method，在此補上
+        if cls.__abstractmethods__:
+            missing = ", ".join(sorted(cls.__abstractmethods__))
+            raise TypeError(f"Can't instantiate abstract class {cls.__name__} with abstract methods {missing}")
+        return super().__new__(cls)
+
+    def __init__(self):
+        super().__init__()
+        self._pos = 0
+
+    @abstractmethod
+    def read_at(self, offset: int, size: int) -> bytes:
+        raise NotImplementedError
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        data = self.read_at(self._pos, len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = max(self.size - self._pos, 0)
+        data = self.read_at(self._pos, size)
+        self._pos += len(data)
+        return data
+
+
+class LocalFileReader(RandomAccessReader):
+    """以 os.pread 讀取本機檔案，支援 zero-copy sendfile"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._fh = open(path, "rb")
+        self.size = os.fstat(self._fh.fileno()).st_size
+
+    def fileno(self) -> int:
+        return self._fh.fileno()
+
+    @property
+    def file(self):
+        return self._fh
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        return os.pread(self._fh.fileno(), size, offset)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._fh.close()
+        super().close()
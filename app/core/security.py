@@ -0,0 +1,66 @@
+# core/security.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cachetools import TTLCache
+from passlib.context import CryptContext
+
+from .config import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt 每次約 100–300 ms CPU，放到獨立且有上限的 thread pool，不佔用 event loop 與預設 threadpool
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.verify, password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """BCRYPT_ROUNDS 調整後，舊密碼在下次登入時以新成本重新雜湊"""
+    return pwd_context.needs_update(hashed_password)
+
+
+class PrincipalCache:
+    """JWT sub（email）對應已驗證使用者的 TTL 快取，避免每個 request 都查詢資料庫
+
+    快取只存在於單一 process；登出、變更密碼時主動移除，其他 process 最晚在 TTL 後失效
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        with self._lock:
+            return self._cache.get(email)
+
+    def set(self, email: str, user) -> None:
+        with self._lock:
+            self._cache[email] = user
+
+    def invalidate(self, email: Optional[str]) -> None:
+        with self._lock:
+            self._cache.pop(email, None)
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
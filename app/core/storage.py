@@ -0,0 +1,195 @@
+# core/storage.py
+"""儲存位置與儲存後端
+
+blob、壓縮後的 blob 與 columnar sidecar 經由 StorageBackend 存取（本機 UPLOAD_DIR 或 S3 相容物件儲存）；
+上傳暫存檔、分段上傳的 chunk 與預覽快取一律放在本機 UPLOAD_DIR
+"""
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+from app.core.config import settings
+from app.core.readers import LocalFileReader, RandomAccessReader
+from app.core.seekable_zstd import SeekableZstdReader
+
+# columnar sidecar（Parquet）的 key 前綴，本機儲存時方便整批清除與計算用量
+SIDECAR_DIR = "columnar"
+# 預覽（subsample 與 2-D density）快取，每個內容一個目錄
+PREVIEW_DIR = "previews"
+# 背景壓縮後的 blob（seekable zstd）放在原位置加上此副檔名，原始檔在壓縮完成後刪除
+COMPRESSED_SUFFIX = ".zst"
+# 物件儲存的本機 read-through cache
+CACHE_DIR = ".cache"
+
+
+def blob_key(sha256: str) -> str:
+    """以內容 hash 決定儲存位置，前兩碼分目錄避免單一目錄檔案過多"""
+    return os.path.join("blobs", sha256[:2], f"{sha256}.fcs")
+
+
+def sidecar_key(sha256: Optional[str], stored_filename: str) -> str:
+    """columnar sidecar 的位置；blob 以內容 hash 共用，舊格式檔案以 stored_filename 區分"""
+    if sha256:
+        return os.path.join(SIDECAR_DIR, sha256[:2], f"{sha256}.parquet")
+    return os.path.join(SIDECAR_DIR, "legacy", f"{stored_filename}.parquet")
+
+
+def preview_dir_key(sha256: Optional[str], stored_filename: str) -> str:
+    """預覽快取目錄；與 sidecar 相同，blob 以內容 hash 共用"""
+    if sha256:
+        return os.path.join(PREVIEW_DIR, sha256[:2], sha256)
+    return os.path.join(PREVIEW_DIR, "legacy", stored_filename)
+
+
+def compressed_key(key: str) -> str:
+    return key + COMPRESSED_SUFFIX
+
+
+def stored_path(stored_filename: str) -> str:
+    """UPLOAD_DIR 下的本機路徑"""
+    return os.path.join(settings.UPLOAD_DIR, stored_filename)
+
+
+class ObjectStat(NamedTuple):
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    """儲存後端；key 為相對路徑（例如 blobs/ab/<sha256>.fcs），內容寫入後不再修改"""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        """物件不存在時回傳 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, key: str, size: Optional[int] = None) -> RandomAccessReader:
+        """開啟隨機讀取的 reader；size 為已知的物件大小（省去一次查詢），物件不存在時拋出 FileNotFoundError"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def local_path(self, key: str) -> str:
+        """可以 memory map 的本機路徑（物件儲存會先完整下載到 read-through cache）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_file(self, path: str, key: str) -> None:
+        """把本機檔案存為 key；完成後 path 不再存在（rename，或上傳後移入 cache）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, key: str) -> None:
+        """刪除物件，不存在時不做任何事"""
+        raise NotImplementedError
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class LocalBackend(StorageBackend):
+    """UPLOAD_DIR 下的本機檔案（api 與 worker container 以 bind mount 共用）"""
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            st = os.stat(stored_path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectStat(st.st_size, st.st_mtime)
+
+    def open(self, key: str, size: Optional[int] = None) -> RandomAccessReader:
+        return LocalFileReader(stored_path(key))
+
+    def local_path(self, key: str) -> str:
+        path = stored_path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def put_file(self, path: str, key: str) -> None:
+        # 暫存檔與 UPLOAD_DIR 位於同一檔案系統，atomic rename 不需要複製
+        final_path = stored_path(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(path, final_path)
+
+    def remove(self, key: str) -> None:
+        _remove(stored_path(key))
+
+
+_backend = None
+
+
+def get_backend() -> StorageBackend:
+    """依 STORAGE_BACKEND 建立，同一個 process 共用（S3 client 與其 connection pool 可跨 thread 使用）"""
+    global _backend
+    if _backend is None:
+        if settings.STORAGE_BACKEND == "local":
+            _backend = LocalBackend()
+        elif settings.STORAGE_BACKEND == "s3":
+            # boto3 只在使用 S3 時才需要
+            from app.core.storage_s3 import S3Backend
+
+            _backend = S3Backend.from_settings()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND!r}")
+    return _backend
+
+
+def place_file(temp_path: str, key: str) -> None:
+    """把本機暫存檔放到 key（本機為 atomic rename，物件儲存為 multipart 上傳）"""
+    get_backend().put_file(temp_path, key)
+
+
+class StoredObject(NamedTuple):
+    key: str
+    compressed: bool
+    size: int
+    mtime: float
+
+
+def resolve_stored(key: str) -> StoredObject:
+    """實際存在的版本；原始檔優先（壓縮完成前兩者可能同時存在），都不存在時拋出 FileNotFoundError"""
+    backend = get_backend()
+    for candidate, compressed in ((key, False), (compressed_key(key), True)):
+        st = backend.stat(candidate)
+        if st is not None:
+            return StoredObject(candidate, compressed, st.size, st.mtime)
+    raise FileNotFoundError(key)
+
+
+def open_stored(key: str) -> RandomAccessReader:
+    """以可 seek 的 file object 開啟儲存的檔案，壓縮檔只在讀取時解壓需要的 frame"""
+    backend = get_backend()
+    try:
+        stored = resolve_stored(key)
+        reader = backend.open(stored.key, stored.size)
+    except FileNotFoundError:
+        # 背景壓縮可能剛好在查詢與開啟之間刪除原始檔，重新查詢一次
+        stored = resolve_stored(key)
+        reader = backend.open(stored.key, stored.size)
+    return SeekableZstdReader(reader) if stored.compressed else reader
+
+
+def blob_exists(key: str) -> bool:
+    try:
+        resolve_stored(key)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def remove_stored(key: str) -> None:
+    """刪除儲存的檔案（包含壓縮後的版本）"""
+    backend = get_backend()
+    backend.remove(key)
+    backend.remove(compressed_key(key))
+
+
+def remove_stored_dir(key: str) -> None:
+    """刪除本機的快取目錄（預覽）"""
+    shutil.rmtree(stored_path(key), ignore_errors=True)
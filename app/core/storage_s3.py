@@ -0,0 +1,341 @@
+# core/storage_s3.py
+"""S3 相容物件儲存（AWS S3、MinIO）：multipart 並行上傳、Range GET 隨機讀取與本機 read-through cache"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app.core.config import settings
+from app.core.readers import LocalFileReader, RandomAccessReader
+from app.core.storage import CACHE_DIR, ObjectStat, StorageBackend, stored_path
+
+logger = logging.getLogger(__name__)
+
+# S3 multipart 上傳除最後一個 part 外的最小大小，以及 part 數上限
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# 追蹤讀取次數的 key 數上限（判斷 hot object 用）
+TRACKED_KEYS = 10000
+_NOT_FOUND = {"404", "NoSuchKey", "NotFound"}
+
+
+def _not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in _NOT_FOUND
+
+
+class ReadThroughCache:
+    """物件在本機磁碟上的副本，總大小超過上限時依最近使用時間淘汰
+
+    最近使用時間以 os.utime 明確寫入 atime（不受 noatime 掛載選項影響）；物件內容不可變，副本不需要失效
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        try:
+            st = os.stat(path)
+            os.utime(path, (time.time(), st.st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_file(self) -> str:
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".fetch-", suffix=".part")
+        os.close(fd)
+        return temp_path
+
+    def add(self, temp_path: str, key: str) -> str:
+        """把已寫完的本機檔案移入 cache（與 cache 位於同一檔案系統）"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+
+    def remove(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """超過容量時依 atime 由舊到新刪除，回傳刪除的檔案數；已開啟的檔案（memory map）不受影響"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for atime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+class S3ObjectReader(RandomAccessReader):
+    """以 Range GET 隨機讀取物件
+
+    小範圍的讀取（HEADER/TEXT、seek table、zstd frame、下載的每個 chunk）對齊到 block_size 並保留最後一個 block，
+    循序或相鄰的讀取不需要再發出 request
+    """
+
+    def __init__(self, backend: "S3Backend", key: str, size: int, block_size: int):
+        super().__init__()
+        self.backend = backend
+        self.key = key
+        self.size = size
+        self.block_size = block_size
+        self._block_start = 0
+        self._block = b""
+
+    def _get(self, start: int, end: int) -> bytes:
+        try:
+            response = self.backend.client.get_object(
+                Bucket=self.backend.bucket,
+                Key=self.backend.object_key(self.key),
+                Range=f"bytes={start}-{end - 1}",
+            )
+        except ClientError as e:
+            if _not_found(e):
+                raise FileNotFoundError(self.key) from e
+            raise
+        with response["Body"] as body:
+            return body.read()
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b""
+        block_end = self._block_start + len(self._block)
+        if self._block_start <= offset and end <= block_end:
+            return self._block[offset - self._block_start:end - self._block_start]
+        start = offset - offset % self.block_size
+        if end - start > self.block_size:
+            # 跨越多個 block 的大範圍讀取直接取回
+            return self._get(offset, end)
+        self._block_start = start
+        self._block = self._get(start, min(start + self.block_size, self.size))
+        return self._block[offset - start:end - start]
+
+    def close(self) -> None:
+        self._block = b""
+        super().close()
+
+
+class S3Backend(StorageBackend):
+    """S3 相容物件儲存；同一個 process 共用一個 client（connection pool 大小為 max_pool_connections）
+
+    - put_file：超過 part_size 的檔案以 multipart 上傳，同一個檔案最多 concurrency 個 part 同時 PUT
+    - open：本機 cache 有副本時直接讀取，否則以 Range GET 讀取；同一個 process 讀取 hot_reads 次以上的物件在背景複製到 cache
+    - local_path：需要 memory map 的讀取（event、sidecar、背景壓縮）以多個並行 Range GET 下載到 cache
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        prefix: str,
+        cache: ReadThroughCache,
+        part_size: int,
+        concurrency: int,
+        read_block_size: int,
+        hot_reads: int,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+        self.read_block_size = read_block_size
+        self.hot_reads = hot_reads
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = concurrency
+        self._reads: OrderedDict = OrderedDict()
+        self._fetching = set()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s3-cache-fill")
+
+    @classmethod
+    def from_settings(cls) -> "S3Backend":
+        if not settings.S3_BUCKET:
+            raise ValueError("S3_BUCKET is required when STORAGE_BACKEND=s3")
+        client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION or None,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+            config=Config(
+                max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 5, "mode": "standard"},
+                s3={"addressing_style": settings.S3_ADDRESSING_STYLE},
+            ),
+        )
+        backend = cls(
+            client,
+            settings.S3_BUCKET,
+            settings.S3_PREFIX,
+            ReadThroughCache(stored_path(CACHE_DIR), settings.STORAGE_CACHE_MB * 1024 * 1024),
+            part_size=settings.S3_PART_SIZE_MB * 1024 * 1024,
+            concurrency=settings.S3_CONCURRENCY,
+            read_block_size=settings.S3_READ_BLOCK_MB * 1024 * 1024,
+            hot_reads=settings.STORAGE_CACHE_HOT_READS,
+        )
+        if settings.S3_CREATE_BUCKET:
+            backend.ensure_bucket()
+        return backend
+
+    def ensure_bucket(self) -> None:
+        """bucket 不存在時建立（本機 MinIO / 測試用）"""
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if not _not_found(e):
+                raise
+            self.client.create_bucket(Bucket=self.bucket)
+            logger.info(f"Created bucket {self.bucket}")
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key.replace(os.sep, "/")
+
+    def _transfer_config(self, size: int) -> TransferConfig:
+        # part 數不能超過 10000，特別大的檔案自動放大 part
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        return TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=self.concurrency,
+        )
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        # 一律查詢 bucket：cache 的副本可能屬於其他 node 已刪除的物件，上傳時判斷 blob 是否存在必須以 bucket 為準
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if _not_found(e):
+                return None
+            raise
+        return ObjectStat(head["ContentLength"], head["LastModified"].timestamp())
+
+    def open(self, key: str, size: Optional[int] = None) -> RandomAccessReader:
+        path = self.cache.get(key)
+        if path is not None:
+            try:
+                return LocalFileReader(path)
+            except FileNotFoundError:
+                # 剛好被淘汰
+                pass
+        if size is None:
+            st = self.stat(key)
+            if st is None:
+                raise FileNotFoundError(key)
+            size = st.size
+        self._record_read(key)
+        return S3ObjectReader(self, key, size, self.read_block_size)
+
+    def _record_read(self, key: str) -> None:
+        if self.hot_reads <= 0:
+            return
+        with self._lock:
+            count = self._reads.pop(key, 0) + 1
+            self._reads[key] = count
+            if len(self._reads) > TRACKED_KEYS:
+                self._reads.popitem(last=False)
+            if count < self.hot_reads or key in self._fetching:
+                return
+            self._fetching.add(key)
+            del self._reads[key]
+        self._background.submit(self._fill, key)
+
+    def _fill(self, key: str) -> None:
+        try:
+            self.local_path(key)
+        except Exception as e:
+            logger.warning(f"Failed to cache {key}: {e}")
+        finally:
+            with self._lock:
+                self._fetching.discard(key)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def local_path(self, key: str) -> str:
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        # 同一個物件同時只下載一次，其他 thread 等待後直接使用
+        lock = self._key_lock(key)
+        with lock:
+            try:
+                path = self.cache.get(key)
+                if path is not None:
+                    return path
+                st = self.stat(key)
+                if st is None:
+                    raise FileNotFoundError(key)
+                temp_path = self.cache.temp_file()
+                try:
+                    self.client.download_file(
+                        self.bucket, self.object_key(key), temp_path, Config=self._transfer_config(st.size)
+                    )
+                    return self.cache.add(temp_path, key)
+                except ClientError as e:
+                    if _not_found(e):
+                        raise FileNotFoundError(key) from e
+                    raise
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def put_file(self, path: str, key: str) -> None:
+        size = os.path.getsize(path)
+        self.client.upload_file(path, self.bucket, self.object_key(key), Config=self._transfer_config(size))
+        # 剛上傳的內容通常很快會被讀取（metadata、統計），直接成為 cache 的副本
+        try:
+            self.cache.add(path, key)
+        except OSError:
+            # 暫存檔與 cache 不在同一個檔案系統
+            os.remove(path)
+
+    def remove(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        self.cache.remove(key)
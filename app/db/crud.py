@@ -1,9 +1,27 @@
+import json
+from collections import Counter
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
-from app.db.models import ActivityLog, FileInfo, TaskRecord, User
-from sqlalchemy import select
+from app.core.storage import preview_dir_key, remove_stored, remove_stored_dir, sidecar_key
+from app.db.models import ActivityLog, Blob, FileChannel, FileInfo, TaskRecord, User, UserUsage
+from sqlalchemy import (
+    DateTime,
+    Text,
+    and_,
+    bindparam,
+    delete,
+    func,
+    insert,
+    select,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
 
 # user
 async def create_user(db: AsyncSession, email: str, hashed_password: str) -> User:
@@ -17,37 +35,471 @@ async def get_user_by_email(db: AsyncSession, email: str):
     q = await db.execute(select(User).where(User.email == email))
     return q.scalars().first()
 
+async def update_user_password(db: AsyncSession, user: User, hashed_password: str) -> User:
+    user.hashed_password = hashed_password
+    db.add(user)
+    await db.commit()
+    return user
+
+# usage
+async def adjust_user_usage(db: AsyncSession, user_id: Optional[int], file_count: int, size_bytes) -> None:
+    """在呼叫端的 transaction 中累加使用者用量（不 commit）；匿名檔案不計"""
+    if user_id is None:
+        return
+    stmt = (
+        pg_insert(UserUsage)
+        .values(user_id=user_id, file_count=file_count, total_size_bytes=size_bytes, updated_at=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={
+                "file_count": UserUsage.file_count + file_count,
+                "total_size_bytes": UserUsage.total_size_bytes + size_bytes,
+                "updated_at": datetime.utcnow(),
+            },
+        )
+    )
+    await db.execute(stmt)
+
+async def get_user_usage(db: AsyncSession, user_id: int) -> dict:
+    """O(1) 讀取使用者用量；尚無用量紀錄時以 COUNT/SUM 計算"""
+    q = await db.execute(
+        select(UserUsage.file_count, UserUsage.total_size_bytes).where(UserUsage.user_id == user_id)
+    )
+    row = q.first()
+    if row is None:
+        return await get_user_storage_totals(db, user_id)
+    return {"total_files": row.file_count, "total_size_bytes": row.total_size_bytes}
+
+async def get_user_storage_totals(db: AsyncSession, user_id: int) -> dict:
+    q = await db.execute(
+        select(func.count(FileInfo.id), func.coalesce(func.sum(FileInfo.size_bytes), 0))
+        .where(FileInfo.owner_id == user_id)
+    )
+    total_files, total_size = q.one()
+    return {"total_files": total_files, "total_size_bytes": total_size}
+
 # file
 async def create_file(db: AsyncSession, **kwargs) -> FileInfo:
     f = FileInfo(**kwargs)
     db.add(f)
+    await adjust_user_usage(db, f.owner_id, 1, f.size_bytes)
+    await db.commit()
+    await db.refresh(f)
+    return f
+
+def build_channels(metadata: dict) -> List[FileChannel]:
+    """由 FCSMetadata.to_dict() 建立每個 channel 的資料列"""
+    return [
+        FileChannel(
+            channel_index=c["index"],
+            pnn=c.get("pnn"),
+            pns=c.get("pns"),
+            pnb=c.get("pnb"),
+            pnr=c.get("pnr"),
+            pne=c.get("pne"),
+        )
+        for c in metadata.get("channels", [])
+    ]
+
+def apply_file_metadata(f: FileInfo, metadata: dict) -> None:
+    f.fcs_version = metadata.get("version") or f.fcs_version
+    f.event_count = metadata.get("tot")
+    f.param_count = metadata.get("par")
+    f.channels = build_channels(metadata)
+    f.metadata_parsed_at = datetime.utcnow()
+
+async def create_file_with_blob(db: AsyncSession, blob_values: dict, metadata: Optional[dict] = None, **kwargs) -> FileInfo:
+    """在同一個 transaction 中增加 blob 參照數（不存在則建立）並建立檔案記錄"""
+    stmt = (
+        pg_insert(Blob)
+        .values(ref_count=1, **blob_values)
+        .on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"ref_count": Blob.ref_count + 1},
+        )
+        .returning(Blob.id, Blob.stored_filename)
+    )
+    blob = (await db.execute(stmt)).one()
+    f = FileInfo(blob_id=blob.id, stored_filename=blob.stored_filename, **kwargs)
+    if metadata is not None:
+        apply_file_metadata(f, metadata)
+    db.add(f)
+    await adjust_user_usage(db, f.owner_id, 1, f.size_bytes)
     await db.commit()
     await db.refresh(f)
     return f
 
+async def create_files_with_blobs(
+    db: AsyncSession,
+    entries: List[Tuple[dict, Optional[dict], dict]],
+    activities: Optional[List[dict]] = None,
+) -> List[FileInfo]:
+    """批次上傳：在單一 transaction 中增加所有 blob 的參照數、建立檔案記錄、累加用量並寫入活動紀錄
+
+    entries 為 (blob_values, metadata, file kwargs)；同一批中相同內容的檔案合併為一次參照數更新
+    """
+    if not entries:
+        return []
+    refs = Counter(blob_values["sha256"] for blob_values, _, _ in entries)
+    unique = {blob_values["sha256"]: blob_values for blob_values, _, _ in entries}
+    # 依 sha256 排序，同時進行的批次以相同順序鎖定 blob row，避免 deadlock
+    stmt = pg_insert(Blob).values([{**unique[sha], "ref_count": refs[sha]} for sha in sorted(unique)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={"ref_count": Blob.ref_count + stmt.excluded.ref_count},
+    ).returning(Blob.id, Blob.sha256, Blob.stored_filename)
+    blobs = {row.sha256: row for row in (await db.execute(stmt)).all()}
+
+    files = []
+    for blob_values, metadata, kwargs in entries:
+        blob = blobs[blob_values["sha256"]]
+        f = FileInfo(blob_id=blob.id, stored_filename=blob.stored_filename, **kwargs)
+        if metadata is not None:
+            apply_file_metadata(f, metadata)
+        files.append(f)
+    db.add_all(files)
+
+    usage = {}
+    for f in files:
+        count, size = usage.get(f.owner_id, (0, 0))
+        usage[f.owner_id] = (count + 1, size + f.size_bytes)
+    for owner_id, (count, size) in usage.items():
+        await adjust_user_usage(db, owner_id, count, size)
+    if activities:
+        await db.execute(insert(ActivityLog), activities)
+    await db.commit()
+    return files
+
+async def delete_file(db: AsyncSession, f: FileInfo) -> None:
+    """刪除檔案記錄；blob 的最後一個參照消失時一併刪除 blob 與實體檔案"""
+    if f.blob_id is None:
+        # 舊格式檔案（未使用 blob）直接刪除
+        stored_filename = f.stored_filename
+        await db.delete(f)
+        await adjust_user_usage(db, f.owner_id, -1, -f.size_bytes)
+        await db.commit()
+        await run_in_threadpool(remove_stored, stored_filename)
+        await run_in_threadpool(remove_stored, sidecar_key(None, stored_filename))
+        await run_in_threadpool(remove_stored_dir, preview_dir_key(None, stored_filename))
+        return
+
+    # 鎖住 blob row，避免同時上傳相同內容時在參照數歸零後誤刪檔案
+    q = await db.execute(select(Blob).where(Blob.id == f.blob_id).with_for_update())
+    blob = q.scalars().first()
+    await db.delete(f)
+    await adjust_user_usage(db, f.owner_id, -1, -f.size_bytes)
+    orphaned = None
+    if blob is not None:
+        blob.ref_count -= 1
+        if blob.ref_count <= 0:
+            await db.execute(delete(Blob).where(Blob.id == blob.id))
+            orphaned = (blob.sha256, blob.stored_filename)
+    await db.commit()
+
+    # 與舊格式相同，commit 成功後才刪除實體檔案，commit 失敗時記錄與檔案都保留
+    if orphaned is None:
+        return
+    sha256, stored_filename = orphaned
+    if await get_blob_by_sha256(db, sha256) is not None:
+        # commit 之後相同內容又被上傳，檔案已由新的 blob 使用
+        return
+    await run_in_threadpool(remove_stored, stored_filename)
+    await run_in_threadpool(remove_stored, sidecar_key(sha256, stored_filename))
+    await run_in_threadpool(remove_stored_dir, preview_dir_key(sha256, stored_filename))
+
 async def get_file_by_slug(db: AsyncSession, slug: str):
-    q = await db.execute(select(FileInfo).where(FileInfo.slug == slug))
+    q = await db.execute(select(FileInfo).options(joinedload(FileInfo.blob)).where(FileInfo.slug == slug))
+    return q.scalars().first()
+
+async def get_file_by_id(db: AsyncSession, file_id: int) -> Optional[FileInfo]:
+    q = await db.execute(select(FileInfo).options(joinedload(FileInfo.blob)).where(FileInfo.id == file_id))
     return q.scalars().first()
 
 async def get_user_files(db: AsyncSession, user_id: int) -> List[FileInfo]:
     q = await db.execute(select(FileInfo).where(FileInfo.owner_id == user_id))
     return q.scalars().all()
 
+async def get_user_files_info(db: AsyncSession, user_id: int) -> List[dict]:
+    """只查詢摘要需要的欄位，不建立 ORM 物件"""
+    files = await db.execute(
+        select(
+            FileInfo.id,
+            FileInfo.original_filename,
+            FileInfo.size_bytes,
+            FileInfo.uploaded_at,
+            FileInfo.fcs_version,
+            FileInfo.is_public,
+            FileInfo.event_count,
+        )
+        .where(FileInfo.owner_id == user_id)
+        .order_by(FileInfo.id)
+    )
+    result = {
+        row.id: {
+            "filename": row.original_filename,
+            "size_bytes": float(row.size_bytes),
+            "uploaded_at": row.uploaded_at,
+            "fcs_version": row.fcs_version,
+            "is_public": row.is_public,
+            "event_count": row.event_count,
+            "pnn": [],
+            "pns": [],
+        }
+        for row in files
+    }
+    if not result:
+        return []
+
+    channels = await db.execute(
+        select(FileChannel.file_id, FileChannel.pnn, FileChannel.pns)
+        .join(FileInfo, FileInfo.id == FileChannel.file_id)
+        .where(FileInfo.owner_id == user_id)
+        .order_by(FileChannel.file_id, FileChannel.channel_index)
+    )
+    for row in channels:
+        info = result.get(row.file_id)
+        if info is not None:
+            info["pnn"].append(row.pnn)
+            info["pns"].append(row.pns)
+    return list(result.values())
+
+async def get_user_file_ids(db: AsyncSession, user_id: int) -> List[int]:
+    q = await db.execute(select(FileInfo.id).where(FileInfo.owner_id == user_id).order_by(FileInfo.id))
+    return q.scalars().all()
+
+async def get_files_with_channels(db: AsyncSession, file_ids: List[int]) -> List[FileInfo]:
+    q = await db.execute(
+        select(FileInfo)
+        .options(selectinload(FileInfo.channels))
+        .where(FileInfo.id.in_(file_ids))
+        .order_by(FileInfo.id)
+    )
+    return q.scalars().all()
+
+async def get_file_with_channels(db: AsyncSession, file_id: int) -> Optional[FileInfo]:
+    q = await db.execute(
+        select(FileInfo)
+        .options(joinedload(FileInfo.blob), selectinload(FileInfo.channels))
+        .where(FileInfo.id == file_id)
+    )
+    return q.scalars().first()
+
+async def get_file_channels(db: AsyncSession, file_id: int) -> List[FileChannel]:
+    q = await db.execute(
+        select(FileChannel).where(FileChannel.file_id == file_id).order_by(FileChannel.channel_index)
+    )
+    return q.scalars().all()
+
+async def get_blob_sibling_with_stats(db: AsyncSession, f: FileInfo) -> Optional[FileInfo]:
+    """相同內容（同一個 blob）且已計算過 channel 統計的其他檔案"""
+    if f.blob_id is None:
+        return None
+    q = await db.execute(
+        select(FileInfo)
+        .options(selectinload(FileInfo.channels))
+        .where(FileInfo.blob_id == f.blob_id, FileInfo.id != f.id, FileInfo.channel_stats_at.is_not(None))
+        .limit(1)
+    )
+    return q.scalars().first()
+
+def channel_stats_dict(c: FileChannel) -> dict:
+    return {
+        "count": c.stat_count,
+        "min": c.stat_min,
+        "max": c.stat_max,
+        "mean": c.stat_mean,
+        "std": c.stat_std,
+        "median": c.stat_median,
+        "percentiles": json.loads(c.stat_percentiles) if c.stat_percentiles else {},
+        "histogram": json.loads(c.stat_histogram) if c.stat_histogram else {"edges": [], "counts": []},
+    }
+
+def apply_channel_stats(f: FileInfo, stats: List[dict]) -> None:
+    """stats 依 channel 順序排列（compute_channel_stats 或 channel_stats_dict 的結果）"""
+    for c, s in zip(f.channels, stats):
+        c.stat_count = s["count"]
+        c.stat_min = s["min"]
+        c.stat_max = s["max"]
+        c.stat_mean = s["mean"]
+        c.stat_std = s["std"]
+        c.stat_median = s["median"]
+        c.stat_percentiles = json.dumps(s["percentiles"])
+        c.stat_histogram = json.dumps(s["histogram"])
+    f.channel_stats_at = datetime.utcnow()
+
+async def get_files_missing_metadata(db: AsyncSession, after_id: int, limit: int) -> List[FileInfo]:
+    """backfill 用：依 id 順序取出尚未寫入 channel 資訊的檔案"""
+    q = await db.execute(
+        select(FileInfo)
+        .options(joinedload(FileInfo.blob), selectinload(FileInfo.channels))
+        .where(FileInfo.metadata_parsed_at.is_(None), FileInfo.id > after_id)
+        .order_by(FileInfo.id)
+        .limit(limit)
+    )
+    return q.scalars().all()
+
+# 列表只查詢需要的欄位
+FILE_LISTING_COLUMNS = (
+    FileInfo.id,
+    FileInfo.slug,
+    FileInfo.original_filename,
+    FileInfo.size_bytes,
+    FileInfo.uploaded_at,
+    FileInfo.fcs_version,
+    FileInfo.is_public,
+    FileInfo.owner_id,
+    FileInfo.event_count,
+)
+
+# LIKE 的跳脫字元
+_LIKE_ESCAPE = "\\"
+
+def channel_match(column, value: str, match: str = "exact", ignore_case: bool = False):
+    """PnN / PnS 的比對條件：exact、prefix 或 contains，可不分大小寫
+
+    非 exact 或不分大小寫時以 LIKE / ILIKE 比對，由 pg_trgm 的 GIN 索引處理（包含開頭不固定的 contains）
+    """
+    if match == "exact" and not ignore_case:
+        return column == value
+    escaped = value
+    for char in (_LIKE_ESCAPE, "%", "_"):
+        escaped = escaped.replace(char, _LIKE_ESCAPE + char)
+    pattern = {"exact": escaped, "prefix": f"{escaped}%", "contains": f"%{escaped}%"}[match]
+    if ignore_case:
+        return column.ilike(pattern, escape=_LIKE_ESCAPE)
+    return column.like(pattern, escape=_LIKE_ESCAPE)
+
+def file_search_filters(
+    pnn: Sequence[str] = (),
+    pns: Sequence[str] = (),
+    match: str = "exact",
+    ignore_case: bool = False,
+    min_events: Optional[int] = None,
+    max_events: Optional[int] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+) -> list:
+    """跨檔案搜尋的條件（搭配 file_listing_query）；每個 PnN / PnS 值各自需要至少一個 channel 符合"""
+    filters = []
+    for column, values in ((FileChannel.pnn, pnn), (FileChannel.pns, pns)):
+        for value in values:
+            filters.append(
+                select(FileChannel.id)
+                .where(FileChannel.file_id == FileInfo.id, channel_match(column, value, match, ignore_case))
+                .exists()
+            )
+    if min_events is not None:
+        filters.append(FileInfo.event_count >= min_events)
+    if max_events is not None:
+        filters.append(FileInfo.event_count <= max_events)
+    if min_size is not None:
+        filters.append(FileInfo.size_bytes >= min_size)
+    if max_size is not None:
+        filters.append(FileInfo.size_bytes <= max_size)
+    if uploaded_after is not None:
+        filters.append(FileInfo.uploaded_at >= uploaded_after)
+    if uploaded_before is not None:
+        filters.append(FileInfo.uploaded_at < uploaded_before)
+    return filters
+
+def file_listing_query(
+    viewer_id: Optional[int],
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    owner_id: Optional[int] = None,
+    is_public: Optional[bool] = None,
+    fcs_version: Optional[str] = None,
+    extra_filters: Sequence = (),
+):
+    """依 (uploaded_at, id) 由新到舊的 keyset 分頁查詢
+
+    可見範圍為「公開檔案」與「viewer 自己的私人檔案」兩個分支，各自以 LIMIT 走索引後再合併，
+    避免 is_public OR owner_id 讓資料庫放棄索引；extra_filters 為額外的條件（例如 file_search_filters）
+    """
+    branches = [FileInfo.is_public == True]
+    if viewer_id is not None:
+        branches.append(and_(FileInfo.owner_id == viewer_id, FileInfo.is_public == False))
+
+    filters = []
+    if after is not None:
+        filters.append(tuple_(FileInfo.uploaded_at, FileInfo.id) < tuple_(*after))
+    if owner_id is not None:
+        filters.append(FileInfo.owner_id == owner_id)
+    if is_public is not None:
+        filters.append(FileInfo.is_public == is_public)
+    if fcs_version is not None:
+        filters.append(FileInfo.fcs_version == fcs_version)
+    filters.extend(extra_filters)
+
+    order = (FileInfo.uploaded_at.desc(), FileInfo.id.desc())
+    selects = [
+        select(*FILE_LISTING_COLUMNS).where(branch, *filters).order_by(*order).limit(limit)
+        for branch in branches
+    ]
+    if len(selects) == 1:
+        return selects[0]
+
+    merged = union_all(*(s.subquery().select() for s in selects)).subquery()
+    return select(merged).order_by(merged.c.uploaded_at.desc(), merged.c.id.desc()).limit(limit)
+
 async def get_public_files(db: AsyncSession) -> List[FileInfo]:
     q = await db.execute(select(FileInfo).where(FileInfo.is_public == True))
     return q.scalars().all()
 
+# blob
+async def get_blob_by_sha256(db: AsyncSession, sha256: str) -> Optional[Blob]:
+    q = await db.execute(select(Blob).where(Blob.sha256 == sha256))
+    return q.scalars().first()
+
+async def get_blobs_by_sha256(db: AsyncSession, sha256s: List[str]) -> List[Blob]:
+    if not sha256s:
+        return []
+    q = await db.execute(select(Blob).where(Blob.sha256.in_(sha256s)))
+    return q.scalars().all()
+
+async def get_blob_by_id(db: AsyncSession, blob_id: int) -> Optional[Blob]:
+    q = await db.execute(select(Blob).where(Blob.id == blob_id))
+    return q.scalars().first()
+
+async def get_uncompressed_blob_ids(db: AsyncSession, after_id: int, limit: int) -> List[int]:
+    """尚未經過背景壓縮的 blob，依 id 分頁"""
+    q = await db.execute(
+        select(Blob.id).where(Blob.compressed_at.is_(None), Blob.id > after_id).order_by(Blob.id).limit(limit)
+    )
+    return q.scalars().all()
+
+async def set_blob_compression(db: AsyncSession, blob_id: int, **values) -> bool:
+    """記錄壓縮結果；blob 已被刪除或已由其他任務處理時回傳 False"""
+    result = await db.execute(
+        update(Blob)
+        .where(Blob.id == blob_id, Blob.compressed_at.is_(None))
+        .values(compressed_at=datetime.utcnow(), **values)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
 # log
 async def get_user_activities(db: AsyncSession, user_id: int) -> List[ActivityLog]:
     q = await db.execute(select(ActivityLog).where(ActivityLog.user_id == user_id).order_by(ActivityLog.timestamp.desc()))
     return q.scalars().all()
 
-async def create_activity_log(db: AsyncSession, **kwargs) -> ActivityLog:
-    log = ActivityLog(**kwargs)
-    db.add(log)
+async def create_activity_logs(db: AsyncSession, rows: List[dict]) -> None:
+    """批次寫入活動紀錄（executemany，由 driver 合併成多列 INSERT）"""
+    await db.execute(insert(ActivityLog), rows)
     await db.commit()
-    await db.refresh(log)
-    return log
+
+async def create_task_record(db: AsyncSession, task_id: str) -> TaskRecord:
+    t = TaskRecord(task_id=task_id, status='pending')
+    db.add(t)
+    await db.commit()
+    await db.refresh(t)
+    return t
+
+async def get_task_record(db: AsyncSession, task_id: str) -> Optional[TaskRecord]:
+    q = await db.execute(select(TaskRecord).where(TaskRecord.task_id == task_id))
+    return q.scalars().first()
 
 async def update_task_status(db: AsyncSession, task_id: str, status: str, result: str = None):
     q = await db.execute(select(TaskRecord).where(TaskRecord.task_id == task_id))
@@ -61,4 +513,19 @@ async def update_task_status(db: AsyncSession, task_id: str, status: str, result
     db.add(t)
     await db.commit()
     await db.refresh(t)
-    return t
\ No newline at end of file
+    return t
+
+async def update_task_statuses(db: AsyncSession, rows: List[dict]) -> None:
+    """批次更新任務狀態；rows 的 key 為 b_task_id、b_status、b_result、b_finished_at（None 代表不變更）"""
+    tasks = TaskRecord.__table__
+    stmt = (
+        update(tasks)
+        .where(tasks.c.task_id == bindparam("b_task_id"))
+        .values(
+            status=bindparam("b_status"),
+            result=func.coalesce(bindparam("b_result", type_=Text), tasks.c.result),
+            finished_at=func.coalesce(bindparam("b_finished_at", type_=DateTime), tasks.c.finished_at),
+        )
+    )
+    await db.execute(stmt, rows)
+    await db.commit()
@@ -1,14 +1,19 @@
 from datetime import datetime
 
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
+    event,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -23,19 +28,104 @@ class User(Base):
     files = relationship('FileInfo', back_populates='owner')
     activities = relationship('ActivityLog', back_populates='user')
 
+class Blob(Base):
+    __tablename__ = 'blobs'
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    stored_filename = Column(String, nullable=False)
+    size_bytes = Column(Numeric, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    fcs_version = Column(String, nullable=True)
+    fcs_metadata = Column(Text, nullable=True)  # FCSMetadata.to_dict() 的 JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # 背景壓縮：NULL 代表尚未處理，"zstd-seekable" 或 "none"（壓縮比太低，保留原始檔）
+    compression = Column(String, nullable=True)
+    stored_size_bytes = Column(BigInteger, nullable=True)  # 磁碟上的實際大小
+    decompress_mb_per_s = Column(Float, nullable=True)  # 壓縮後驗證時量測的解壓速度
+    compressed_at = Column(DateTime, nullable=True)
+
+    files = relationship('FileInfo', back_populates='blob')
+
 class FileInfo(Base):
     __tablename__ = 'files'
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    blob_id = Column(Integer, ForeignKey('blobs.id'), nullable=True, index=True)
     original_filename = Column(String, nullable=False)
-    stored_filename = Column(String, nullable=False, unique=True)
+    # 相同內容的檔案共用同一個 blob，因此不再是 unique
+    stored_filename = Column(String, nullable=False)
     size_bytes = Column(Numeric, nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     fcs_version = Column(String, nullable=True)
     is_public = Column(Boolean, default=True)
     slug = Column(String, unique=True, index=True, nullable=False)
+    event_count = Column(BigInteger, nullable=True)  # $TOT
+    param_count = Column(Integer, nullable=True)  # $PAR
+    metadata_parsed_at = Column(DateTime, nullable=True)  # NULL 代表尚未寫入 channel 資訊（待 backfill）
+    channel_stats_at = Column(DateTime, nullable=True)  # NULL 代表尚未計算每個 channel 的統計
 
     owner = relationship('User', back_populates='files')
+    blob = relationship('Blob', back_populates='files')
+    channels = relationship(
+        'FileChannel',
+        back_populates='file',
+        order_by='FileChannel.channel_index',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+    )
+
+    # 列表以 (uploaded_at, id) 做 keyset 分頁：公開檔案與個人檔案各自走一條索引；搜尋的 $TOT 與大小範圍條件走 B-tree
+    __table_args__ = (
+        Index('ix_files_is_public_uploaded_at_id', 'is_public', 'uploaded_at', 'id'),
+        Index('ix_files_owner_id_uploaded_at_id', 'owner_id', 'uploaded_at', 'id'),
+        Index('ix_files_event_count', 'event_count'),
+        Index('ix_files_size_bytes', 'size_bytes'),
+    )
+
+class FileChannel(Base):
+    __tablename__ = 'file_channels'
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey('files.id', ondelete='CASCADE'), nullable=False)
+    channel_index = Column(Integer, nullable=False)  # 1-based，對應 $Pn 的 n
+    pnn = Column(String, nullable=True)
+    pns = Column(String, nullable=True)
+    pnb = Column(Integer, nullable=True)
+    pnr = Column(String, nullable=True)
+    pne = Column(String, nullable=True)
+    # 每個 channel 的摘要統計（背景任務計算）
+    stat_count = Column(BigInteger, nullable=True)
+    stat_min = Column(Float, nullable=True)
+    stat_max = Column(Float, nullable=True)
+    stat_mean = Column(Float, nullable=True)
+    stat_std = Column(Float, nullable=True)
+    stat_median = Column(Float, nullable=True)
+    stat_percentiles = Column(Text, nullable=True)  # {"1": ..., "99": ...} 的 JSON
+    stat_histogram = Column(Text, nullable=True)  # {"edges": [...], "counts": [...]} 的 JSON
+
+    file = relationship('FileInfo', back_populates='channels')
+
+    __table_args__ = (
+        Index('ix_file_channels_file_id_channel_index', 'file_id', 'channel_index', unique=True),
+        Index('ix_file_channels_pnn', 'pnn'),
+        # 搜尋的 prefix / contains / 不分大小寫比對（LIKE、ILIKE）由 pg_trgm 的 GIN 索引處理
+        Index('ix_file_channels_pnn_trgm', 'pnn', postgresql_using='gin', postgresql_ops={'pnn': 'gin_trgm_ops'}),
+        Index('ix_file_channels_pns_trgm', 'pns', postgresql_using='gin', postgresql_ops={'pns': 'gin_trgm_ops'}),
+    )
+
+# create_all 建立 trigram 索引前需要 pg_trgm extension（SQLite 略過）
+event.listen(
+    FileChannel.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
+class UserUsage(Base):
+    """每個使用者的檔案數與總大小，隨上傳、刪除在同一個 transaction 中更新"""
+    __tablename__ = 'user_usage'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    file_count = Column(BigInteger, nullable=False, default=0)
+    total_size_bytes = Column(Numeric, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class TaskRecord(Base):
     __tablename__ = 'tasks'
@@ -2,8 +2,9 @@ from typing import Optional
 
 from app.core.config import settings
 from app.core.database import get_db
-from app.db.crud import get_user_by_email
-from app.db.models import User
+from app.core.security import principal_cache
+from app.db.crud import get_file_by_slug, get_user_by_email
+from app.db.models import FileInfo, User
 from fastapi import Depends, HTTPException, status
 from fastapi.security import (
     HTTPAuthorizationCredentials,
@@ -15,12 +16,27 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 oauth2_scheme  = HTTPBearer(auto_error=False)
 
+async def get_user_principal(db: AsyncSession, email: str) -> Optional[User]:
+    """先查快取，未命中才查詢資料庫；快取的是已從 session 分離的 User"""
+    user = principal_cache.get(email)
+    if user is not None:
+        return user
+    user = await get_user_by_email(db, email=email)
+    if user is not None:
+        db.expunge(user)
+        principal_cache.set(email, user)
+    # 驗證在讀取 request body 之前執行，結束查詢開啟的 transaction，串流上傳期間不佔住連線
+    await db.rollback()
+    return user
+
 async def get_current_user(token: str = Depends(oauth2_scheme ), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if token is None:
+        raise credentials_exception
     try:
         token_str = token.credentials  # HTTPBearer 會回傳帶有 credentials 屬性的物件
         payload = jwt.decode(token_str, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -30,7 +46,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme ), db: AsyncSessio
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_email(db, email=email)
+    user = await get_user_principal(db, email)
     if user is None:
         raise credentials_exception
     return user
@@ -51,5 +67,18 @@ async def get_current_user_optional(
     except JWTError:
         return None
 
-    user = await get_user_by_email(db, email=email)
-    return user
\ No newline at end of file
+    user = await get_user_principal(db, email)
+    return user
+
+async def get_readable_file(db: AsyncSession, slug: str, current_user: Optional[User]) -> FileInfo:
+    """取得檔案記錄並檢查讀取權限：私人檔案僅限擁有者"""
+    file_record = await get_file_by_slug(db, slug)
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if not file_record.is_public:
+        if not current_user:
+            raise HTTPException(status_code=403, detail="Please login")
+        if current_user.id != file_record.owner_id:
+            raise HTTPException(status_code=403, detail="Only file owner can access this file")
+    return file_record
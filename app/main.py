@@ -1,11 +1,32 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
-from app.api.routers import router
+from app.api.routers.router import router
+from app.api.task_events import task_event_hub
+from app.core.activity_log import activity_log_writer
+from app.core.metrics import CountersCollector, MetricsMiddleware, register_collector
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    activity_log_writer.start()
+    yield
+    # 關閉前寫入尚未 flush 的活動紀錄
+    await activity_log_writer.stop()
+    await task_event_hub.stop()
+
 
 app = FastAPI(
     title="AHEAD Take Home Project",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
-app.include_router(router)
\ No newline at end of file
+app.add_middleware(MetricsMiddleware)
+app.include_router(router)
+
+register_collector(CountersCollector(
+    "activity_log_writer", "Activity log writer queue and flush counters", lambda: activity_log_writer.counters
+))
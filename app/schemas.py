@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -16,6 +16,10 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class PasswordChange(BaseModel):
+    old_password: str
+    new_password: str
+
 class UserOut(BaseModel):
     id: int
     email: EmailStr
@@ -24,11 +28,51 @@ class UserOut(BaseModel):
         orm_mode = True
 
 class FileUploadResponse(BaseModel):
+    short_link: str
     filename: str
     size: float
     uploaded_at: datetime = datetime.utcnow()
     fcs_version: Optional[str]
     is_public: bool
     owner_id: Optional[int]
+    sha256: Optional[str] = None
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class BatchUploadItem(BaseModel):
+    filename: str
+    ok: bool
+    error: Optional[str] = None
+    file: Optional[FileUploadResponse] = None
+
+class BatchUploadResponse(BaseModel):
+    created: int
+    failed: int
+    items: List[BatchUploadItem]
+
+class TaskCreateResp(BaseModel):
+    task_id: str
+    status: str
+    result: Optional[Any] = None
+
+class TaskStatus(BaseModel):
+    task_id: str
+    status: str
+    result: Optional[Any] = None
+    progress: Optional[Dict[str, int]] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size_bytes: int
+    is_public: bool = True
+    chunk_size: Optional[int] = None
+
+class UploadSessionStatus(BaseModel):
+    session_id: str
+    filename: str
+    size_bytes: int
+    chunk_size: int
+    total_chunks: int
+    expires_at: datetime
+    received: List[int] = []
+    missing: List[int] = []
@@ -0,0 +1,99 @@
+"""每個 channel 的摘要統計：以固定大小的 chunk 做向量化計算，記憶體用量與檔案大小無關"""
+from typing import Iterator, List
+
+import numpy as np
+from numpy.lib import recfunctions
+
+from app.api.fcs_events import CHUNK_ROWS, FCSEventData
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+HISTOGRAM_BINS = 256
+# 百分位數由細分的 histogram 內插，誤差不超過 (max - min) / FINE_BINS
+FINE_BINS = HISTOGRAM_BINS * 32
+
+
+def _float_chunks(events: np.ndarray, chunk_rows: int) -> Iterator[np.ndarray]:
+    for i in range(0, len(events), chunk_rows):
+        yield recfunctions.structured_to_unstructured(events[i:i + chunk_rows], dtype=np.float64)
+
+
+def _empty(name: str) -> dict:
+    return {
+        "name": name, "count": 0, "min": None, "max": None, "mean": None, "std": None,
+        "median": None, "percentiles": {}, "histogram": {"edges": [], "counts": []},
+    }
+
+
+def _percentile(hist: np.ndarray, cdf: np.ndarray, lo: float, width: float, q: float) -> float:
+    target = q / 100 * cdf[-1]
+    b = min(int(np.searchsorted(cdf, target, side="left")), len(hist) - 1)
+    before = cdf[b - 1] if b > 0 else 0
+    frac = (target - before) / hist[b] if hist[b] else 0.0
+    return float(lo + (b + frac) * width)
+
+
+def compute_channel_stats(data: FCSEventData, chunk_rows: int = CHUNK_ROWS) -> List[dict]:
+    """兩次掃描：第一次計算 count/min/max/mean/std，第二次以 bincount 建立所有 channel 的 histogram"""
+    names = data.channel_names
+    k = len(names)
+    events = data.events
+
+    # 第一次：逐 chunk 合併平均值與平方差（Chan et al.），避免大量資料時的數值誤差
+    count = np.zeros(k, dtype=np.int64)
+    mean = np.zeros(k)
+    m2 = np.zeros(k)
+    lo = np.full(k, np.inf)
+    hi = np.full(k, -np.inf)
+    for chunk in _float_chunks(events, chunk_rows):
+        finite = np.isfinite(chunk)
+        n = finite.sum(axis=0)
+        values = np.where(finite, chunk, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            chunk_mean = np.where(n > 0, values.sum(axis=0) / n, 0.0)
+        chunk_m2 = (np.where(finite, chunk - chunk_mean, 0.0) ** 2).sum(axis=0)
+        total = count + n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = chunk_mean - mean
+            mean = np.where(total > 0, mean + delta * n / total, 0.0)
+            m2 = m2 + chunk_m2 + np.where(total > 0, delta ** 2 * count * n / total, 0.0)
+        count = total
+        lo = np.minimum(lo, np.where(finite, chunk, np.inf).min(axis=0))
+        hi = np.maximum(hi, np.where(finite, chunk, -np.inf).max(axis=0))
+
+    valid = count > 0
+    width = np.where(valid & (hi > lo), (hi - lo) / FINE_BINS, 1.0)
+    base = np.where(valid, lo, 0.0)
+
+    # 第二次：所有 channel 的 bin index 加上 channel 位移後一次 bincount
+    hist = np.zeros(k * FINE_BINS, dtype=np.int64)
+    offsets = np.arange(k) * FINE_BINS
+    for chunk in _float_chunks(events, chunk_rows):
+        finite = np.isfinite(chunk)
+        idx = np.floor((np.where(finite, chunk, base) - base) / width).astype(np.int64)
+        np.clip(idx, 0, FINE_BINS - 1, out=idx)
+        hist += np.bincount((idx + offsets)[finite], minlength=k * FINE_BINS)
+    hist = hist.reshape(k, FINE_BINS)
+
+    results = []
+    for i, name in enumerate(names):
+        if not valid[i]:
+            results.append(_empty(name))
+            continue
+        cdf = np.cumsum(hist[i])
+        percentiles = {
+            str(q): min(max(_percentile(hist[i], cdf, lo[i], width[i], q), lo[i]), hi[i]) for q in PERCENTILES
+        }
+        coarse = hist[i].reshape(HISTOGRAM_BINS, -1).sum(axis=1)
+        edges = lo[i] + np.arange(HISTOGRAM_BINS + 1) * width[i] * (FINE_BINS // HISTOGRAM_BINS)
+        results.append({
+            "name": name,
+            "count": int(count[i]),
+            "min": float(lo[i]),
+            "max": float(hi[i]),
+            "mean": float(mean[i]),
+            "std": float(np.sqrt(m2[i] / count[i])),
+            "median": percentiles["50"],
+            "percentiles": percentiles,
+            "histogram": {"edges": edges.tolist(), "counts": coarse.tolist()},
+        })
+    return results
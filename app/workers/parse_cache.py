@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+from app.core.cache import get_sync_redis
+from app.core.storage import resolve_stored
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "fcs:parse:"
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+
+def cache_key(f) -> Optional[str]:
+    """blob 以內容 hash 為 key；舊格式檔案以儲存後端回報的 key + size + mtime 判斷是否變更"""
+    if f.blob_id is not None and f.stored_filename.startswith("blobs/"):
+        return CACHE_PREFIX + os.path.splitext(os.path.basename(f.stored_filename))[0]
+    try:
+        # 經由 StorageBackend 查詢（S3 時為 HEAD），不依賴本機路徑；壓縮後 key 與大小改變，重新解析一次
+        stored = resolve_stored(f.stored_filename)
+    except OSError:
+        return None
+    return f"{CACHE_PREFIX}{stored.key}:{stored.size}:{stored.mtime}"
+
+
+class ParseCache:
+    """以 Redis 保存每個檔案的 HEADER/TEXT 解析結果，重複的統計任務只解析新增或變更的檔案"""
+
+    def __init__(self, client=None):
+        self.client = client or get_sync_redis()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, dict]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = self.client.mget(keys)
+        except Exception as e:
+            logger.warning(f"Parse cache unavailable: {e}")
+            return {}
+        return {k: json.loads(v) for k, v in zip(keys, values) if v}
+
+    def set_many(self, entries: Dict[str, dict]) -> None:
+        if not entries:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for k, v in entries.items():
+                pipe.set(k, json.dumps(v), ex=CACHE_TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Parse cache unavailable: {e}")
@@ -0,0 +1,89 @@
+import json
+import time
+from typing import Optional
+
+from app.core.cache import get_sync_redis
+
+PROGRESS_TTL_SECONDS = 24 * 3600
+# 任務狀態事件的 pub/sub channel，API 以 pattern 訂閱全部任務
+EVENT_CHANNEL_PREFIX = "stats:events:"
+TERMINAL_STATUSES = ("finished", "failed")
+
+
+def progress_key(task_id: str) -> str:
+    return f"stats:progress:{task_id}"
+
+
+def event_channel(task_id: str) -> str:
+    return f"{EVENT_CHANNEL_PREFIX}{task_id}"
+
+
+def last_event_key(task_id: str) -> str:
+    return f"stats:last:{task_id}"
+
+
+def publish_task_event(task_id: str, status: str, client=None, **extra) -> None:
+    """發布任務狀態變化；同時保存最後一次事件，讓晚訂閱的客戶端取得目前狀態"""
+    client = client or get_sync_redis()
+    event = json.dumps({"task_id": task_id, "status": status, **extra}, default=str)
+    pipe = client.pipeline(transaction=False)
+    pipe.set(last_event_key(task_id), event, ex=PROGRESS_TTL_SECONDS)
+    pipe.publish(event_channel(task_id), event)
+    pipe.execute()
+
+
+def start_progress(task_id: str, total: int, client=None) -> None:
+    client = client or get_sync_redis()
+    key = progress_key(task_id)
+    pipe = client.pipeline()
+    pipe.hset(key, mapping={"done": 0, "total": total})
+    pipe.expire(key, PROGRESS_TTL_SECONDS)
+    pipe.execute()
+    publish_task_event(task_id, "running", client=client, progress={"done": 0, "total": total})
+
+
+def advance_progress(task_id: str, done: int, client=None) -> None:
+    client = client or get_sync_redis()
+    key = progress_key(task_id)
+    pipe = client.pipeline()
+    pipe.hincrby(key, "done", done)
+    pipe.hget(key, "total")
+    done_total, total = pipe.execute()
+    publish_task_event(
+        task_id, "running", client=client, progress={"done": int(done_total), "total": int(total or 0)}
+    )
+
+
+def get_progress(task_id: str, client=None) -> Optional[dict]:
+    client = client or get_sync_redis()
+    data = client.hgetall(progress_key(task_id))
+    if not data:
+        return None
+    return {"done": int(data.get("done", 0)), "total": int(data.get("total", 0))}
+
+
+class UserSlots:
+    """每個使用者同時執行的子任務上限（Redis sorted set，逾時的 slot 自動失效）"""
+
+    def __init__(self, user_id: int, limit: int, ttl: int = 600, client=None):
+        self.client = client or get_sync_redis()
+        self.key = f"stats:slots:{user_id}"
+        self.limit = limit
+        self.ttl = ttl
+
+    def acquire(self, token: str) -> bool:
+        now = time.time()
+        pipe = self.client.pipeline()
+        # 清除 worker 當機後遺留的 slot
+        pipe.zremrangebyscore(self.key, 0, now - self.ttl)
+        pipe.zadd(self.key, {token: now})
+        pipe.zrank(self.key, token)
+        pipe.expire(self.key, self.ttl)
+        _, _, rank, _ = pipe.execute()
+        if rank is not None and rank < self.limit:
+            return True
+        self.client.zrem(self.key, token)
+        return False
+
+    def release(self, token: str) -> None:
+        self.client.zrem(self.key, token)
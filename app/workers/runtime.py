@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerLoop:
+    """每個 worker process 一個長駐的 event loop（在背景 thread 中執行）
+
+    所有 coroutine 都在同一個 loop 上執行，async engine 的 connection pool 因此可以跨任務重複使用；
+    threads pool 下多個 Celery thread 同時提交 coroutine，I/O 等待時彼此交錯執行
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="worker-event-loop", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def run(self, coro):
+        """在 loop 上執行 coroutine 並等待結果（由 Celery 的 task thread 呼叫）"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def stop(self) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=10)
+        loop.close()
+
+
+worker_loop = WorkerLoop()
+
+
+def run_async(coro):
+    """在同步的 Celery task 中執行 coroutine"""
+    return worker_loop.run(coro)
+
+
+def reset_after_fork() -> None:
+    """prefork 子 process 不能沿用父 process 的連線與 loop"""
+    engine.sync_engine.dispose(close=False)
+    worker_loop._loop = worker_loop._thread = None
+
+
+def shutdown(flush=None) -> None:
+    """結束前寫入尚未 flush 的資料並關閉連線"""
+    if worker_loop._loop is None:
+        return
+
+    async def _shutdown():
+        if flush is not None:
+            await flush()
+        await engine.dispose()
+
+    try:
+        worker_loop.run(_shutdown())
+    except Exception as e:
+        logger.error(f"Worker shutdown failed: {e}")
+    worker_loop.stop()
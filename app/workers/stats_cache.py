@@ -0,0 +1,78 @@
+import json
+import logging
+from typing import Optional
+
+from app.core.cache import get_async_redis, get_sync_redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# 統計任務在 worker 當機等情況下沒有釋放 in-flight key 時的最長保留時間
+INFLIGHT_TTL_SECONDS = 3600
+RESULT_TTL_SECONDS = 24 * 3600
+
+
+def generation_key(user_id: int) -> str:
+    return f"stats:gen:{user_id}"
+
+
+def inflight_key(user_id: int, generation: int) -> str:
+    return f"stats:inflight:{user_id}:{generation}"
+
+
+def result_key(user_id: int, generation: int) -> str:
+    return f"stats:result:{user_id}:{generation}"
+
+
+async def stats_generation(user_id: int) -> int:
+    """使用者檔案集合的版本號；上傳、刪除、變更公開狀態時遞增，舊版本的快取自然失效"""
+    value = await get_async_redis().get(generation_key(user_id))
+    return int(value or 0)
+
+
+async def invalidate_user_stats(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    try:
+        await get_async_redis().incr(generation_key(user_id))
+    except RedisError as e:
+        # 檔案操作已完成，快取失效失敗不應讓請求失敗
+        logger.warning(f"Failed to invalidate stats cache for user {user_id}: {e}")
+
+
+async def get_cached_stats(user_id: int, generation: int) -> Optional[dict]:
+    value = await get_async_redis().get(result_key(user_id, generation))
+    return json.loads(value) if value else None
+
+
+async def claim_stats_task(user_id: int, generation: int, task_id: str) -> Optional[str]:
+    """登記新的統計任務；同一使用者同一版本已有執行中的任務時回傳該任務的 task_id"""
+    client = get_async_redis()
+    key = inflight_key(user_id, generation)
+    while True:
+        if await client.set(key, task_id, nx=True, ex=INFLIGHT_TTL_SECONDS):
+            return None
+        existing = await client.get(key)
+        # 舊任務剛好在兩次呼叫之間結束時重新登記
+        if existing:
+            return existing
+
+
+async def abandon_stats_task(user_id: int, generation: int) -> None:
+    """任務未能送出時撤銷登記"""
+    await get_async_redis().delete(inflight_key(user_id, generation))
+
+
+def store_stats_result(user_id: int, generation: Optional[int], task_id: str, result: dict) -> None:
+    if generation is None:
+        return
+    pipe = get_sync_redis().pipeline()
+    pipe.set(result_key(user_id, generation), json.dumps({"task_id": task_id, "result": result}, default=str), ex=RESULT_TTL_SECONDS)
+    pipe.delete(inflight_key(user_id, generation))
+    pipe.execute()
+
+
+def release_stats_task(user_id: int, generation: Optional[int]) -> None:
+    if generation is None:
+        return
+    get_sync_redis().delete(inflight_key(user_id, generation))
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.core.database import AsyncSessionLocal
+from app.db.crud import update_task_statuses
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("finished", "failed")
+
+
+class TaskStatusBatcher:
+    """合併多個任務的狀態更新，定期以一次 executemany UPDATE 寫入 tasks 表
+
+    同一任務在一個批次內的多次更新只保留最後狀態；finished/failed 立即寫入，確保結束狀態不會遺失。
+    只能在 worker 的 event loop 上使用
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[str, dict] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def update(self, task_id: str, status: str, result: Optional[str] = None) -> None:
+        row = self._pending.setdefault(task_id, {"b_task_id": task_id, "b_result": None, "b_finished_at": None})
+        row["b_status"] = status
+        if result is not None:
+            row["b_result"] = result
+        if status == "finished":
+            row["b_finished_at"] = datetime.utcnow()
+
+        if status in TERMINAL_STATUSES or len(self._pending) >= self.max_pending:
+            await self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, lambda: loop.create_task(self.flush()))
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            rows, self._pending = list(self._pending.values()), {}
+            try:
+                async with AsyncSessionLocal() as db:
+                    await update_task_statuses(db, rows)
+            except Exception as e:
+                logger.error(f"Failed to write {len(rows)} task status updates: {e}")
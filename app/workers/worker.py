@@ -1,61 +1,510 @@
+import asyncio
+import json
 import logging
 import os
 import re
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
 
+from app.api.fcs import FCSMetadata, FCSParseError, read_stored_metadata
+from app.api.fcs_columnar import build_sidecar, evict_sidecars, file_sidecar_key
+from app.api.fcs_events import open_stored_events
+from app.api.upload_session import gc_expired_sessions
+from app.core.config import settings
+from app.core.cache import REDIS_URL
 from app.core.database import AsyncSessionLocal
-from app.db.crud import get_user_files, update_task_status
-from celery import Celery
+from app.core.metrics import (
+    CELERY_QUEUE_WAIT_SECONDS,
+    CELERY_TASK_SECONDS,
+    STORAGE_COMPRESSION_RATIO,
+    start_metrics_server,
+)
+from app.core.seekable_zstd import SeekableFormatError, compress_file, verify_file
+from app.core.storage import compressed_key, get_backend, place_file, remove_stored
+from app.db.crud import (
+    apply_channel_stats,
+    apply_file_metadata,
+    channel_stats_dict,
+    get_blob_by_id,
+    get_blob_sibling_with_stats,
+    get_file_by_id,
+    get_file_with_channels,
+    get_files_missing_metadata,
+    get_files_with_channels,
+    get_uncompressed_blob_ids,
+    get_user_file_ids,
+    set_blob_compression,
+)
+from app.workers.channel_stats import compute_channel_stats
+from app.workers.parse_cache import ParseCache, cache_key
+from app.workers.progress import (
+    UserSlots,
+    advance_progress,
+    publish_task_event,
+    start_progress,
+)
+from app.workers.runtime import reset_after_fork, run_async, shutdown
+from app.workers.stats_cache import release_stats_task, store_stats_result
+from app.workers.task_status import TaskStatusBatcher
+from celery import Celery, chord, group
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
 
 celery_app = Celery(
     "worker",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=REDIS_URL,
+    backend=REDIS_URL
 )
 
+# 統計任務以 I/O 為主：預設使用 threads pool，同一 process 內的任務共用一個 event loop 與 connection pool
+celery_app.conf.update(
+    worker_pool=settings.CELERY_POOL,
+    worker_concurrency=settings.CELERY_CONCURRENCY,
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    task_acks_late=settings.CELERY_ACKS_LATE,
+    # acks_late 時 worker 當機的任務重新排入 queue
+    task_reject_on_worker_lost=settings.CELERY_ACKS_LATE,
+)
+
+# 定期清除過期的分段上傳 session（worker 需以 --beat 啟動）
+celery_app.conf.beat_schedule = {
+    "cleanup-upload-sessions": {
+        "task": "app.workers.worker.cleanup_upload_sessions",
+        "schedule": 3600.0,
+    },
+    "backfill-file-metadata": {
+        "task": "app.workers.worker.backfill_file_metadata",
+        "schedule": 600.0,
+    },
+    # 儲存壓縮開啟前已存在（或排入失敗）的 blob
+    "compress-stored-blobs": {
+        "task": "app.workers.worker.compress_stored_blobs",
+        "schedule": 3600.0,
+    },
+}
+
 logger = logging.getLogger(__name__)
 
-def bakeground_task() -> dict:
-    """在背景任務中執行的程式碼"""
+task_statuses = TaskStatusBatcher(settings.TASK_STATUS_FLUSH_SECONDS, max_pending=100)
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    reset_after_fork()
+
+@worker_init.connect
+def _start_metrics_server(**kwargs):
+    if settings.WORKER_METRICS_PORT:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+# 任務開始時間，以 task id 對應（threads pool 下多個任務同時執行）
+_task_started: Dict[str, float] = {}
+
+@before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs):
+    # 發佈端（API 或 worker）寫入時間，worker 開始執行時計算排隊時間
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+@task_prerun.connect
+def _task_started_at(task_id=None, task=None, **kwargs):
+    published_at = task.request.get("published_at")
+    if published_at:
+        CELERY_QUEUE_WAIT_SECONDS.labels(task=task.name).observe(max(time.time() - published_at, 0))
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_SECONDS.labels(task=task.name, state=state or "UNKNOWN").observe(time.perf_counter() - started)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_worker(**kwargs):
+    shutdown(task_statuses.flush)
+
+def file_summary(f, metadata: Optional[dict] = None) -> dict:
+    """單一檔案的統計資訊；上傳時已寫入資料庫的欄位直接使用，否則使用解析結果"""
+    summary = {
+        "filename": f.original_filename,
+        "size_bytes": float(f.size_bytes),
+        "uploaded_at": f.uploaded_at.isoformat() if f.uploaded_at else None,
+        "fcs_version": f.fcs_version,
+        "pnn": [c.pnn for c in f.channels],
+        "event_count": f.event_count,
+    }
+    if f.metadata_parsed_at is None and metadata is not None:
+        summary["fcs_version"] = metadata.get("version") or f.fcs_version
+        summary["pnn"] = [c.get("pnn") for c in metadata.get("channels", [])]
+        summary["event_count"] = metadata.get("tot")
+    return summary
+
+def parse_file(f) -> Optional[dict]:
     try:
-        return {"detail": '背景作業完成'}
-    except Exception as e:
-        logger.error(f"Background execution job error: {e}")
-        return {"detail": "背景作業錯誤請查看Log"}
+        return read_stored_metadata(f.stored_filename).to_dict()
+    except (OSError, FCSParseError) as e:
+        logger.warning(f"Cannot read FCS metadata of {f.stored_filename}: {e}")
+        return None
 
-@celery_app.task(bind=True)
-async def compute_stats(self, user_id: int):
-    """計算用戶檔案統計的背景任務"""
-    task_id = self.request.id
-    
+def collect_metadata(files: List, cache: ParseCache) -> Dict[int, dict]:
+    """只解析資料庫中沒有 metadata 且快取未命中的檔案"""
+    pending = [f for f in files if f.metadata_parsed_at is None]
+    if not pending:
+        return {}
+
+    keys = {f.id: cache_key(f) for f in pending}
+    cached = cache.get_many(k for k in keys.values() if k)
+
+    results, misses = {}, {}
+    for f in pending:
+        key = keys[f.id]
+        if key in cached:
+            results[f.id] = cached[key]
+            continue
+        metadata = parse_file(f)
+        if metadata is not None:
+            results[f.id] = metadata
+            if key:
+                misses[key] = metadata
+    cache.set_many(misses)
+    logger.info(f"Parse cache: {len(pending) - len(misses)} hits, {len(misses)} parsed, {len(files) - len(pending)} from database")
+    return results
+
+def summarize(summaries: List[dict]) -> dict:
+    return {
+        "detail": '背景作業完成',
+        "files": summaries,
+        "total_files": len(summaries),
+        "total_size_bytes": sum(s["size_bytes"] for s in summaries),
+    }
+
+def bakeground_task(files: List = ()) -> List[dict]:
+    """在背景任務中執行的程式碼：回傳每個檔案的統計資訊"""
+    metadata = collect_metadata(files, ParseCache())
+    return [file_summary(f, metadata.get(f.id)) for f in files]
+
+async def _summarize_file_ids(file_ids: List[int]) -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        files = await get_files_with_channels(db, file_ids)
+    return await asyncio.to_thread(bakeground_task, files)
+
+async def _finish_stats(task_id: str, user_id: int, summaries: List[dict], generation: Optional[int] = None) -> dict:
+    result = {
+        "id":task_id,
+        "userid": user_id,
+        "taskinfo": summarize(summaries),
+    }
+    await task_statuses.update(task_id, "finished", str(result))
+    publish_task_event(task_id, "finished")
+    # 檔案集合未變更前，相同的請求直接回傳此結果
+    store_stats_result(user_id, generation, task_id, result)
+    logger.info(f"Task {task_id} - finished")
+    return result
+
+async def _compute_stats(task, task_id: str, user_id: int, generation: Optional[int] = None):
+    # 在 worker loop 的 thread 中執行，task.request 是 thread-local，因此明確傳入 task_id
     logger.info(f"Task {task_id} - pending")
-    self.update_state(state="PENDING")
+    task.update_state(task_id=task_id, state="PENDING")
+    
+    # 更新資料庫中的任務狀態（批次寫入）
+    await task_statuses.update(task_id, "pending")
+    publish_task_event(task_id, "pending")
+    
+    logger.info(f"Task {task_id} - running")
+    task.update_state(task_id=task_id, state="RUNNING")
+    await task_statuses.update(task_id, "running")
     
-    # 更新資料庫中的任務狀態
-    db = AsyncSessionLocal()
+    async with AsyncSessionLocal() as db:
+        file_ids = await get_user_file_ids(db, user_id)
+
+    start_progress(task_id, len(file_ids))
+    size = settings.STATS_BATCH_SIZE
+    batches = [file_ids[i:i + size] for i in range(0, len(file_ids), size)]
+    if len(batches) > 1:
+        return batches
+
+    # 檔案不多時直接在此計算，不拆子任務
+    summaries = await _summarize_file_ids(file_ids) if file_ids else []
+    advance_progress(task_id, len(file_ids))
+    task.update_state(task_id=task_id, state="FINISHED")
+    return await _finish_stats(task_id, user_id, summaries, generation)
+
+async def _fail_stats(task_id: str, error: Exception) -> None:
+    await task_statuses.update(task_id, "failed", str({"error": str(error)}))
+    publish_task_event(task_id, "failed", error=str(error))
+
+@celery_app.task(bind=True)
+def compute_stats(self, user_id: int, generation: Optional[int] = None):
+    """計算用戶檔案統計的背景任務；檔案多時拆成多個子任務分散到各 worker 平行處理"""
+    task_id = self.request.id
     try:
-        await update_task_status(db, task_id, "pending")
-        
-        logger.info(f"Task {task_id} - running")
-        self.update_state(state="RUNNING")
-        await update_task_status(db, task_id, "running")
-        
-        task_info = bakeground_task ()
-        result = {
-            "id":task_id,
-            "userid": user_id,
-            "taskinfo": task_info,
-        }
-        
-        logger.info(f"Task {task_id} - finished")
-        self.update_state(state="FINISHED")
-        await update_task_status(db, task_id, "finished", str(result))
-        
-        return result
-        
+        outcome = run_async(_compute_stats(self, task_id, user_id, generation))
     except Exception as e:
         logger.error(f"Task {task_id} failed: {e}")
         self.update_state(state="FAILURE")
-        await update_task_status(db, task_id, "failed", str({"error": str(e)}))
+        run_async(_fail_stats(task_id, e))
+        release_stats_task(user_id, generation)
         raise
+
+    if isinstance(outcome, dict):
+        return outcome
+
+    logger.info(f"Task {task_id} - fan out {len(outcome)} batches")
+    # replace 後 chord callback 沿用原本的 task_id，AsyncResult(task_id) 即為彙整結果
+    return self.replace(chord(
+        group(stats_batch.s(user_id, batch, task_id) for batch in outcome),
+        aggregate_stats.s(task_id, user_id, generation).on_error(stats_failed.s(task_id, user_id, generation)),
+    ))
+
+@celery_app.task(bind=True, max_retries=None)
+def stats_batch(self, user_id: int, file_ids: List[int], parent_id: str) -> List[dict]:
+    """統計子任務：處理一批檔案"""
+    token = self.request.id
+    slots = UserSlots(user_id, settings.STATS_USER_CONCURRENCY)
+    # 同一使用者的子任務超過上限時延後重試，避免單一使用者佔滿整個 queue
+    if not slots.acquire(token):
+        raise self.retry(countdown=settings.STATS_RETRY_SECONDS)
+    try:
+        summaries = run_async(_summarize_file_ids(file_ids))
+        advance_progress(parent_id, len(file_ids))
+        return summaries
     finally:
-        await db.close()
\ No newline at end of file
+        slots.release(token)
+
+@celery_app.task(bind=True)
+def aggregate_stats(self, results: List[List[dict]], task_id: str, user_id: int, generation: Optional[int] = None) -> dict:
+    """彙整所有子任務結果並寫入任務狀態"""
+    summaries = [s for batch in results for s in batch]
+    return run_async(_finish_stats(task_id, user_id, summaries, generation))
+
+@celery_app.task
+def stats_failed(request, exc, traceback, task_id: str, user_id: int, generation: Optional[int] = None) -> None:
+    """子任務失敗時標記整個統計任務失敗，並釋放 in-flight 登記讓使用者可以重新送出"""
+    logger.error(f"Task {task_id} failed: {exc}")
+    run_async(_fail_stats(task_id, exc))
+    release_stats_task(user_id, generation)
+
+def load_metadata(f) -> FCSMetadata:
+    """優先使用 blob 保存的 metadata，舊檔案才重新解析 HEADER/TEXT"""
+    if f.blob is not None and f.blob.fcs_metadata:
+        return FCSMetadata.from_dict(json.loads(f.blob.fcs_metadata))
+    return read_stored_metadata(f.stored_filename)
+
+def _channel_stats_for(f) -> List[dict]:
+    data = open_stored_events(f.stored_filename, load_metadata(f))
+    return compute_channel_stats(data)
+
+async def _compute_file_stats(file_id: int) -> bool:
+    # 讀取後即結束 transaction：掃描整個 DATA 區段（大檔案需要數分鐘）期間不佔住連線
+    async with AsyncSessionLocal() as db:
+        f = await get_file_with_channels(db, file_id)
+        if f is None or f.channel_stats_at is not None:
+            return False
+        # 相同內容的檔案直接沿用已計算的結果
+        sibling = await get_blob_sibling_with_stats(db, f)
+        sibling_stats = [channel_stats_dict(c) for c in sibling.channels] if sibling is not None else None
+
+    metadata = None
+    try:
+        if f.metadata_parsed_at is None:
+            metadata = (await asyncio.to_thread(load_metadata, f)).to_dict()
+        stats = sibling_stats if sibling_stats is not None else await asyncio.to_thread(_channel_stats_for, f)
+    except (OSError, FCSParseError) as e:
+        # 無法解讀的 DATA 區段（例如 ASCII 或非 byte 對齊的 $PnB）標記為已處理，統計值保持空白
+        logger.warning(f"Channel stats skipped for file {file_id}: {e}")
+        stats = []
+
+    # 重新讀取後寫入；計算期間檔案可能已被刪除，或已由其他任務寫入
+    async with AsyncSessionLocal() as db:
+        f = await get_file_with_channels(db, file_id)
+        if f is None or f.channel_stats_at is not None:
+            return False
+        if metadata is not None and f.metadata_parsed_at is None:
+            apply_file_metadata(f, metadata)
+        apply_channel_stats(f, stats)
+        await db.commit()
+    logger.info(f"Computed channel stats for file {file_id}")
+    return True
+
+@celery_app.task
+def compute_file_stats(file_id: int) -> bool:
+    """計算單一檔案每個 channel 的 min/max/mean/median/百分位數/histogram"""
+    return run_async(_compute_file_stats(file_id))
+
+def _build_sidecar_for(f, key: str) -> int:
+    size = build_sidecar(open_stored_events(f.stored_filename, load_metadata(f)), key)
+    evicted = evict_sidecars(settings.COLUMNAR_CACHE_MB * 1024 * 1024)
+    if evicted:
+        logger.info(f"Evicted {evicted} columnar sidecars")
+    return size
+
+async def _build_columnar_sidecar(file_id: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        f = await get_file_by_id(db, file_id)
+    if f is None:
+        return False
+    key = file_sidecar_key(f)
+    # 相同內容的檔案共用 sidecar，重複排入的任務直接略過
+    if await asyncio.to_thread(get_backend().stat, key) is not None:
+        return False
+    try:
+        size = await asyncio.to_thread(_build_sidecar_for, f, key)
+    except (OSError, FCSParseError) as e:
+        logger.warning(f"Columnar sidecar skipped for file {file_id}: {e}")
+        return False
+    logger.info(f"Built columnar sidecar for file {file_id} ({size} bytes)")
+    return True
+
+@celery_app.task
+def build_columnar_sidecar(file_id: int) -> bool:
+    """把 FCS DATA 區段轉為 Parquet sidecar，之後的 event 讀取只需讀取用到的 column"""
+    return run_async(_build_columnar_sidecar(file_id))
+
+def _compress_blob_file(blob) -> Optional[dict]:
+    """壓縮 blob 檔案並完整解壓驗證；壓縮比不足時不保留壓縮檔
+
+    回傳要寫入 blob 的欄位，原始檔已不存在（已壓縮或已刪除）時回傳 None
+    """
+    backend = get_backend()
+    stat = backend.stat(blob.stored_filename)
+    if stat is None:
+        return None
+    # 物件儲存時先完整下載到本機 cache
+    source = backend.local_path(blob.stored_filename)
+    # 上傳後排入的任務與定期補壓縮可能在同一個 process 同時處理同一個 blob，暫存檔名不能只依 blob id
+    fd, temp_path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, prefix=".compress-", suffix=".part")
+    os.close(fd)
+    try:
+        result = compress_file(
+            source,
+            temp_path,
+            settings.STORAGE_COMPRESSION_FRAME_KB * 1024,
+            settings.STORAGE_COMPRESSION_LEVEL,
+        )
+        if result["sha256"] != blob.sha256:
+            raise SeekableFormatError("Stored file does not match the blob sha256")
+        ratio = result["raw_size"] / max(result["stored_size"], 1)
+        if ratio < settings.STORAGE_COMPRESSION_MIN_RATIO:
+            return {"compression": "none", "stored_size_bytes": result["raw_size"]}
+        seconds = verify_file(temp_path, blob.sha256)
+        # 本機儲存時保留原始檔的修改時間，下載的 Last-Modified 不因壓縮而改變（ETag 為 sha256，本來就不變）
+        os.utime(temp_path, (stat.mtime, stat.mtime))
+        place_file(temp_path, compressed_key(blob.stored_filename))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {
+        "compression": "zstd-seekable",
+        "stored_size_bytes": result["stored_size"],
+        "decompress_mb_per_s": result["raw_size"] / (1024 * 1024) / max(seconds, 1e-6),
+    }
+
+async def _compress_blob(blob_id: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        blob = await get_blob_by_id(db, blob_id)
+    # 壓縮與完整解壓驗證（大檔案需要數分鐘）期間不佔住連線
+    if blob is None or blob.compressed_at is not None:
+        return False
+    try:
+        values = await asyncio.to_thread(_compress_blob_file, blob)
+    except (OSError, SeekableFormatError) as e:
+        logger.warning(f"Compression skipped for blob {blob_id}: {e}")
+        return False
+    if values is None:
+        return False
+    async with AsyncSessionLocal() as db:
+        if not await set_blob_compression(db, blob_id, **values):
+            # 壓縮期間 blob 的最後一個檔案被刪除：移除剛寫入的壓縮檔
+            if values["compression"] == "zstd-seekable" and await get_blob_by_id(db, blob_id) is None:
+                await asyncio.to_thread(remove_stored, blob.stored_filename)
+            return False
+    if values["compression"] == "zstd-seekable":
+        # 讀取端優先使用原始檔，DB 更新後才刪除
+        await asyncio.to_thread(get_backend().remove, blob.stored_filename)
+        ratio = float(blob.size_bytes) / values["stored_size_bytes"]
+        STORAGE_COMPRESSION_RATIO.observe(ratio)
+        logger.info(
+            f"Compressed blob {blob_id}: {ratio:.2f}x, decompress {values['decompress_mb_per_s']:.0f} MB/s"
+        )
+    else:
+        logger.info(f"Blob {blob_id} kept uncompressed (ratio below {settings.STORAGE_COMPRESSION_MIN_RATIO})")
+    return True
+
+@celery_app.task
+def compress_blob(blob_id: int) -> bool:
+    """把 blob 轉為 seekable zstd，之後的讀取只解壓需要的 frame"""
+    return run_async(_compress_blob(blob_id))
+
+async def _compress_stored_blobs(batch_size: int) -> int:
+    compressed = 0
+    last_id = 0
+    # 無法壓縮的 blob（檔案遺失等）保持未處理，依 id 往後找，不會卡住後面的 blob
+    while compressed < batch_size:
+        async with AsyncSessionLocal() as db:
+            blob_ids = await get_uncompressed_blob_ids(db, last_id, batch_size)
+        if not blob_ids:
+            break
+        for blob_id in blob_ids:
+            last_id = blob_id
+            if await _compress_blob(blob_id):
+                compressed += 1
+                if compressed >= batch_size:
+                    break
+    return compressed
+
+@celery_app.task
+def compress_stored_blobs(batch_size: Optional[int] = None) -> int:
+    """壓縮尚未處理的既有 blob（每次最多 batch_size 個），可重複執行"""
+    if not settings.STORAGE_COMPRESSION:
+        return 0
+    compressed = run_async(_compress_stored_blobs(batch_size or settings.STORAGE_COMPRESSION_BATCH_SIZE))
+    logger.info(f"Processed {compressed} stored blobs for compression")
+    return compressed
+
+@celery_app.task
+def cleanup_upload_sessions() -> int:
+    """刪除過期的分段上傳 session"""
+    removed = gc_expired_sessions()
+    logger.info(f"Removed {removed} expired upload sessions")
+    return removed
+
+
+async def _backfill_file_metadata(batch_size: int) -> int:
+    updated = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            files = await get_files_missing_metadata(db, last_id, batch_size)
+            if not files:
+                break
+            for f in files:
+                last_id = f.id
+                try:
+                    if f.blob is not None and f.blob.fcs_metadata:
+                        metadata = json.loads(f.blob.fcs_metadata)
+                    else:
+                        metadata = (await asyncio.to_thread(read_stored_metadata, f.stored_filename)).to_dict()
+                except (OSError, ValueError, FCSParseError) as e:
+                    # 讀不到的檔案跳過，下次執行時會再嘗試
+                    logger.warning(f"Backfill skipped file {f.id}: {e}")
+                    continue
+                apply_file_metadata(f, metadata)
+                updated += 1
+            # 每批次 commit 一次，中斷後重新執行會從尚未處理的檔案繼續
+            await db.commit()
+            logger.info(f"Backfilled file metadata up to id {last_id} ({updated} files)")
+    return updated
+
+@celery_app.task
+def backfill_file_metadata(batch_size: int = 500) -> int:
+    """把既有檔案的 $TOT、$PAR 與 channel 資訊補寫進資料庫，可重複執行"""
+    return run_async(_backfill_file_metadata(batch_size))
@@ -0,0 +1,65 @@
+"""比較兩次 benchmark 結果，throughput 下降或 p95 latency 上升超過門檻時以非 0 結束
+
+    python -m bench.compare base.json new.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Optional
+
+
+def _key(result: dict) -> tuple:
+    return result["scenario"], result["concurrency"], result.get("file_size_mb")
+
+
+def _change(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not base or new is None:
+        return None
+    return (new - base) / base * 100
+
+
+def _fmt(value: Optional[float], spec: str = ".4f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def compare(base: dict, new: dict, threshold: float) -> int:
+    base_results = {_key(r): r for r in base["results"]}
+    regressions = 0
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    print(f"{'scenario':8} {'conc':>4} {'size':>6} {'rps base':>10} {'rps new':>10} {'Δ%':>7} {'p95 base':>10} {'p95 new':>10} {'Δ%':>7}")
+    for result in new["results"]:
+        before = base_results.get(_key(result))
+        if before is None:
+            continue
+        rps_change = _change(before["throughput_rps"], result["throughput_rps"])
+        p95_change = _change(before["latency_seconds"]["p95"], result["latency_seconds"]["p95"])
+        regressed = (rps_change is not None and rps_change < -threshold) or (p95_change is not None and p95_change > threshold)
+        regressions += regressed
+        print(
+            f"{result['scenario']:8} {result['concurrency']:>4} {_fmt(result.get('file_size_mb'), 'g'):>6} "
+            f"{_fmt(before['throughput_rps'], '.1f'):>10} {_fmt(result['throughput_rps'], '.1f'):>10} {_fmt(rps_change, '+.1f'):>7} "
+            f"{_fmt(before['latency_seconds']['p95']):>10} {_fmt(result['latency_seconds']['p95']):>10} {_fmt(p95_change, '+.1f'):>7}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="容許的變化百分比")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as fh:
+        base = json.load(fh)
+    with open(args.new) as fh:
+        new = json.load(fh)
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""本機 benchmark：對執行中的 API 做 upload / listing / auth / stats 的並行度掃描
+
+    docker-compose up -d db redis
+    uvicorn app.main:app --port 8000 &            # 記下 PID
+    celery -A app.workers.worker worker &
+    python -m bench.run --server-pid <PID> --upload-dir uploads --output bench-results.json
+
+每個 (scenario, concurrency) 回報 throughput、p50/p95/p99 latency、server 的 peak RSS 與寫入磁碟的 bytes，
+結果為 JSON（含 commit），可用 python -m bench.compare 比較兩次結果。
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+import psutil
+from prometheus_client.parser import text_string_to_metric_families
+
+from bench.fcsgen import generate
+
+PASSWORD = "bench-password"
+
+
+class UniqueUpload(io.RawIOBase):
+    """讀取時把檔案最後 16 bytes 換成唯一值，讓每次上傳都是新內容（不會被 blob 去重）"""
+
+    def __init__(self, path: str):
+        self._fh = open(path, "rb")
+        self._size = os.path.getsize(path)
+        self._token = uuid.uuid4().bytes
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._fh.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._fh.tell()
+
+    def readinto(self, b) -> int:
+        pos = self._fh.tell()
+        n = self._fh.readinto(b)
+        tail = self._size - len(self._token)
+        if n and pos + n > tail:
+            start = max(pos, tail)
+            b[start - pos:n] = self._token[start - tail:pos + n - tail]
+        return n
+
+    def close(self) -> None:
+        self._fh.close()
+        super().close()
+
+
+class ResourceMonitor:
+    """背景 thread 取樣 server process（含子 process）的 RSS 與 I/O，另計算上傳目錄的大小變化"""
+
+    def __init__(self, pid: Optional[int], upload_dir: Optional[str], interval: float = 0.05):
+        self.process = psutil.Process(pid) if pid else None
+        self.upload_dir = upload_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_rss = 0
+
+    def _processes(self) -> List[psutil.Process]:
+        try:
+            return [self.process] + self.process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def _write_bytes(self) -> Optional[int]:
+        total = 0
+        for p in self._processes():
+            try:
+                total += p.io_counters().write_bytes
+            except (psutil.AccessDenied, psutil.NoSuchProcess, AttributeError):
+                return None
+        return total
+
+    def _dir_bytes(self) -> Optional[int]:
+        if not self.upload_dir:
+            return None
+        total = 0
+        for root, _, files in os.walk(self.upload_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            rss = 0
+            for p in self._processes():
+                try:
+                    rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self.peak_rss = 0
+        self._start_write = self._write_bytes() if self.process else None
+        self._start_dir = self._dir_bytes()
+        if self.process:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> dict:
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+        end_write = self._write_bytes() if self.process else None
+        end_dir = self._dir_bytes()
+        return {
+            "peak_rss_bytes": self.peak_rss or None,
+            "disk_write_bytes": end_write - self._start_write if end_write is not None and self._start_write is not None else None,
+            "upload_dir_growth_bytes": end_dir - self._start_dir if end_dir is not None else None,
+        }
+
+
+def summarize_latencies(latencies: List[float]) -> dict:
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    values = np.array(latencies)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+
+async def scrape_upload_phases(client: httpx.AsyncClient) -> Dict[str, dict]:
+    """讀取 /metrics 中各上傳階段的累計時間，前後相減得到本次掃描的分布"""
+    try:
+        r = await client.get("/metrics")
+        r.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    phases: Dict[str, dict] = {}
+    for family in text_string_to_metric_families(r.text):
+        if family.name != "upload_phase_duration_seconds":
+            continue
+        for sample in family.samples:
+            phase = sample.labels.get("phase")
+            if sample.name.endswith("_sum"):
+                phases.setdefault(phase, {})["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                phases.setdefault(phase, {})["count"] = sample.value
+    return phases
+
+
+def phase_delta(before: Dict[str, dict], after: Dict[str, dict]) -> Dict[str, float]:
+    """每個階段平均每次上傳花費的秒數"""
+    result = {}
+    for phase, values in after.items():
+        count = values.get("count", 0) - before.get(phase, {}).get("count", 0)
+        total = values.get("sum", 0) - before.get(phase, {}).get("sum", 0)
+        if count > 0:
+            result[phase] = total / count
+    return result
+
+
+async def sweep(
+    name: str,
+    request: Callable[[int, int], Awaitable[int]],
+    concurrency: int,
+    total: int,
+    monitor: ResourceMonitor,
+) -> dict:
+    """以 concurrency 個 coroutine 共送出 total 個 request；request(slot, i) 回傳送出的 bytes"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    sent = [0]
+
+    async def run(slot: int):
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                # 先取得結果再累加（await 期間其他 coroutine 也會更新 sent）
+                nbytes = await request(slot, i)
+            except Exception as e:
+                key = f"{type(e).__name__}: {e}"[:120]
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            sent[0] += nbytes
+
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(run(slot) for slot in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    resources = monitor.stop()
+
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": sum(errors.values()),
+        "error_samples": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "latency_seconds": summarize_latencies(latencies),
+        **resources,
+    }
+    if sent[0]:
+        result["bytes_sent"] = sent[0]
+        result["throughput_mb_s"] = sent[0] / elapsed / 1024 / 1024 if elapsed else None
+    return result
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.users: List[dict] = []
+        self.files: Dict[float, str] = {}
+        self.stats_slugs: Dict[int, str] = {}
+
+    async def setup_users(self, count: int) -> None:
+        """每個並行 slot 一個使用者，避免 stats 任務被同一使用者的合併機制吃掉"""
+        run_id = uuid.uuid4().hex[:8]
+        while len(self.users) < count:
+            email = f"bench-{run_id}-{len(self.users)}@example.com"
+            r = await self.client.post("/auth/register", json={"email": email, "password": PASSWORD})
+            r.raise_for_status()
+            token = r.json()["access_token"]
+            self.users.append({"email": email, "headers": {"Authorization": f"Bearer {token}"}})
+
+    def fcs_file(self, size_mb: float) -> str:
+        if size_mb not in self.files:
+            path = os.path.join(self.args.work_dir, f"bench-{size_mb}mb.fcs")
+            if not os.path.exists(path):
+                generate(
+                    path,
+                    version=f"FCS{self.args.fcs_version}",
+                    size_mb=size_mb,
+                    channels=self.args.channels,
+                    bits=[int(b) for b in self.args.bits.split(",")],
+                )
+            self.files[size_mb] = path
+        return self.files[size_mb]
+
+    async def upload(self, slot: int, size_mb: float, is_public: bool = False) -> dict:
+        path = self.fcs_file(size_mb)
+        with UniqueUpload(path) as fh:
+            r = await self.client.post(
+                "/files/upload",
+                headers=self.users[slot]["headers"],
+                data={"is_public": str(is_public).lower()},
+                files={"file": (os.path.basename(path), fh, "application/octet-stream")},
+            )
+        r.raise_for_status()
+        return r.json()
+
+    def auth_request(self):
+        async def request(slot: int, i: int) -> int:
+            r = await self.client.post("/auth/login", json={"email": self.users[slot]["email"], "password": PASSWORD})
+            r.raise_for_status()
+            return 0
+        return request
+
+    def listing_request(self):
+        async def request(slot: int, i: int) -> int:
+            r = await self.client.get("/files/files", params={"limit": 100}, headers=self.users[slot]["headers"])
+            r.raise_for_status()
+            return 0
+        return request
+
+    def upload_request(self, size_mb: float):
+        size = os.path.getsize(self.fcs_file(size_mb))
+
+        async def request(slot: int, i: int) -> int:
+            await self.upload(slot, size_mb)
+            return size
+        return request
+
+    async def setup_stats(self, count: int) -> None:
+        for slot in range(count):
+            if slot not in self.stats_slugs:
+                for _ in range(self.args.stats_files):
+                    response = await self.upload(slot, self.args.stats_file_mb)
+                self.stats_slugs[slot] = response["short_link"]
+
+    def stats_request(self):
+        async def request(slot: int, i: int) -> int:
+            headers = self.users[slot]["headers"]
+            # 變更可見度會讓快取的統計結果失效，每次都量測實際計算
+            await self.client.put(f"{self.stats_slugs[slot]}/visibility", params={"is_public": i % 2 == 0}, headers=headers)
+            r = await self.client.post("/stats/tasks", headers=headers)
+            r.raise_for_status()
+            task = r.json()
+            deadline = time.monotonic() + self.args.timeout
+            while task["status"] not in ("SUCCESS", "FAILURE"):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"stats task {task['task_id']} did not finish")
+                await asyncio.sleep(0.05)
+                r = await self.client.get(f"/stats/tasks/{task['task_id']}")
+                r.raise_for_status()
+                task = r.json()
+            if task["status"] == "FAILURE":
+                raise RuntimeError(f"stats task {task['task_id']} failed")
+            return 0
+        return request
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+async def main_async(args) -> dict:
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    scenarios = args.scenarios.split(",")
+    monitor = ResourceMonitor(args.server_pid, args.upload_dir)
+    limits = httpx.Limits(max_connections=max(concurrencies) * 2)
+    results = []
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        bench = Bench(client, args)
+        await bench.setup_users(max(concurrencies))
+
+        for scenario in scenarios:
+            for concurrency in concurrencies:
+                if scenario == "auth":
+                    results.append(await sweep("auth", bench.auth_request(), concurrency, args.requests, monitor))
+                elif scenario == "listing":
+                    results.append(await sweep("listing", bench.listing_request(), concurrency, args.requests, monitor))
+                elif scenario == "upload":
+                    for size_mb in [float(s) for s in args.file_size_mb.split(",")]:
+                        request = bench.upload_request(size_mb)
+                        before = await scrape_upload_phases(client)
+                        result = await sweep("upload", request, concurrency, args.upload_requests, monitor)
+                        result["file_size_mb"] = size_mb
+                        result["upload_phase_mean_seconds"] = phase_delta(before, await scrape_upload_phases(client))
+                        results.append(result)
+                elif scenario == "stats":
+                    await bench.setup_stats(concurrency)
+                    results.append(await sweep("stats", bench.stats_request(), concurrency, args.stats_requests, monitor))
+                else:
+                    raise SystemExit(f"Unknown scenario: {scenario}")
+                last = results[-1]
+                print(
+                    f"{last['scenario']:8} c={concurrency:<4} {last.get('file_size_mb', ''):<6} "
+                    f"{last['throughput_rps'] or 0:8.1f} req/s  p50={last['latency_seconds']['p50'] or 0:.4f}s "
+                    f"p95={last['latency_seconds']['p95'] or 0:.4f}s p99={last['latency_seconds']['p99'] or 0:.4f}s "
+                    f"errors={last['errors']}",
+                    flush=True,
+                )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the local API benchmark suite")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenarios", default="auth,listing,upload,stats")
+    parser.add_argument("--concurrency", default="1,4,16", help="以逗號分隔的並行度")
+    parser.add_argument("--requests", type=int, default=200, help="auth / listing 每個並行度的 request 數")
+    parser.add_argument("--upload-requests", type=int, default=20)
+    parser.add_argument("--stats-requests", type=int, default=20)
+    parser.add_argument("--file-size-mb", default="1,10,100", help="上傳檔案大小（MB），以逗號分隔")
+    parser.add_argument("--fcs-version", default="3.1", choices=["2.0", "3.0", "3.1"])
+    parser.add_argument("--channels", type=int, default=12)
+    parser.add_argument("--bits", default="16")
+    parser.add_argument("--stats-files", type=int, default=5, help="stats 情境中每個使用者的檔案數")
+    parser.add_argument("--stats-file-mb", type=float, default=1)
+    parser.add_argument("--server-pid", type=int, help="API server 的 PID，用於量測 RSS 與寫入 bytes")
+    parser.add_argument("--upload-dir", help="server 的 UPLOAD_DIR，用於量測磁碟用量變化")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "fcs-bench"))
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    report = asyncio.run(main_async(args))
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# 單元測試不連線資料庫與 Redis；Settings 的必填欄位與 UPLOAD_DIR 在匯入 app 前設定
+os.environ.setdefault("POSTGRES_USER", "test")
+os.environ.setdefault("POSTGRES_PASSWORD", "test")
+os.environ.setdefault("POSTGRES_DB", "test")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="fcs-tests-"))
+
+# 直接 import AsyncSessionLocal 的模組，測試時一併替換
+SESSION_MODULES = (
+    "app.core.database",
+    "app.api.admission",
+    "app.api.routers.file",
+    "app.api.task_events",
+    "app.workers.task_status",
+    "app.workers.worker",
+)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """以 fakeredis 取代 app 的 Redis client（同步與 asyncio 共用同一份資料）"""
+    import fakeredis
+    import fakeredis.aioredis
+
+    from app.core import cache
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache, "_sync_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(cache, "_async_client", fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    return cache._async_client
+
+
+@pytest.fixture
+def test_db(tmp_path, monkeypatch):
+    """SQLite 資料庫（aiosqlite），回傳 engine 與 session factory；PostgreSQL 的 upsert 改用 SQLite 的 INSERT ... ON CONFLICT"""
+    import importlib
+    from types import SimpleNamespace
+
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import NullPool
+
+    from app.db import crud
+    from app.db.models import Base
+
+    # NullPool：每次都建立新連線，不同 event loop 之間不共用 aiosqlite 連線
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def create_all():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_all())
+    for name in SESSION_MODULES:
+        monkeypatch.setattr(importlib.import_module(name), "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(importlib.import_module("app.core.database"), "engine", engine)
+    monkeypatch.setattr(crud, "pg_insert", sqlite_insert)
+    return SimpleNamespace(engine=engine, session=session_factory)
+
+
+@pytest.fixture
+def client(test_db, fake_redis, monkeypatch):
+    """以 SQLite 與 fakeredis 執行的 app；背景任務不排入 Celery"""
+    from fastapi.testclient import TestClient
+
+    from app.core.config import settings
+    from app.core.database import get_db
+    from app.core.security import principal_cache
+    from app.main import app
+
+    async def get_test_db():
+        async with test_db.session() as session:
+            yield session
+
+    monkeypatch.setattr(settings, "CHANNEL_STATS_ON_UPLOAD", False)
+    monkeypatch.setattr(settings, "COLUMNAR_SIDECAR_ON_UPLOAD", False)
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", False)
+    app.dependency_overrides[get_db] = get_test_db
+    # 快取的使用者來自其他測試的資料庫
+    principal_cache._cache.clear()
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+    principal_cache._cache.clear()
+
+
+@pytest.fixture
+def register(client):
+    """註冊（已存在則登入）並回傳 Authorization header"""
+
+    def register_user(email: str = "user@example.com", password: str = "password123") -> dict:
+        r = client.post("/auth/register", json={"email": email, "password": password})
+        if r.status_code != 200:
+            r = client.post("/auth/login", json={"email": email, "password": password})
+        r.raise_for_status()
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    return register_user
@@ -0,0 +1,52 @@
+"""測試用的 FCS 檔案（list mode、32-bit float）"""
+import struct
+from typing import Dict, Optional, Sequence
+
+
+def build_fcs(
+    version: str = "FCS3.1",
+    names: Sequence[str] = ("FSC-A", "SSC-A", "CD4"),
+    events: int = 10,
+    extra: Optional[Dict[str, str]] = None,
+    offsets_in_text: bool = False,
+    delimiter: str = "/",
+) -> bytes:
+    par = len(names)
+    data = b"".join(struct.pack(f"<{par}f", *[float(i + j) for j in range(par)]) for i in range(events))
+    keywords = {
+        "$BYTEORD": "1,2,3,4",
+        "$DATATYPE": "F",
+        "$MODE": "L",
+        "$NEXTDATA": "0",
+        "$PAR": str(par),
+        "$TOT": str(events),
+    }
+    for n, name in enumerate(names, 1):
+        keywords.update({f"$P{n}N": name, f"$P{n}S": f"{name} label", f"$P{n}B": "32", f"$P{n}R": "262144", f"$P{n}E": "0,0"})
+    keywords.update(extra or {})
+
+    def text(data_start: int, data_end: int) -> bytes:
+        kw = dict(keywords)
+        if version != "FCS2.0":
+            kw["$BEGINDATA"] = str(data_start).rjust(20)
+            kw["$ENDDATA"] = str(data_end).rjust(20)
+            kw["$BEGINANALYSIS"] = "0"
+            kw["$ENDANALYSIS"] = "0"
+            kw["$BEGINSTEXT"] = kw.get("$BEGINSTEXT", "0")
+            kw["$ENDSTEXT"] = kw.get("$ENDSTEXT", "0")
+        d = delimiter
+        return (d + "".join(f"{k}{d}{v.replace(d, d + d)}{d}" for k, v in kw.items())).encode()
+
+    # $BEGINDATA / $ENDDATA 補齊到固定寬度，TEXT 長度與實際 offset 無關
+    text_start = 58
+    text_end = text_start + len(text(0, 0)) - 1
+    data_start = text_end + 1
+    data_end = data_start + len(data) - 1
+    segment = text(data_start, data_end)
+    offsets = (text_start, text_end, 0, 0, 0, 0) if offsets_in_text else (text_start, text_end, data_start, data_end, 0, 0)
+    header = version.encode() + b"    " + b"".join(str(x).rjust(8).encode() for x in offsets)
+    return header + segment + data
+
+
+def build_header(version: str = "FCS3.1", offsets: Sequence[int] = (58, 100, 0, 0, 0, 0)) -> bytes:
+    return version.encode() + b"    " + b"".join(str(x).rjust(8).encode() for x in offsets)
@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from app.core import activity_log, database
+from app.core.activity_log import ActivityLogWriter
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """以 stub 取代資料庫寫入，回傳每次寫入的 batch"""
+    written = []
+
+    async def create_activity_logs(db, batch):
+        written.append([values["activity_type"] for values in batch])
+
+    monkeypatch.setattr(activity_log, "create_activity_logs", create_activity_logs)
+    monkeypatch.setattr(database, "AsyncSessionLocal", contextlib.nullcontext)
+    return written
+
+
+def make_writer(max_size=100, batch_size=100, flush_interval=60.0, enqueue_timeout=0.05) -> ActivityLogWriter:
+    return ActivityLogWriter(max_size, batch_size, flush_interval, enqueue_timeout)
+
+
+async def wait_until(condition, timeout=5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_full_queue_drops_after_timeout(batches, monkeypatch):
+    writer = make_writer(max_size=2, batch_size=1)
+    release = asyncio.Event()
+    create_activity_logs = activity_log.create_activity_logs
+
+    async def blocked(db, batch):
+        await release.wait()
+        await create_activity_logs(db, batch)
+
+    monkeypatch.setattr(activity_log, "create_activity_logs", blocked)
+
+    async def run():
+        release.clear()
+        assert await writer.enqueue(activity_type="a")
+        # 背景 task 取出 a 後卡在寫入，queue 只剩兩個空位
+        await wait_until(lambda: writer.counters["queued"] == 0)
+        assert await writer.enqueue(activity_type="b")
+        assert await writer.enqueue(activity_type="c")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert not await writer.enqueue(activity_type="d")
+        assert loop.time() - start >= writer.enqueue_timeout
+        assert writer.counters == {"queued": 2, "flushed": 0, "dropped": 1, "failed": 0}
+
+        release.set()
+        await writer.stop()
+
+    asyncio.run(run())
+    assert batches == [["a"], ["b"], ["c"]]
+    assert writer.counters == {"queued": 0, "flushed": 3, "dropped": 1, "failed": 0}
+
+
+def test_full_queue_waits_for_space(batches):
+    writer = make_writer(max_size=1, batch_size=1, enqueue_timeout=5.0)
+
+    async def run():
+        # 背景 task 尚未執行前 queue 已滿，enqueue 等到有空位為止
+        assert await writer.enqueue(activity_type="a")
+        assert await writer.enqueue(activity_type="b")
+        await writer.stop()
+
+    asyncio.run(run())
+    assert batches == [["a"], ["b"]]
+    assert writer.dropped == 0
+
+
+def test_flush_on_batch_size(batches):
+    writer = make_writer(batch_size=3)
+
+    async def run():
+        for name in "abcd":
+            await writer.enqueue(activity_type=name)
+        await wait_until(lambda: batches)
+        await asyncio.sleep(0.1)
+        # 第四筆未滿一批，也還沒到 flush_interval
+        assert batches == [["a", "b", "c"]]
+        assert writer.counters["flushed"] == 3
+        await writer.stop()
+
+    asyncio.run(run())
+    assert batches == [["a", "b", "c"], ["d"]]
+
+
+def test_flush_on_interval(batches):
+    writer = make_writer(flush_interval=0.1)
+
+    async def run():
+        await writer.enqueue(activity_type="a")
+        await writer.enqueue(activity_type="b")
+        await asyncio.sleep(0.05)
+        assert batches == []
+        await wait_until(lambda: batches)
+        assert batches == [["a", "b"]]
+        await writer.enqueue(activity_type="c")
+        await wait_until(lambda: len(batches) == 2)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_stop_drains_pending(batches):
+    writer = make_writer(batch_size=2)
+
+    async def run():
+        for name in "abcde":
+            await writer.enqueue(activity_type=name)
+        await writer.stop()
+        # 停止後不再接受新事件
+        assert not await writer.enqueue(activity_type="f")
+
+    asyncio.run(run())
+    assert batches == [["a", "b"], ["c", "d"], ["e"]]
+    assert writer.counters == {"queued": 0, "flushed": 5, "dropped": 1, "failed": 0}
+
+
+def test_failed_flush_counted(batches, monkeypatch):
+    writer = make_writer()
+
+    async def fail(db, batch):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(activity_log, "create_activity_logs", fail)
+
+    async def run():
+        await writer.enqueue(activity_type="a")
+        await writer.enqueue(activity_type="b")
+        await writer.stop()
+
+    asyncio.run(run())
+    assert writer.counters == {"queued": 0, "flushed": 0, "dropped": 0, "failed": 2}
+
+
+def test_new_loop_keeps_pending(batches):
+    writer = make_writer()
+
+    async def enqueue():
+        # loop 結束時背景 task 已從 queue 取出事件，還在等待湊滿一批就被取消
+        for name in "abc":
+            assert await writer.enqueue(activity_type=name)
+
+    asyncio.run(enqueue())
+    assert batches == [] and writer.counters["queued"] == 3
+    first_queue = writer._queue
+
+    async def restart():
+        # 例如測試或 worker 各自以新的 event loop 執行
+        writer.start()
+        assert writer._queue is not first_queue
+        await writer.enqueue(activity_type="d")
+        await writer.stop()
+
+    asyncio.run(restart())
+    assert batches == [["a", "b", "c", "d"]]
+    assert writer.counters == {"queued": 0, "flushed": 4, "dropped": 0, "failed": 0}
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import event
+
+import app.api.routers.file as file_router
+from app.api.admission import MULTIPART_OVERHEAD, UploadSlots
+from app.core.config import settings
+from app.core.security import principal_cache
+from fcs_factory import build_fcs
+
+
+@pytest.fixture
+def slots(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_CONCURRENT", 3)
+    monkeypatch.setattr(settings, "UPLOAD_MAX_CONCURRENT_PER_USER", 2)
+    return UploadSlots(fake_redis, ttl=60)
+
+
+def test_slots_per_owner_limit(slots, fake_redis):
+    async def run():
+        a1 = await slots.acquire("user:1")
+        a2 = await slots.acquire("user:1")
+        assert a1 and a2
+        assert await slots.acquire("user:1") is None
+        # 被拒絕的 token 不佔用全域 slot
+        assert await fake_redis.zcard("upload:slots:global") == 2
+        await slots.release("user:1", a1)
+        assert await slots.acquire("user:1")
+
+    asyncio.run(run())
+
+
+def test_slots_global_limit(slots, fake_redis):
+    async def run():
+        tokens = [await slots.acquire(f"user:{i}") for i in range(3)]
+        assert all(tokens)
+        assert await slots.acquire("user:9") is None
+        assert await fake_redis.zcard("upload:slots:user:9") == 0
+        await slots.release("user:0", tokens[0])
+        assert await slots.acquire("user:9")
+
+    asyncio.run(run())
+
+
+def test_expired_slots_are_reclaimed(slots, fake_redis):
+    async def run():
+        # process 當機後遺留、已超過 TTL 的 slot
+        stale = time.time() - 120
+        await fake_redis.zadd("upload:slots:user:1", {"a": stale, "b": stale})
+        await fake_redis.zadd("upload:slots:global", {"a": stale, "b": stale})
+        assert await slots.acquire("user:1")
+        assert await fake_redis.zcard("upload:slots:user:1") == 1
+
+    asyncio.run(run())
+
+
+def upload(client, raw, headers=None, data=None, name="a.fcs"):
+    return client.post("/files/upload", headers=headers or {}, data=data or {}, files={"file": (name, raw)})
+
+
+def test_rejects_large_content_length(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_MB", 1)
+    r = upload(client, b"\0" * (1024 * 1024 + MULTIPART_OVERHEAD + 1))
+    assert r.status_code == 413
+    assert "File too large" in r.json()["detail"]
+
+
+def test_rejects_upload_over_quota(client, register, monkeypatch):
+    monkeypatch.setattr(settings, "USER_QUOTA_MB", 1)
+    headers = register()
+    r = upload(client, b"\0" * (1024 * 1024 + MULTIPART_OVERHEAD + 1), headers)
+    assert r.status_code == 413
+    assert "quota" in r.json()["detail"]
+
+
+def test_rejects_stream_over_remaining_quota(client, register, monkeypatch):
+    monkeypatch.setattr(settings, "USER_QUOTA_MB", 1)
+    headers = register()
+    first = build_fcs(events=40000)
+    assert upload(client, first, headers).status_code == 200
+    # Content-Length 扣掉 multipart 的額外空間後仍在剩餘配額內，寫入時才超過
+    raw = build_fcs(events=50000)
+    assert len(raw) - MULTIPART_OVERHEAD < 1024 * 1024 - len(first) < len(raw)
+    r = upload(client, raw, headers)
+    assert r.status_code == 413
+    assert "quota" in r.json()["detail"]
+
+
+def test_rejects_too_many_concurrent_uploads(client, register, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_CONCURRENT_PER_USER", 1)
+    headers = register()
+    r = upload(client, build_fcs(), headers)
+    assert r.status_code == 200
+    # 同一位使用者已有一個進行中的上傳
+    user_id = r.json()["owner_id"]
+    asyncio.run(fake_redis.zadd(f"upload:slots:user:{user_id}", {"other": time.time()}))
+    r = upload(client, build_fcs(), headers)
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == "5"
+
+
+def test_slots_released_after_upload(client, register, fake_redis):
+    headers = register()
+    assert upload(client, build_fcs(), headers).status_code == 200
+    assert upload(client, b"not fcs", headers).status_code == 400
+
+    async def counts():
+        keys = await fake_redis.keys("upload:slots:*")
+        return [await fake_redis.zcard(key) for key in keys]
+
+    assert set(asyncio.run(counts())) <= {0}
+
+
+def test_no_connection_held_while_streaming_body(client, register, test_db, monkeypatch):
+    checked_out = []
+    event.listen(test_db.engine.sync_engine, "checkout", lambda *args: checked_out.append(1))
+    event.listen(test_db.engine.sync_engine, "checkin", lambda *args: checked_out.pop())
+
+    observed = []
+    iter_multipart = file_router.iter_multipart
+
+    async def observe(request, timer):
+        async for item in iter_multipart(request, timer):
+            observed.append(len(checked_out))
+            yield item
+
+    monkeypatch.setattr(file_router, "iter_multipart", observe)
+    headers = register()
+    raw = build_fcs(events=5000)
+    first = upload(client, raw, headers)
+    assert first.status_code == 200
+    # sha256 欄位會在串流途中查詢 blob；principal 快取未命中時也會查詢使用者
+    principal_cache._cache.clear()
+    r = upload(client, raw, headers, data={"sha256": first.json()["sha256"]})
+    assert r.status_code == 200
+    assert observed and set(observed) == {0}
@@ -0,0 +1,202 @@
+import io
+import tarfile
+import threading
+import zipfile
+
+import pytest
+
+from app.api.archive import (
+    ArchiveError,
+    ArchiveTooLarge,
+    BodyPipe,
+    archive_kind,
+    iter_archive,
+    iter_tar,
+    iter_zip,
+)
+
+FILES = {"a.fcs": b"A" * 300_000, "dir/b.fcs": bytes(range(256)) * 4000, "empty.txt": b""}
+
+
+class _Unseekable(io.RawIOBase):
+    """zipfile 寫入無法 seek 的目的地時改用 data descriptor"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def make_zip(files=FILES, compression=zipfile.ZIP_DEFLATED, streamed=False, force_zip64=False) -> bytes:
+    out = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression) as z:
+        for name, data in files.items():
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            with z.open(info, "w", force_zip64=force_zip64) as fh:
+                fh.write(data)
+    return bytes(out.data) if streamed else out.getvalue()
+
+
+def read_all(entries):
+    return {e.name: b"".join(e.chunks) for e in entries}
+
+
+@pytest.mark.parametrize(
+    "compression, streamed",
+    [(zipfile.ZIP_STORED, False), (zipfile.ZIP_DEFLATED, False), (zipfile.ZIP_DEFLATED, True)],
+)
+def test_zip_round_trip(compression, streamed):
+    raw = make_zip(compression=compression, streamed=streamed)
+    assert read_all(iter_zip(io.BytesIO(raw))) == FILES
+
+
+def test_zip_stored_with_data_descriptor_rejected():
+    raw = make_zip(compression=zipfile.ZIP_STORED, streamed=True)
+    with pytest.raises(ArchiveError, match="has no size"):
+        read_all(iter_zip(io.BytesIO(raw)))
+
+
+def test_zip64():
+    raw = make_zip(force_zip64=True)
+    assert read_all(iter_zip(io.BytesIO(raw))) == FILES
+
+
+def test_zip_entry_sizes():
+    sizes = {e.name: e.size for e in iter_zip(io.BytesIO(make_zip()))}
+    assert sizes == {name: len(data) for name, data in FILES.items()}
+    streamed = {e.name: e.size for e in iter_zip(io.BytesIO(make_zip(streamed=True)))}
+    assert set(streamed.values()) == {None}
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_zip_skips_unread_and_partial_entries(streamed):
+    raw = make_zip(streamed=streamed)
+    names = []
+    for entry in iter_zip(io.BytesIO(raw)):
+        names.append(entry.name)
+        if entry.name == "a.fcs":
+            next(entry.chunks)
+        elif entry.name == "empty.txt":
+            assert b"".join(entry.chunks) == b""
+    assert names == list(FILES)
+
+
+def test_zip_crc_mismatch():
+    raw = bytearray(make_zip({"a.fcs": b"hello world" * 10}, compression=zipfile.ZIP_STORED))
+    index = raw.index(b"hello")
+    raw[index] ^= 0xFF
+    with pytest.raises(ArchiveError, match="CRC mismatch"):
+        read_all(iter_zip(io.BytesIO(bytes(raw))))
+
+
+@pytest.mark.parametrize("raw, message", [(b"not a zip file", "Not a ZIP"), (b"PK\x03\x04\x14\x00", "Truncated")])
+def test_zip_invalid(raw, message):
+    with pytest.raises(ArchiveError, match=message):
+        read_all(iter_zip(io.BytesIO(raw)))
+
+
+def test_zip_truncated_entry():
+    raw = make_zip({"a.fcs": bytes(range(256)) * 1000}, compression=zipfile.ZIP_STORED)
+    with pytest.raises(ArchiveError, match="Truncated"):
+        read_all(iter_zip(io.BytesIO(raw[:2000])))
+
+
+def test_zip_encrypted_entry_rejected():
+    raw = bytearray(make_zip({"a.fcs": b"x"}))
+    raw[6] |= 0x1
+    with pytest.raises(ArchiveError, match="Encrypted"):
+        read_all(iter_zip(io.BytesIO(bytes(raw))))
+
+
+BOMB = {"bomb.fcs": b"\0" * (64 << 20), "after.fcs": b"tail"}
+
+
+def test_zip_bomb_skipped_without_decompressing():
+    # 壓縮後大小已知：略過（或讀到一半）的 entry 不需要解壓，只有讀出的第一個 chunk 計入上限
+    raw = make_zip(BOMB)
+    seen = {}
+    for entry in iter_zip(io.BytesIO(raw), max_total_bytes=2 << 20):
+        seen[entry.name] = next(entry.chunks) if entry.name == "bomb.fcs" else b"".join(entry.chunks)
+    assert seen["after.fcs"] == b"tail"
+
+
+@pytest.mark.parametrize("partial", [False, True])
+def test_zip_bomb_with_data_descriptor_counts_toward_limit(partial):
+    raw = make_zip(BOMB, streamed=True)
+    with pytest.raises(ArchiveTooLarge):
+        for entry in iter_zip(io.BytesIO(raw), max_total_bytes=8 << 20):
+            if partial:
+                next(entry.chunks)
+    assert read_all(iter_zip(io.BytesIO(raw), max_total_bytes=128 << 20)) == BOMB
+
+
+def make_tar(files=FILES, mode="w:gz") -> bytes:
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode=mode) as tar:
+        directory = tarfile.TarInfo("dir")
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2", "w:xz"])
+def test_tar_round_trip(mode):
+    assert read_all(iter_tar(io.BytesIO(make_tar(mode=mode)))) == FILES
+
+
+def test_tar_size_limit():
+    raw = make_tar(BOMB)
+    with pytest.raises(ArchiveTooLarge):
+        list(iter_tar(io.BytesIO(raw), max_total_bytes=8 << 20))
+
+
+def test_tar_invalid():
+    with pytest.raises(ArchiveError, match="Invalid TAR"):
+        list(iter_tar(io.BytesIO(b"x" * 1024)))
+
+
+def test_archive_kind():
+    assert archive_kind("a.ZIP") == "zip"
+    assert archive_kind("a.tar.gz") == "tar"
+    assert archive_kind("a.tgz") == "tar"
+    assert archive_kind("a.fcs") is None
+
+
+def test_body_pipe_feeds_reader_thread():
+    import asyncio
+
+    raw = make_zip()
+    pipe = BodyPipe(max_chunks=2)
+    result = {}
+
+    def consume():
+        result["files"] = read_all(iter_archive("zip", pipe))
+        pipe.close_reader()
+
+    async def produce():
+        thread = threading.Thread(target=consume)
+        thread.start()
+        for i in range(0, len(raw), 1000):
+            await pipe.feed(raw[i:i + 1000])
+        await pipe.close()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    asyncio.run(produce())
+    assert result["files"] == FILES
+
+
+def test_body_pipe_abort():
+    pipe = BodyPipe()
+    pipe.abort()
+    with pytest.raises(ArchiveError, match="aborted"):
+        pipe.read(10)
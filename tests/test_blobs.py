@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+import app.api.routers.file as file_router
+from app.core.storage import preview_dir_key, sidecar_key, stored_path
+from app.db import crud
+from app.db.models import Blob, FileInfo, UserUsage
+from fcs_factory import build_fcs
+
+
+@pytest.fixture
+def headers(register):
+    return register()
+
+
+def upload(client, headers, raw, name="a.fcs", data=None):
+    return client.post("/files/upload", headers=headers, data=data or {}, files={"file": (name, raw)})
+
+
+def slug_of(r) -> str:
+    return r.json()["short_link"].rsplit("/", 1)[-1]
+
+
+def query(test_db, stmt):
+    async def run():
+        async with test_db.session() as db:
+            return (await db.execute(stmt)).scalars().all()
+
+    return asyncio.run(run())
+
+
+def blobs(test_db):
+    return query(test_db, select(Blob))
+
+
+def touch_derived(blob) -> list:
+    """建立 blob 的 sidecar 與預覽快取，回傳路徑"""
+    sidecar = stored_path(sidecar_key(blob.sha256, blob.stored_filename))
+    preview = stored_path(preview_dir_key(blob.sha256, blob.stored_filename))
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    os.makedirs(preview, exist_ok=True)
+    open(sidecar, "wb").close()
+    open(os.path.join(preview, "p.json"), "w").close()
+    return [sidecar, preview]
+
+
+def test_duplicate_upload_shares_blob(client, test_db, headers):
+    raw = build_fcs(events=100)
+    first = upload(client, headers, raw)
+    second = upload(client, headers, raw, name="b.fcs")
+    assert first.status_code == second.status_code == 200
+    assert slug_of(first) != slug_of(second)
+
+    [blob] = blobs(test_db)
+    assert blob.ref_count == 2
+    assert blob.sha256 == first.json()["sha256"] == second.json()["sha256"]
+    assert blob.fcs_metadata
+    files = query(test_db, select(FileInfo).order_by(FileInfo.id))
+    assert [f.blob_id for f in files] == [blob.id, blob.id]
+    assert files[0].stored_filename == files[1].stored_filename == blob.stored_filename
+    # 兩個檔案都計入用量
+    [usage] = query(test_db, select(UserUsage))
+    assert usage.file_count == 2 and usage.total_size_bytes == 2 * len(raw)
+
+
+def test_duplicate_upload_reuses_metadata(client, test_db, headers, monkeypatch):
+    raw = build_fcs(events=100)
+    first = upload(client, headers, raw)
+    [blob] = blobs(test_db)
+    # 帶 sha256 欄位的重複上傳只驗證 hash，不再寫入檔案
+    second = upload(client, headers, raw, name="b.fcs", data={"sha256": first.json()["sha256"]})
+    assert second.status_code == 200
+    [shared] = blobs(test_db)
+    assert shared.ref_count == 2
+    assert shared.fcs_metadata == blob.fcs_metadata
+
+    def fail(*args, **kwargs):
+        raise AssertionError("blob metadata should be reused")
+
+    # 讀取 metadata 時使用 blob 保存的結果，不重新解析 HEADER/TEXT
+    monkeypatch.setattr(file_router, "read_stored_metadata", fail)
+    [f] = query(test_db, select(FileInfo).options(joinedload(FileInfo.blob)).where(FileInfo.slug == slug_of(second)))
+    metadata = asyncio.run(file_router.load_file_metadata(f))
+    assert metadata.pnn == ["FSC-A", "SSC-A", "CD4"]
+    assert client.get(f"/files/{slug_of(second)}/events", params={"stop": 5}).status_code == 200
+
+
+def test_delete_one_reference_keeps_blob(client, test_db, headers):
+    raw = build_fcs(events=100)
+    first = upload(client, headers, raw)
+    second = upload(client, headers, raw, name="b.fcs")
+    [blob] = blobs(test_db)
+    derived = touch_derived(blob)
+
+    assert client.delete(f"/files/{slug_of(first)}", headers=headers).status_code == 200
+    [blob] = blobs(test_db)
+    assert blob.ref_count == 1
+    assert os.path.exists(stored_path(blob.stored_filename))
+    assert all(os.path.exists(path) for path in derived)
+    assert client.get(f"/files/{slug_of(second)}").content == raw
+    [usage] = query(test_db, select(UserUsage))
+    assert usage.file_count == 1 and usage.total_size_bytes == len(raw)
+
+
+def test_delete_last_reference_removes_blob(client, test_db, headers):
+    raw = build_fcs(events=100)
+    slugs = [slug_of(upload(client, headers, raw, name=name)) for name in ("a.fcs", "b.fcs")]
+    [blob] = blobs(test_db)
+    derived = touch_derived(blob)
+
+    for slug in slugs:
+        assert client.delete(f"/files/{slug}", headers=headers).status_code == 200
+    assert blobs(test_db) == []
+    assert not os.path.exists(stored_path(blob.stored_filename))
+    assert not any(os.path.exists(path) for path in derived)
+    [usage] = query(test_db, select(UserUsage))
+    assert usage.file_count == 0 and usage.total_size_bytes == 0
+
+
+def test_delete_keeps_file_reuploaded_after_commit(client, test_db, headers, monkeypatch):
+    raw = build_fcs(events=100)
+    slug = slug_of(upload(client, headers, raw))
+    [blob] = blobs(test_db)
+    # SQLite 會重用最大的 id，且未啟用外鍵不會連帶刪除 channel；保留另一個檔案避免新檔案沿用舊 id
+    upload(client, headers, build_fcs(events=10), name="c.fcs")
+    get_blob_by_sha256 = crud.get_blob_by_sha256
+
+    async def reuploaded(db, sha256):
+        # 參照數歸零並 commit 之後，相同內容又被上傳
+        assert upload(client, headers, raw, name="b.fcs").status_code == 200
+        return await get_blob_by_sha256(db, sha256)
+
+    async def delete():
+        async with test_db.session() as db:
+            await crud.delete_file(db, await crud.get_file_by_slug(db, slug))
+
+    monkeypatch.setattr(crud, "get_blob_by_sha256", reuploaded)
+    asyncio.run(delete())
+    [new_blob] = [b for b in blobs(test_db) if b.sha256 == blob.sha256]
+    assert new_blob.id != blob.id and new_blob.ref_count == 1
+    assert os.path.exists(stored_path(new_blob.stored_filename))
+
+
+def test_sha256_mismatch_rejected(client, test_db, headers):
+    first = upload(client, headers, build_fcs(events=100))
+    # 宣稱的 hash 指向已存在的 blob，但上傳的內容不同
+    r = upload(client, headers, build_fcs(events=200), data={"sha256": first.json()["sha256"]})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "sha256 does not match the uploaded content."
+    [blob] = blobs(test_db)
+    assert blob.ref_count == 1
+    assert len(query(test_db, select(FileInfo))) == 1
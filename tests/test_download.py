@@ -0,0 +1,163 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.api.download import (
+    MAX_RANGES,
+    RangeNotSatisfiable,
+    RangeResponse,
+    content_disposition,
+    http_date,
+    is_not_modified,
+    parse_range_header,
+)
+from app.core.readers import RandomAccessReader
+
+SIZE = 1000
+CONTENT = bytes(i % 251 for i in range(SIZE))
+ETAG = '"abc"'
+MTIME = 1_700_000_000
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("bytes=0-99", [(0, 100)]),
+        ("bytes=900-", [(900, 1000)]),
+        ("bytes=-100", [(900, 1000)]),
+        ("bytes=-5000", [(0, 1000)]),
+        ("bytes=990-5000", [(990, 1000)]),
+        ("bytes=0-0", [(0, 1)]),
+        (" BYTES = 0 - 9 ", [(0, 10)]),
+        # 重疊或相鄰的區段合併，依起點排序
+        ("bytes=50-99,0-49", [(0, 100)]),
+        ("bytes=0-9,5-19,30-39", [(0, 20), (30, 40)]),
+        # 超出檔案的區段忽略，其餘仍有效
+        ("bytes=0-9,2000-3000", [(0, 10)]),
+    ],
+)
+def test_parse_range(value, expected):
+    assert parse_range_header(value, SIZE) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["items=0-9", "bytes=", "bytes=-", "bytes=a-b", "bytes=10-5", "bytes=0-9;1-2"],
+)
+def test_parse_range_ignores_invalid(value):
+    assert parse_range_header(value, SIZE) is None
+
+
+def test_parse_range_too_many_ranges():
+    spec = ",".join(f"{i * 10}-{i * 10}" for i in range(MAX_RANGES + 1))
+    assert parse_range_header(f"bytes={spec}", SIZE) is None
+
+
+@pytest.mark.parametrize("value", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_range_not_satisfiable(value):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(value, SIZE)
+
+
+def test_parse_range_empty_file():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header("bytes=0-", 0)
+
+
+def test_is_not_modified():
+    assert is_not_modified({"if-none-match": ETAG}, ETAG, MTIME)
+    assert is_not_modified({"if-none-match": f'"x", W/{ETAG}'}, ETAG, MTIME)
+    assert is_not_modified({"if-none-match": "*"}, ETAG, MTIME)
+    assert not is_not_modified({"if-none-match": '"x"'}, ETAG, MTIME)
+    assert is_not_modified({"if-modified-since": http_date(MTIME)}, ETAG, MTIME + 0.5)
+    assert not is_not_modified({"if-modified-since": http_date(MTIME - 1)}, ETAG, MTIME)
+    assert not is_not_modified({"if-modified-since": "garbage"}, ETAG, MTIME)
+    # If-None-Match 優先
+    assert not is_not_modified({"if-none-match": '"x"', "if-modified-since": http_date(MTIME)}, ETAG, MTIME)
+
+
+def test_content_disposition():
+    assert content_disposition("a.fcs") == 'attachment; filename="a.fcs"'
+    assert content_disposition("樣本 1.fcs") == "attachment; filename*=utf-8''%E6%A8%A3%E6%9C%AC%201.fcs"
+
+
+class BytesReader(RandomAccessReader):
+    def __init__(self, data: bytes):
+        super().__init__()
+        self.data = data
+        self.size = len(data)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        return self.data[offset:offset + size]
+
+
+@pytest.fixture
+def client():
+    async def endpoint(request):
+        response = RangeResponse(
+            lambda: BytesReader(CONTENT),
+            SIZE,
+            headers={"etag": ETAG},
+            etag=ETAG,
+            last_modified=http_date(MTIME),
+        )
+        # 多次讀取以確認跨 chunk 的輸出
+        response.chunk_size = 64
+        return response
+
+    app = Starlette(routes=[Route("/f", endpoint, methods=["GET", "HEAD"])])
+    return TestClient(app)
+
+
+def test_full_response(client):
+    r = client.get("/f")
+    assert r.status_code == 200
+    assert r.content == CONTENT
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["content-length"] == str(SIZE)
+
+
+def test_head(client):
+    r = client.head("/f", headers={"range": "bytes=0-9"})
+    assert r.status_code == 206
+    assert r.headers["content-length"] == "10"
+    assert r.content == b""
+
+
+def test_single_range(client):
+    r = client.get("/f", headers={"range": "bytes=100-299"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 100-299/{SIZE}"
+    assert r.content == CONTENT[100:300]
+
+
+def test_multiple_ranges(client):
+    r = client.get("/f", headers={"range": "bytes=0-9,500-,-10"})
+    assert r.status_code == 206
+    boundary = r.headers["content-type"].split("boundary=")[1]
+    assert int(r.headers["content-length"]) == len(r.content)
+
+    parts = r.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    # -10 與 500- 重疊，合併為一段
+    bodies = []
+    for part in parts[1:-1]:
+        head, _, body = part.partition(b"\r\n\r\n")
+        assert body.endswith(b"\r\n")
+        bodies.append((head.decode().split("Content-Range: ")[1], body[:-2]))
+    assert bodies == [(f"bytes 0-9/{SIZE}", CONTENT[:10]), (f"bytes 500-999/{SIZE}", CONTENT[500:])]
+
+
+def test_range_not_satisfiable(client):
+    r = client.get("/f", headers={"range": "bytes=5000-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{SIZE}"
+
+
+def test_if_range(client):
+    assert client.get("/f", headers={"range": "bytes=0-9", "if-range": ETAG}).status_code == 206
+    assert client.get("/f", headers={"range": "bytes=0-9", "if-range": http_date(MTIME)}).status_code == 206
+    r = client.get("/f", headers={"range": "bytes=0-9", "if-range": '"stale"'})
+    assert r.status_code == 200
+    assert r.content == CONTENT
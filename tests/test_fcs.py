@@ -0,0 +1,139 @@
+import io
+
+import pytest
+
+from app.api.fcs import (
+    MAX_TEXT_OFFSET,
+    FCSHeaderSniffer,
+    FCSMetadata,
+    FCSParseError,
+    check_header_bounds,
+    parse_header,
+    parse_text_segment,
+    read_fcs_metadata,
+)
+from fcs_factory import build_fcs, build_header
+
+
+@pytest.mark.parametrize("version", ["FCS2.0", "FCS3.0", "FCS3.1"])
+def test_read_metadata(version):
+    raw = build_fcs(version=version, names=("FSC-A", "CD4"), events=25)
+    meta = read_fcs_metadata(io.BytesIO(raw))
+
+    assert meta.version == version
+    assert meta.tot == 25
+    assert meta.par == 2
+    assert meta.pnn == ["FSC-A", "CD4"]
+    assert meta.pns == ["FSC-A label", "CD4 label"]
+    assert meta.channels[0].pnb == 32
+    assert meta.data_end - meta.data_start + 1 == 25 * 2 * 4
+    assert meta.data_end == len(raw) - 1
+
+
+def test_data_offsets_from_text():
+    raw = build_fcs(offsets_in_text=True, events=3)
+    meta = read_fcs_metadata(io.BytesIO(raw))
+    assert meta.data_start > meta.text_end
+    assert meta.data_end == len(raw) - 1
+
+
+def test_read_metadata_from_path(tmp_path):
+    path = tmp_path / "a.fcs"
+    path.write_bytes(build_fcs())
+    assert read_fcs_metadata(str(path)).pnn == ["FSC-A", "SSC-A", "CD4"]
+
+
+def test_supplemental_text_does_not_override_primary():
+    def build(start: int, end: int) -> bytes:
+        # offset 補齊到固定寬度，TEXT 長度與實際值無關
+        return build_fcs(events=1, extra={"$BEGINSTEXT": str(start).rjust(20), "$ENDSTEXT": str(end).rjust(20)})
+
+    stext = b"/$P1N/Other/EXTRA/value/"
+    stext_start = len(build(0, 0))
+    # 補充 TEXT 接在 DATA 之後
+    raw = build(stext_start, stext_start + len(stext) - 1) + stext
+    meta = read_fcs_metadata(io.BytesIO(raw))
+    assert meta.keywords["EXTRA"] == "value"
+    assert meta.pnn[0] == "FSC-A"
+
+
+def test_metadata_round_trip():
+    meta = read_fcs_metadata(io.BytesIO(build_fcs()))
+    restored = FCSMetadata.from_dict(meta.to_dict())
+    assert restored.channels == meta.channels
+    assert restored.tot == meta.tot
+    assert "keywords" not in meta.to_dict()
+
+
+def test_parse_text_escaped_delimiter():
+    keywords = parse_text_segment(b"/$P1N/FSC//A/$p1s/CD4 // CD8/")
+    assert keywords == {"$P1N": "FSC/A", "$P1S": "CD4 / CD8"}
+
+
+def test_parse_text_other_delimiter_and_trailing_value():
+    assert parse_text_segment(b"|A|1|B|2") == {"A": "1", "B": "2"}
+    assert parse_text_segment(b"") == {}
+
+
+@pytest.mark.parametrize(
+    "header, message",
+    [
+        (b"FCS3.1", "too short"),
+        (build_header(version="FCS9.9"), "Unsupported FCS version"),
+        (build_header(offsets=(10, 100, 0, 0, 0, 0)), "Invalid TEXT segment offsets"),
+        (build_header(offsets=(200, 100, 0, 0, 0, 0)), "Invalid TEXT segment offsets"),
+        (build_header(offsets=(58, 99_999_999, 0, 0, 0, 0)), "TEXT segment too large"),
+        (b"FCS3.1    " + b"   abcde" + b" " * 40, "Invalid HEADER offset"),
+    ],
+)
+def test_parse_header_rejects(header, message):
+    with pytest.raises(FCSParseError, match=message):
+        parse_header(header)
+
+
+def test_check_header_bounds():
+    header = parse_header(build_header(offsets=(58, 100, 101, 500, 0, 0)))
+    check_header_bounds(header, 501)
+    with pytest.raises(FCSParseError, match="data_end"):
+        check_header_bounds(header, 500)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 58, 59, 100, 1 << 20])
+def test_sniffer_matches_reader(chunk_size):
+    raw = build_fcs(events=50)
+    sniffer = FCSHeaderSniffer()
+    for i in range(0, len(raw), chunk_size):
+        sniffer.feed(raw[i:i + chunk_size])
+    assert sniffer.done
+    assert sniffer.metadata == read_fcs_metadata(io.BytesIO(raw))
+    assert not sniffer.needs_supplemental_text
+
+
+def test_sniffer_waits_for_text_end():
+    raw = build_fcs()
+    sniffer = FCSHeaderSniffer()
+    text_end = parse_header(raw[:58])["text_end"]
+    sniffer.feed(raw[:text_end])
+    assert not sniffer.done
+    sniffer.feed(raw[text_end:text_end + 1])
+    assert sniffer.done
+
+
+def test_sniffer_rejects_far_text_offset():
+    sniffer = FCSHeaderSniffer()
+    with pytest.raises(FCSParseError, match="too far"):
+        sniffer.feed(build_header(offsets=(MAX_TEXT_OFFSET + 1, MAX_TEXT_OFFSET + 100, 0, 0, 0, 0)))
+
+
+def test_sniffer_drops_bytes_before_text():
+    start = MAX_TEXT_OFFSET
+    text = b"/$PAR/0/$TOT/0/"
+    sniffer = FCSHeaderSniffer()
+    sniffer.feed(build_header(offsets=(start, start + len(text) - 1, 0, 0, 0, 0)))
+    padding = start - 58
+    for i in range(0, padding, 1 << 16):
+        sniffer.feed(b"\0" * min(1 << 16, padding - i))
+        assert len(sniffer._buf) <= 1 << 16
+    sniffer.feed(text)
+    assert sniffer.done
+    assert sniffer.metadata.tot == 0
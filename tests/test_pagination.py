@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.api.pagination import InvalidCursor, decode_cursor, encode_cursor
+from app.db.crud import file_listing_query
+from app.db.models import Base, FileInfo, User
+
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def test_cursor_round_trip():
+    uploaded_at = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    cursor = encode_cursor(uploaded_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (uploaded_at, 42)
+
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_empty_cursor(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor(BASE_TIME, 1)[:-3], "WzFd", "WyJ4IiwxXQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([User(id=1, email="a@example.com", hashed_password="x"),
+                         User(id=2, email="b@example.com", hashed_password="x")])
+        for i in range(1, 21):
+            session.add(FileInfo(
+                id=i,
+                owner_id=1 if i % 2 else 2,
+                original_filename=f"{i}.fcs",
+                stored_filename=f"{i}.fcs",
+                size_bytes=i,
+                # 每兩筆共用同一個時間，以 id 決定順序
+                uploaded_at=BASE_TIME + timedelta(minutes=i // 2),
+                fcs_version="FCS3.1" if i % 3 else "FCS3.0",
+                is_public=i % 4 != 0,
+                slug=f"slug-{i}",
+            ))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def expected_ids(session, viewer_id, **filters):
+    files = [
+        f for f in session.query(FileInfo)
+        if f.is_public or (viewer_id is not None and f.owner_id == viewer_id)
+    ]
+    files = [f for f in files if all(getattr(f, key) == value for key, value in filters.items())]
+    files.sort(key=lambda f: (f.uploaded_at, f.id), reverse=True)
+    return [f.id for f in files]
+
+
+def paginate(session, viewer_id, limit, **kwargs):
+    ids, after = [], None
+    while True:
+        rows = session.execute(file_listing_query(viewer_id, limit, after=after, **kwargs)).all()
+        ids.extend(row.id for row in rows)
+        if len(rows) < limit:
+            return ids
+        after = decode_cursor(encode_cursor(rows[-1].uploaded_at, rows[-1].id))
+
+
+@pytest.mark.parametrize("viewer_id", [None, 1, 2])
+@pytest.mark.parametrize("limit", [1, 3, 100])
+def test_keyset_pages_cover_visible_files(db, viewer_id, limit):
+    assert paginate(db, viewer_id, limit) == expected_ids(db, viewer_id)
+
+
+def test_private_files_only_visible_to_owner(db):
+    assert 4 not in paginate(db, None, 100)
+    assert 4 in paginate(db, 2, 100)
+    assert 4 not in paginate(db, 1, 100)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [{"owner_id": 1}, {"is_public": False}, {"fcs_version": "FCS3.0"}, {"owner_id": 2, "is_public": True}],
+)
+def test_listing_filters(db, filters):
+    assert paginate(db, 2, 4, **filters) == expected_ids(db, 2, **filters)
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.crud import file_listing_query, file_search_filters
+from app.db.models import Base, FileChannel, FileInfo
+
+FILES = {
+    1: (["FSC-A", "CD4"], ["", "CD4 FITC"], 1000),
+    2: (["FSC-A", "cd8"], ["", "CD8_PE"], 5000),
+    3: (["SSC-A", "CD4%"], ["", "CD8XPE"], 20000),
+}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for file_id, (pnn, pns, events) in FILES.items():
+            session.add(FileInfo(
+                id=file_id,
+                original_filename=f"{file_id}.fcs",
+                stored_filename=f"{file_id}.fcs",
+                size_bytes=events * 10,
+                uploaded_at=datetime(2024, 1, file_id),
+                event_count=events,
+                slug=f"slug-{file_id}",
+                channels=[
+                    FileChannel(channel_index=i, pnn=n, pns=s)
+                    for i, (n, s) in enumerate(zip(pnn, pns), start=1)
+                ],
+            ))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def search(session, **kwargs):
+    stmt = file_listing_query(None, 100, extra_filters=file_search_filters(**kwargs))
+    return sorted(row.id for row in session.execute(stmt))
+
+
+# SQLite 的 LIKE 不分大小寫，區分大小寫的 prefix / contains 只在 PostgreSQL 上成立，這裡不測
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({"pnn": ["CD4"]}, [1]),
+        ({"pnn": ["cd4"]}, []),
+        ({"pnn": ["cd4"], "ignore_case": True}, [1]),
+        ({"pnn": ["CD"], "match": "prefix", "ignore_case": True}, [1, 2, 3]),
+        ({"pnn": ["SC-"], "match": "contains"}, [1, 2, 3]),
+        # 每個值都必須有 channel 符合
+        ({"pnn": ["FSC-A", "CD4"]}, [1]),
+        ({"pns": ["FITC"], "match": "contains"}, [1]),
+    ],
+)
+def test_channel_match(db, kwargs, expected):
+    assert search(db, **kwargs) == expected
+
+
+def test_like_wildcards_are_escaped(db):
+    assert search(db, pnn=["CD4%"]) == [3]
+    assert search(db, pnn=["CD4%"], match="prefix") == [3]
+    assert search(db, pns=["CD8_"], match="prefix") == [2]
+
+
+def test_range_filters(db):
+    assert search(db, min_events=1000, max_events=5000) == [1, 2]
+    assert search(db, min_size=50_000) == [2, 3]
+    assert search(db, uploaded_after=datetime(2024, 1, 2), uploaded_before=datetime(2024, 1, 3)) == [2]
+
+
+def test_filters_combine_with_channels(db):
+    assert search(db, pnn=["FSC-A"], min_events=2000) == [2]
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app import deps
+from app.api.routers import auth
+from app.core import security
+from app.core.config import settings
+from app.core.security import PrincipalCache, principal_cache
+from app.db.models import User
+
+EMAIL = "user@example.com"
+
+
+def test_principal_cache_ttl():
+    cache = PrincipalCache(maxsize=10, ttl=0.05)
+    cache.set(EMAIL, "user")
+    assert cache.get(EMAIL) == "user"
+    time.sleep(0.1)
+    assert cache.get(EMAIL) is None
+
+
+def test_principal_cache_maxsize_and_invalidate():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    for email in ("a", "b", "c"):
+        cache.set(email, email.upper())
+    assert [cache.get(email) for email in ("a", "b", "c")] == [None, "B", "C"]
+    cache.invalidate("b")
+    cache.invalidate("missing")
+    cache.invalidate(None)
+    assert cache.get("b") is None and cache.get("c") == "C"
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """記錄 get_user_principal 查詢資料庫的次數"""
+    emails = []
+    get_user_by_email = deps.get_user_by_email
+
+    async def counting(db, email):
+        emails.append(email)
+        return await get_user_by_email(db, email=email)
+
+    monkeypatch.setattr(deps, "get_user_by_email", counting)
+    return emails
+
+
+def test_get_user_principal_caches(client, register, test_db, lookups):
+    register()
+    principal_cache.invalidate(EMAIL)
+
+    async def run():
+        async with test_db.session() as db:
+            first = await deps.get_user_principal(db, EMAIL)
+            second = await deps.get_user_principal(db, EMAIL)
+            # 快取的 User 已從 session 分離，查詢的 transaction 也已結束
+            assert first not in db and not db.in_transaction()
+            assert await deps.get_user_principal(db, "missing@example.com") is None
+            assert await deps.get_user_principal(db, "missing@example.com") is None
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second and first.email == EMAIL
+    # 不存在的使用者不快取
+    assert lookups == [EMAIL, "missing@example.com", "missing@example.com"]
+
+
+def test_requests_use_cached_principal(client, register, lookups):
+    headers = register()
+    principal_cache.invalidate(EMAIL)
+    for _ in range(3):
+        assert client.get("/stats/user/files_statistics", headers=headers).status_code == 200
+    assert lookups == [EMAIL]
+
+
+def test_logout_evicts_principal(client, register, lookups):
+    headers = register()
+    client.get("/stats/user/files_statistics", headers=headers)
+    assert principal_cache.get(EMAIL) is not None
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert principal_cache.get(EMAIL) is None
+    lookups.clear()
+    client.get("/stats/user/files_statistics", headers=headers)
+    assert lookups == [EMAIL]
+
+
+def test_password_change_evicts_principal(client, register):
+    headers = register()
+    client.get("/stats/user/files_statistics", headers=headers)
+    cached = principal_cache.get(EMAIL)
+    r = client.post("/auth/password", headers=headers, json={"old_password": "wrong", "new_password": "changed123"})
+    assert r.status_code == 401
+    assert principal_cache.get(EMAIL) is cached
+
+    r = client.post("/auth/password", headers=headers, json={"old_password": "password123", "new_password": "changed123"})
+    assert r.status_code == 200
+    assert principal_cache.get(EMAIL) is None
+    client.get("/stats/user/files_statistics", headers=headers)
+    # 重新載入的使用者帶有新的密碼雜湊
+    assert principal_cache.get(EMAIL).hashed_password != cached.hashed_password
+    assert client.post("/auth/login", json={"email": EMAIL, "password": "password123"}).status_code == 401
+    assert client.post("/auth/login", json={"email": EMAIL, "password": "changed123"}).status_code == 200
+
+
+def stored_hash(test_db) -> str:
+    async def load():
+        async with test_db.session() as db:
+            return (await db.execute(select(User.hashed_password).where(User.email == EMAIL))).scalar_one()
+
+    return asyncio.run(load())
+
+
+def test_login_rehashes_when_rounds_change(client, register, test_db, monkeypatch):
+    register()
+    old_hash = stored_hash(test_db)
+    assert old_hash.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+
+    # 調整 BCRYPT_ROUNDS 後，下次登入時以新成本重新雜湊
+    monkeypatch.setattr(security, "pwd_context", security.pwd_context.copy(bcrypt__rounds=5))
+    updates = []
+    update_user_password = auth.update_user_password
+
+    async def counting(db, user, hashed_password):
+        updates.append(hashed_password)
+        return await update_user_password(db, user, hashed_password)
+
+    monkeypatch.setattr(auth, "update_user_password", counting)
+    login = {"email": EMAIL, "password": "password123"}
+    assert client.post("/auth/login", json=login).status_code == 200
+    new_hash = stored_hash(test_db)
+    assert new_hash.startswith("$2b$05$") and updates == [new_hash]
+
+    # 已是新成本的雜湊不再更新，且仍可登入
+    assert client.post("/auth/login", json=login).status_code == 200
+    assert len(updates) == 1 and stored_hash(test_db) == new_hash
+    assert client.post("/auth/login", json={"email": EMAIL, "password": "wrong"}).status_code == 401
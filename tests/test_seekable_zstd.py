@@ -0,0 +1,103 @@
+import hashlib
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from app.core.readers import LocalFileReader
+from app.core.seekable_zstd import SeekableFormatError, SeekableZstdReader, compress_file, verify_file
+
+FRAME_SIZE = 4096
+CONTENT = random.Random(0).randbytes(3 * FRAME_SIZE) + b"\0" * (2 * FRAME_SIZE + 123)
+
+
+@pytest.fixture
+def compressed(tmp_path):
+    src = tmp_path / "a.fcs"
+    src.write_bytes(CONTENT)
+    dst = tmp_path / "a.fcs.zst"
+    info = compress_file(str(src), str(dst), FRAME_SIZE)
+    return dst, info
+
+
+def test_compress_file(compressed):
+    path, info = compressed
+    assert info["raw_size"] == len(CONTENT)
+    assert info["stored_size"] == path.stat().st_size
+    assert info["frames"] == 6
+    assert info["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize(
+    "offset, size",
+    [(0, 10), (FRAME_SIZE - 5, 10), (100, 3 * FRAME_SIZE), (len(CONTENT) - 50, 100), (len(CONTENT), 10), (0, 10**9)],
+)
+def test_read_at(compressed, offset, size):
+    with SeekableZstdReader(str(compressed[0])) as reader:
+        assert reader.size == len(CONTENT)
+        assert reader.frame_size == FRAME_SIZE
+        assert reader.read_at(offset, size) == CONTENT[offset:offset + size]
+
+
+def test_random_reads_with_small_cache(compressed):
+    rng = random.Random(1)
+    with SeekableZstdReader(str(compressed[0]), cached_frames=1) as reader:
+        for _ in range(200):
+            offset = rng.randrange(len(CONTENT))
+            size = rng.randrange(1, 2 * FRAME_SIZE)
+            assert reader.read_at(offset, size) == CONTENT[offset:offset + size]
+
+
+def test_seek_and_read(compressed):
+    with SeekableZstdReader(str(compressed[0])) as reader:
+        reader.seek(FRAME_SIZE - 3)
+        assert reader.read(6) == CONTENT[FRAME_SIZE - 3:FRAME_SIZE + 3]
+        assert reader.tell() == FRAME_SIZE + 3
+        reader.seek(-10, 2)
+        assert reader.read() == CONTENT[-10:]
+        reader.seek(0)
+        assert reader.read() == CONTENT
+
+
+def test_reader_over_random_access_source(compressed):
+    with SeekableZstdReader(LocalFileReader(str(compressed[0]))) as reader:
+        assert reader.read_at(5000, 5000) == CONTENT[5000:10000]
+
+
+def test_empty_file(tmp_path):
+    src = tmp_path / "empty"
+    src.write_bytes(b"")
+    info = compress_file(str(src), str(tmp_path / "empty.zst"), FRAME_SIZE)
+    assert info["frames"] == 0
+    with SeekableZstdReader(str(tmp_path / "empty.zst")) as reader:
+        assert reader.size == 0
+        assert reader.read() == b""
+
+
+def test_verify_file(compressed):
+    path, info = compressed
+    assert verify_file(str(path), info["sha256"]) >= 0
+    with pytest.raises(SeekableFormatError, match="sha256"):
+        verify_file(str(path), "0" * 64)
+
+
+@pytest.mark.parametrize(
+    "mutate, message",
+    [
+        (lambda raw: raw[:-1] + b"\0", "footer"),
+        (lambda raw: raw[:10] + raw[11:], "does not match file size"),
+        (lambda raw: raw[:12], "too small"),
+    ],
+)
+def test_corrupt_seek_table(compressed, mutate, message):
+    path = compressed[0]
+    path.write_bytes(mutate(path.read_bytes()))
+    with pytest.raises(SeekableFormatError, match=message):
+        SeekableZstdReader(str(path))
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd CLI not installed")
+def test_plain_zstd_can_decompress(compressed):
+    result = subprocess.run(["zstd", "-dc", str(compressed[0])], capture_output=True, check=True)
+    assert result.stdout == CONTENT
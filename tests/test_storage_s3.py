@@ -0,0 +1,214 @@
+import os
+import random
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.core.readers import LocalFileReader
+from app.core.seekable_zstd import SeekableZstdReader, compress_file
+from app.core.storage_s3 import MIN_PART_SIZE, ReadThroughCache, S3Backend, S3ObjectReader
+
+BUCKET = "fcs-test"
+BLOCK = 1000
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def make_backend(client, tmp_path, cache_bytes=10 * 1024 * 1024, hot_reads=0) -> S3Backend:
+    return S3Backend(
+        client,
+        BUCKET,
+        "prefix/",
+        ReadThroughCache(str(tmp_path / "cache"), cache_bytes),
+        part_size=MIN_PART_SIZE,
+        concurrency=4,
+        read_block_size=BLOCK,
+        hot_reads=hot_reads,
+    )
+
+
+@pytest.fixture
+def backend(s3, tmp_path):
+    return make_backend(s3, tmp_path)
+
+
+def put(backend, tmp_path, key, data) -> None:
+    path = tmp_path / f"upload-{random.random()}"
+    path.write_bytes(data)
+    backend.put_file(str(path), key)
+
+
+def count_requests(client, operation) -> list:
+    calls = []
+    client.meta.events.register(f"provide-client-params.s3.{operation}", lambda **kwargs: calls.append(kwargs["params"]))
+    return calls
+
+
+def test_put_file_multipart(s3, tmp_path):
+    backend = make_backend(s3, tmp_path, cache_bytes=64 * 1024 * 1024)
+    data = random.Random(0).randbytes(2 * MIN_PART_SIZE + 123)
+    path = tmp_path / "big.fcs"
+    path.write_bytes(data)
+    backend.put_file(str(path), "blobs/ab/big.fcs")
+
+    head = s3.head_object(Bucket=BUCKET, Key="prefix/blobs/ab/big.fcs")
+    # multipart 上傳的 ETag 以 part 數結尾
+    assert head["ETag"].strip('"').endswith("-3")
+    assert head["ContentLength"] == len(data)
+    # 上傳後的暫存檔直接成為 cache 的副本
+    assert not path.exists()
+    assert open(backend.cache.get("blobs/ab/big.fcs"), "rb").read() == data
+
+
+def test_put_file_small_single_request(backend, s3, tmp_path):
+    put(backend, tmp_path, "a.fcs", b"small")
+    assert "-" not in s3.head_object(Bucket=BUCKET, Key="prefix/a.fcs")["ETag"]
+
+
+def test_stat_and_missing_keys(backend, tmp_path):
+    put(backend, tmp_path, "a.fcs", b"x" * 10)
+    st = backend.stat("a.fcs")
+    assert st.size == 10 and st.mtime > 0
+    assert backend.stat("missing.fcs") is None
+    with pytest.raises(FileNotFoundError):
+        backend.open("missing.fcs")
+    with pytest.raises(FileNotFoundError):
+        backend.local_path("missing.fcs")
+    # 不存在的物件刪除時不拋出例外
+    backend.remove("missing.fcs")
+
+
+def test_remove_deletes_object_and_cached_copy(backend, tmp_path):
+    put(backend, tmp_path, "a.fcs", b"x" * 10)
+    assert backend.cache.get("a.fcs")
+    backend.remove("a.fcs")
+    assert backend.stat("a.fcs") is None
+    assert backend.cache.get("a.fcs") is None
+
+
+def test_reader_of_deleted_object_raises_file_not_found(backend, s3, tmp_path):
+    put(backend, tmp_path, "a.fcs", b"x" * 10)
+    backend.cache.remove("a.fcs")
+    reader = backend.open("a.fcs")
+    s3.delete_object(Bucket=BUCKET, Key="prefix/a.fcs")
+    with pytest.raises(FileNotFoundError):
+        reader.read_at(0, 5)
+
+
+def test_ranged_reads_across_blocks(backend, s3, tmp_path):
+    data = random.Random(1).randbytes(10 * BLOCK + 17)
+    put(backend, tmp_path, "a.fcs", data)
+    backend.cache.remove("a.fcs")
+    gets = count_requests(s3, "GetObject")
+
+    with backend.open("a.fcs", size=len(data)) as reader:
+        assert isinstance(reader, S3ObjectReader)
+        # 同一個 block 內的讀取只發出一次 Range GET
+        assert reader.read_at(10, 20) == data[10:30]
+        assert reader.read_at(500, 400) == data[500:900]
+        assert len(gets) == 1
+        assert gets[0]["Range"] == f"bytes=0-{BLOCK - 1}"
+        # 跨越 block 邊界
+        assert reader.read_at(BLOCK - 5, 10) == data[BLOCK - 5:BLOCK + 5]
+        # 大於一個 block 的範圍直接取回
+        assert reader.read_at(BLOCK + 1, 3 * BLOCK) == data[BLOCK + 1:4 * BLOCK + 1]
+        assert reader.read_at(len(data) - 10, 100) == data[-10:]
+        assert reader.read_at(len(data), 10) == b""
+        reader.seek(0)
+        assert reader.read() == data
+
+
+def test_random_reads(backend, tmp_path):
+    data = random.Random(2).randbytes(8 * BLOCK)
+    put(backend, tmp_path, "a.fcs", data)
+    backend.cache.remove("a.fcs")
+    rng = random.Random(3)
+    with backend.open("a.fcs") as reader:
+        for _ in range(50):
+            offset, size = rng.randrange(len(data)), rng.randrange(1, 2 * BLOCK)
+            assert reader.read_at(offset, size) == data[offset:offset + size]
+
+
+def test_open_uses_cached_copy(backend, s3, tmp_path):
+    put(backend, tmp_path, "a.fcs", b"cached")
+    gets = count_requests(s3, "GetObject")
+    with backend.open("a.fcs") as reader:
+        assert isinstance(reader, LocalFileReader)
+        assert reader.read() == b"cached"
+    assert gets == []
+
+
+def test_local_path_read_through(backend, s3, tmp_path):
+    data = random.Random(4).randbytes(3 * BLOCK)
+    put(backend, tmp_path, "blobs/a.fcs", data)
+    backend.cache.remove("blobs/a.fcs")
+
+    path = backend.local_path("blobs/a.fcs")
+    assert path == backend.cache.path("blobs/a.fcs")
+    assert open(path, "rb").read() == data
+    # 第二次直接使用本機副本
+    heads = count_requests(s3, "HeadObject")
+    assert backend.local_path("blobs/a.fcs") == path
+    assert heads == []
+    assert not [name for name in os.listdir(backend.cache.root) if name.endswith(".part")]
+
+
+def test_cache_evicts_least_recently_used(s3, tmp_path):
+    backend = make_backend(s3, tmp_path, cache_bytes=2500)
+    for name in ("a", "b", "c"):
+        put(backend, tmp_path, name, name.encode() * 1000)
+        path = backend.cache.path(name)
+        # 明確設定使用時間，不依賴檔案系統的時間精度
+        os.utime(path, (1000 + ord(name), os.stat(path).st_mtime))
+    # put c 時超過容量，最舊的 a 被淘汰
+    assert backend.cache.get("a") is None
+    assert backend.cache.get("b") and backend.cache.get("c")
+
+    os.utime(backend.cache.path("b"), (3000, 0))
+    os.utime(backend.cache.path("c"), (2000, 0))
+    # 重新取回 a 時淘汰最久未使用的 c
+    assert open(backend.local_path("a"), "rb").read() == b"a" * 1000
+    assert backend.cache.get("c") is None
+    assert backend.cache.get("b")
+    # 淘汰的只是本機副本
+    assert backend.stat("c").size == 1000
+
+
+def test_hot_object_copied_to_cache(s3, tmp_path):
+    backend = make_backend(s3, tmp_path, hot_reads=2)
+    put(backend, tmp_path, "a.fcs", b"hot" * 100)
+    backend.cache.remove("a.fcs")
+    assert isinstance(backend.open("a.fcs"), S3ObjectReader)
+    assert isinstance(backend.open("a.fcs"), S3ObjectReader)
+    backend._background.shutdown(wait=True)
+    assert backend.cache.get("a.fcs")
+    assert isinstance(backend.open("a.fcs"), LocalFileReader)
+
+
+def test_seekable_zstd_over_s3_reader(backend, s3, tmp_path):
+    content = random.Random(5).randbytes(20000) + b"\0" * 30000
+    src = tmp_path / "a.fcs"
+    src.write_bytes(content)
+    compress_file(str(src), str(tmp_path / "a.fcs.zst"), frame_size=4096)
+    backend.put_file(str(tmp_path / "a.fcs.zst"), "blobs/a.fcs.zst")
+    backend.cache.remove("blobs/a.fcs.zst")
+
+    gets = count_requests(s3, "GetObject")
+    with SeekableZstdReader(backend.open("blobs/a.fcs.zst")) as reader:
+        assert reader.size == len(content)
+        assert reader.read_at(4000, 10000) == content[4000:14000]
+        assert reader.read_at(len(content) - 100, 200) == content[-100:]
+        reader.seek(0)
+        assert reader.read() == content
+    # 只以 Range GET 讀取需要的部分，沒有下載整個物件
+    assert gets and all("Range" in params for params in gets)
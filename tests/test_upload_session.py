@@ -0,0 +1,283 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.api import upload_session
+from app.api.fcs import FCSParseError
+from app.api.routers.file import MIN_CHUNK_SIZE
+from app.core.config import settings
+from fcs_factory import build_fcs
+
+CHUNK = MIN_CHUNK_SIZE
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def chunks_of(raw: bytes, size: int = CHUNK) -> list:
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def stream(*parts):
+    async def body():
+        for part in parts:
+            yield part
+
+    return body()
+
+
+def new_session(raw: bytes) -> dict:
+    return upload_session.create_session("a.fcs", len(raw), True, None, CHUNK)
+
+
+def write(meta, index, *parts) -> int:
+    return asyncio.run(upload_session.write_chunk(meta, index, stream(*parts)))
+
+
+def leftovers(meta) -> list:
+    return [name for name in os.listdir(upload_session.session_dir(meta["session_id"])) if name.endswith(".part")]
+
+
+def test_chunks_out_of_order(upload_dir):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    meta = new_session(raw)
+    assert meta["total_chunks"] == len(parts) == 3
+    assert upload_session.expected_chunk_size(meta, 2) == len(raw) - 2 * CHUNK
+
+    assert write(meta, 2, parts[2]) == len(parts[2])
+    assert upload_session.received_chunks(meta["session_id"]) == [2]
+    # 單一 chunk 可以分成多段串流
+    assert write(meta, 0, parts[0][:100], parts[0][100:]) == CHUNK
+    assert upload_session.received_chunks(meta["session_id"]) == [0, 2]
+    write(meta, 1, parts[1])
+    assert upload_session.received_chunks(meta["session_id"]) == [0, 1, 2]
+    assert b"".join(
+        open(upload_session.chunk_path(meta["session_id"], i), "rb").read() for i in range(3)
+    ) == raw
+    assert leftovers(meta) == []
+
+
+def test_duplicate_chunk_overwrites(upload_dir):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    meta = new_session(raw)
+    write(meta, 1, b"\0" * CHUNK)
+    write(meta, 1, parts[1])
+    assert upload_session.received_chunks(meta["session_id"]) == [1]
+    assert open(upload_session.chunk_path(meta["session_id"], 1), "rb").read() == parts[1]
+
+
+def test_chunk_size_mismatch_keeps_previous(upload_dir):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    meta = new_session(raw)
+    write(meta, 1, parts[1])
+    with pytest.raises(upload_session.ChunkSizeMismatch):
+        write(meta, 1, parts[1], b"x")
+    with pytest.raises(upload_session.ChunkSizeMismatch):
+        write(meta, 1, parts[1][:-1])
+    # 失敗的重送不影響已收到的 chunk，暫存檔也已清除
+    assert open(upload_session.chunk_path(meta["session_id"], 1), "rb").read() == parts[1]
+    assert leftovers(meta) == []
+
+
+def test_first_chunk_header_checked(upload_dir):
+    raw = build_fcs(events=60000)
+    meta = new_session(raw)
+    with pytest.raises(FCSParseError):
+        write(meta, 0, b"NOTFCS" + b"\0" * (CHUNK - 6))
+    assert upload_session.received_chunks(meta["session_id"]) == []
+
+
+def test_commit_lock(upload_dir):
+    meta = new_session(build_fcs(events=60000))
+    session_id = meta["session_id"]
+    assert upload_session.acquire_commit_lock(session_id)
+    assert not upload_session.acquire_commit_lock(session_id)
+    # lock 目錄不算在已收到的 chunk 中
+    assert upload_session.received_chunks(session_id) == []
+    upload_session.release_commit_lock(session_id)
+    assert upload_session.acquire_commit_lock(session_id)
+
+
+def test_commit_lock_race(upload_dir):
+    session_id = new_session(build_fcs(events=60000))["session_id"]
+    barrier = threading.Barrier(8, timeout=10)
+
+    def acquire():
+        barrier.wait()
+        return upload_session.acquire_commit_lock(session_id)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: acquire(), range(8)))
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_invalid_session_id(upload_dir):
+    with pytest.raises(upload_session.SessionNotFound):
+        upload_session.load_session("../etc")
+    with pytest.raises(upload_session.SessionNotFound):
+        upload_session.load_session("missing")
+
+
+def expire(meta) -> None:
+    path = os.path.join(upload_session.session_dir(meta["session_id"]), upload_session.SESSION_META)
+    with open(path, "w") as f:
+        json.dump({**meta, "expires_at": time.time() - 1}, f)
+
+
+def test_expired_session_not_found(upload_dir):
+    meta = new_session(build_fcs(events=60000))
+    expire(meta)
+    with pytest.raises(upload_session.SessionNotFound):
+        upload_session.load_session(meta["session_id"])
+
+
+def test_gc_expired_sessions(upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_SESSION_TTL_HOURS", 1)
+    raw = build_fcs(events=60000)
+    expired = new_session(raw)
+    write(expired, 1, chunks_of(raw)[1])
+    expire(expired)
+    active = new_session(raw)
+    # 沒有 metadata 的殘留目錄以 mtime 判斷
+    stale = os.path.join(upload_session.sessions_dir(), "stale")
+    fresh = os.path.join(upload_session.sessions_dir(), "fresh")
+    os.makedirs(stale)
+    os.makedirs(fresh)
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    assert upload_session.gc_expired_sessions() == 2
+    assert sorted(os.listdir(upload_session.sessions_dir())) == sorted([active["session_id"], "fresh"])
+    # 時間超過 TTL 後其餘的也一併回收
+    assert upload_session.gc_expired_sessions(time.time() + 7200) == 2
+    assert os.listdir(upload_session.sessions_dir()) == []
+
+
+def create(client, raw, headers=None, **extra):
+    body = {"filename": "a.fcs", "size_bytes": len(raw), "chunk_size": CHUNK, **extra}
+    r = client.post("/files/sessions", json=body, headers=headers or {})
+    assert r.status_code == 200
+    return r.json()
+
+
+def put_chunk(client, session_id, index, data, headers=None):
+    return client.put(f"/files/sessions/{session_id}/chunks/{index}", content=data, headers=headers or {})
+
+
+def status(client, session_id, headers=None):
+    return client.get(f"/files/sessions/{session_id}", headers=headers or {})
+
+
+def commit(client, session_id, headers=None):
+    return client.post(f"/files/sessions/{session_id}/commit", headers=headers or {})
+
+
+def test_session_upload_out_of_order(client):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    session = create(client, raw)
+    session_id = session["session_id"]
+    assert session["total_chunks"] == 3
+    assert session["received"] == [] and session["missing"] == [0, 1, 2]
+
+    assert put_chunk(client, session_id, 2, parts[2]).json() == {"index": 2, "size": len(parts[2])}
+    assert put_chunk(client, session_id, 0, parts[0]).status_code == 200
+    # 重送同一個 chunk
+    assert put_chunk(client, session_id, 0, parts[0]).status_code == 200
+    r = status(client, session_id).json()
+    assert r["received"] == [0, 2] and r["missing"] == [1]
+
+    assert put_chunk(client, session_id, 1, parts[1]).status_code == 200
+    assert status(client, session_id).json()["missing"] == []
+    r = commit(client, session_id)
+    assert r.status_code == 200
+    assert r.json()["size"] == len(raw)
+    assert client.get(r.json()["short_link"]).content == raw
+    # commit 後 session 已刪除
+    assert status(client, session_id).status_code == 404
+    assert commit(client, session_id).status_code == 404
+
+
+def test_session_chunk_validation(client):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    session_id = create(client, raw)["session_id"]
+    assert put_chunk(client, session_id, 3, parts[2]).status_code == 400
+    r = put_chunk(client, session_id, 1, parts[1][:-1])
+    assert r.status_code == 400
+    assert "must be" in r.json()["detail"]
+    assert put_chunk(client, session_id, 0, b"NOTFCS" + parts[0][6:]).status_code == 400
+    assert status(client, session_id).json()["received"] == []
+
+
+def test_commit_with_missing_chunk(client):
+    raw = build_fcs(events=60000)
+    parts = chunks_of(raw)
+    session_id = create(client, raw)["session_id"]
+    put_chunk(client, session_id, 0, parts[0])
+    put_chunk(client, session_id, 2, parts[2])
+    r = commit(client, session_id)
+    assert r.status_code == 409
+    assert r.json()["detail"] == {"message": "Missing chunks", "missing": [1]}
+    # 補上缺少的 chunk 後可以 commit
+    put_chunk(client, session_id, 1, parts[1])
+    assert commit(client, session_id).status_code == 200
+
+
+def test_concurrent_commit_rejected(client):
+    raw = build_fcs(events=60000)
+    session_id = create(client, raw)["session_id"]
+    for index, part in enumerate(chunks_of(raw)):
+        put_chunk(client, session_id, index, part)
+    # 另一個 request 正在組裝同一個 session
+    assert upload_session.acquire_commit_lock(session_id)
+    r = commit(client, session_id)
+    assert r.status_code == 409
+    assert r.json()["detail"] == "Upload session is already being committed"
+    assert status(client, session_id).json()["missing"] == []
+
+    upload_session.release_commit_lock(session_id)
+    assert commit(client, session_id).status_code == 200
+
+
+def test_failed_commit_releases_lock(client):
+    raw = build_fcs(events=60000)
+    session_id = create(client, raw)["session_id"]
+    parts = chunks_of(raw)
+    for index, part in enumerate(parts):
+        put_chunk(client, session_id, index, part)
+    # 組裝後的檔案不是合法的 FCS（直接覆寫磁碟上的第一個 chunk）
+    with open(upload_session.chunk_path(session_id, 0), "r+b") as f:
+        f.write(b"NOTFCS")
+    assert commit(client, session_id).status_code == 400
+    assert upload_session.acquire_commit_lock(session_id)
+
+
+def test_session_owned_by_creator(client, register):
+    raw = build_fcs(events=60000)
+    headers = register()
+    session_id = create(client, raw, headers)["session_id"]
+    # 其他使用者（或匿名）看不到這個 session
+    assert status(client, session_id).status_code == 404
+    assert put_chunk(client, session_id, 0, chunks_of(raw)[0]).status_code == 404
+    assert status(client, session_id, register("other@example.com")).status_code == 404
+    assert status(client, session_id, headers).status_code == 200
+
+
+def test_abort_session(client):
+    raw = build_fcs(events=60000)
+    session_id = create(client, raw)["session_id"]
+    put_chunk(client, session_id, 0, chunks_of(raw)[0])
+    assert client.delete(f"/files/sessions/{session_id}").status_code == 200
+    assert not os.path.exists(upload_session.session_dir(session_id))
+    assert status(client, session_id).status_code == 404
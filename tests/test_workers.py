@@ -0,0 +1,202 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from sqlalchemy import delete, event, select, update
+
+from app.core.config import settings
+from app.core.storage import compressed_key, stored_path
+from app.db.crud import delete_file, get_file_with_channels
+from app.db.models import FileChannel, FileInfo
+from app.workers import worker
+from fcs_factory import build_fcs
+
+
+@pytest.fixture
+def checked_out(test_db):
+    """目前借出的連線數"""
+    connections = []
+    event.listen(test_db.engine.sync_engine, "checkout", lambda *args: connections.append(1))
+    event.listen(test_db.engine.sync_engine, "checkin", lambda *args: connections.pop())
+    return connections
+
+
+def upload(client, test_db, raw: bytes, name: str = "a.fcs") -> int:
+    r = client.post("/files/upload", files={"file": (name, raw)})
+    assert r.status_code == 200
+    slug = r.json()["short_link"].rsplit("/", 1)[-1]
+
+    async def file_id():
+        async with test_db.session() as db:
+            return (await db.execute(select(FileInfo.id).where(FileInfo.slug == slug))).scalar_one()
+
+    return asyncio.run(file_id())
+
+
+def load_file(test_db, file_id: int):
+    async def load():
+        async with test_db.session() as db:
+            return await get_file_with_channels(db, file_id)
+
+    return asyncio.run(load())
+
+
+def test_file_stats_without_holding_connection(client, test_db, checked_out, monkeypatch):
+    file_id = upload(client, test_db, build_fcs(events=1000))
+    observed = []
+    original = worker._channel_stats_for
+
+    def channel_stats_for(f):
+        observed.append(len(checked_out))
+        return original(f)
+
+    monkeypatch.setattr(worker, "_channel_stats_for", channel_stats_for)
+    assert asyncio.run(worker._compute_file_stats(file_id))
+    assert observed == [0]
+
+    f = load_file(test_db, file_id)
+    assert f.channel_stats_at is not None
+    assert [c.stat_count for c in f.channels] == [1000, 1000, 1000]
+    assert f.channels[0].stat_min == 0.0 and f.channels[0].stat_max == 999.0
+    # 已計算過的檔案不再重算
+    assert not asyncio.run(worker._compute_file_stats(file_id))
+
+
+def test_file_stats_reuses_sibling_results(client, test_db, monkeypatch):
+    raw = build_fcs(events=200)
+    first = upload(client, test_db, raw)
+    assert asyncio.run(worker._compute_file_stats(first))
+    second = upload(client, test_db, raw, name="b.fcs")
+
+    def fail(f):
+        raise AssertionError("sibling stats should be reused")
+
+    monkeypatch.setattr(worker, "_channel_stats_for", fail)
+    assert asyncio.run(worker._compute_file_stats(second))
+    assert [c.stat_mean for c in load_file(test_db, second).channels] == [
+        c.stat_mean for c in load_file(test_db, first).channels
+    ]
+
+
+def test_file_stats_fills_missing_metadata(client, test_db):
+    file_id = upload(client, test_db, build_fcs(events=50))
+
+    async def forget_metadata():
+        async with test_db.session() as db:
+            await db.execute(delete(FileChannel).where(FileChannel.file_id == file_id))
+            await db.execute(update(FileInfo).where(FileInfo.id == file_id).values(metadata_parsed_at=None))
+            await db.commit()
+
+    asyncio.run(forget_metadata())
+    assert asyncio.run(worker._compute_file_stats(file_id))
+    f = load_file(test_db, file_id)
+    assert f.metadata_parsed_at is not None
+    assert [c.pnn for c in f.channels] == ["FSC-A", "SSC-A", "CD4"]
+    assert [c.stat_count for c in f.channels] == [50, 50, 50]
+
+
+def test_file_deleted_while_computing_stats(client, test_db, monkeypatch):
+    file_id = upload(client, test_db, build_fcs(events=50))
+    original = worker._channel_stats_for
+
+    def channel_stats_for(f):
+        result = original(f)
+
+        async def remove():
+            async with test_db.session() as db:
+                await db.execute(delete(FileInfo).where(FileInfo.id == file_id))
+                await db.commit()
+
+        asyncio.run(remove())
+        return result
+
+    monkeypatch.setattr(worker, "_channel_stats_for", channel_stats_for)
+    assert not asyncio.run(worker._compute_file_stats(file_id))
+
+
+@pytest.fixture
+def compression(monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION_FRAME_KB", 16)
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION_MIN_RATIO", 1.1)
+
+
+def blob_of(test_db, file_id: int):
+    return load_file(test_db, file_id).blob
+
+
+def compressible_fcs(events: int = 20000) -> bytes:
+    return build_fcs(names=("FSC-A", "SSC-A", "CD4", "CD8"), events=events)
+
+
+def test_compress_blob_without_holding_connection(client, test_db, checked_out, compression, monkeypatch):
+    raw = compressible_fcs()
+    file_id = upload(client, test_db, raw)
+    blob = blob_of(test_db, file_id)
+    observed = []
+    original = worker._compress_blob_file
+
+    def compress_blob_file(b):
+        observed.append(len(checked_out))
+        return original(b)
+
+    monkeypatch.setattr(worker, "_compress_blob_file", compress_blob_file)
+    assert asyncio.run(worker._compress_blob(blob.id))
+    assert observed == [0]
+
+    blob = blob_of(test_db, file_id)
+    assert blob.compression == "zstd-seekable"
+    assert blob.stored_size_bytes < len(raw)
+    assert not os.path.exists(stored_path(blob.stored_filename))
+    assert os.path.exists(stored_path(compressed_key(blob.stored_filename)))
+    # 已壓縮的 blob 不再處理，下載內容不變
+    assert not asyncio.run(worker._compress_blob(blob.id))
+    slug = load_file(test_db, file_id).slug
+    assert client.get(f"/files/{slug}").content == raw
+
+
+def test_concurrent_compression_of_same_blob(client, test_db, compression, monkeypatch):
+    raw = compressible_fcs(events=30000)
+    file_id = upload(client, test_db, raw)
+    blob = blob_of(test_db, file_id)
+    # 兩個任務同時進入壓縮，各自使用不同的暫存檔
+    barrier = threading.Barrier(2, timeout=10)
+    temp_paths = []
+    compress_file = worker.compress_file
+
+    def record_compress_file(src, dst, *args):
+        temp_paths.append(dst)
+        barrier.wait()
+        return compress_file(src, dst, *args)
+
+    monkeypatch.setattr(worker, "compress_file", record_compress_file)
+
+    async def run_both():
+        return await asyncio.gather(worker._compress_blob(blob.id), worker._compress_blob(blob.id))
+
+    assert sorted(asyncio.run(run_both())) == [False, True]
+    assert len(set(temp_paths)) == 2
+    assert not [name for name in os.listdir(settings.UPLOAD_DIR) if name.startswith(".compress-")]
+    assert blob_of(test_db, file_id).compression == "zstd-seekable"
+    assert client.get(f"/files/{load_file(test_db, file_id).slug}").content == raw
+
+
+def test_compression_dropped_when_blob_deleted(client, test_db, compression, monkeypatch):
+    file_id = upload(client, test_db, compressible_fcs(events=5000))
+    blob = blob_of(test_db, file_id)
+    original = worker._compress_blob_file
+
+    async def remove():
+        async with test_db.session() as db:
+            await delete_file(db, await get_file_with_channels(db, file_id))
+
+    def compress_then_delete(b):
+        values = original(b)
+        # 壓縮期間最後一個檔案被刪除
+        asyncio.run(remove())
+        return values
+
+    monkeypatch.setattr(worker, "_compress_blob_file", compress_then_delete)
+    assert not asyncio.run(worker._compress_blob(blob.id))
+    assert not os.path.exists(stored_path(blob.stored_filename))
+    assert not os.path.exists(stored_path(compressed_key(blob.stored_filename)))